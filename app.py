@@ -1,11 +1,8 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import pytz
+import os
 from pathlib import Path
+from startup import BackgroundTask
 
 # Configuration de la page
 st.set_page_config(
@@ -15,7 +12,101 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Intervalle de vérification des fichiers de données (secondes)
+DATA_WATCH_INTERVAL = 5.0
+
+# Précalcul de la grille d'impact : nombre de workers (0 = désactivé)
+IMPACT_WARMUP_WORKERS = int(os.environ.get("MOE_IMPACT_WORKERS", 2))
+
+# Fenêtres d'impact précalculées en plus des fenêtres standard
+IMPACT_CUSTOM_WINDOWS = {"0-72h": (0, 72)}
+
+# Suivi des émargements : export suivi (par défaut le fichier d'inscriptions)
+# et intervalle de rafraîchissement en direct (secondes)
+CHECKIN_CSV = os.environ.get("MOE_CHECKIN_CSV")
+CHECKIN_REFRESH_SECONDS = 10
+
+# Jour de la course pour la projection des inscriptions (AAAA-MM-JJ) ;
+# par défaut, déduit des dates d'émargement
+RACE_DATE = os.environ.get("MOE_RACE_DATE")
+
+# Répertoire des données partagées entre processus (fichiers projetés en
+# mémoire) ; vide = chaque processus charge sa propre copie
+SHARED_STORE_DIR = os.environ.get("MOE_SHARED_STORE")
+
+# Flux d'événements d'inscription : fichier JSON lines ou « unix:/chemin/socket »
+# (vide = export CSV seul) et cadence des micro-lots (secondes)
+EVENTS_SOURCE = os.environ.get("MOE_EVENTS")
+EVENTS_BATCH_SECONDS = float(os.environ.get("MOE_EVENTS_BATCH_SECONDS", 2.0))
+
+# Contours des départements pour la carte : URL ou fichier GeoJSON local
+# (vide par défaut = barres, sans accès réseau)
+GEOJSON_URL = os.environ.get("MOE_GEOJSON_URL", "")
+
+# Démarrage en deux temps : la page de connexion ne dépend que de Streamlit,
+# la pile d'analyse est importée et les données chargées en arrière-plan
+# pendant la saisie des identifiants
+def start_analytics():
+    """Importe les modules d'analyse et lance la surveillance des données"""
+    import plotly.express  # noqa: F401 (préchargement)
+    import charts  # noqa: F401 (préchargement)
+    import impact  # noqa: F401 (préchargement)
+    from data import INSTAGRAM_CSV, REG_CSV, load_dataset
+    from data_watcher import DataWatcher
+
+    # Plusieurs processus : colonnes écrites une fois puis projetées en mémoire
+    if SHARED_STORE_DIR:
+        from shared_store import SharedStore, load_shared_dataset
+        store = SharedStore(SHARED_STORE_DIR)
+        load = lambda **kwargs: load_shared_dataset(store, INSTAGRAM_CSV, REG_CSV, **kwargs)
+    else:
+        load = lambda **kwargs: load_dataset(INSTAGRAM_CSV, REG_CSV, **kwargs)
+
+    # Chaque rechargement reçoit la version précédente (index prolongés)
+    watcher = DataWatcher(
+        (INSTAGRAM_CSV, REG_CSV),
+        lambda: load(
+            race_date=RACE_DATE,
+            previous=watcher.current().data if watcher.current() else None
+        ),
+        interval=DATA_WATCH_INTERVAL
+    )
+    watcher.start()
+
+    # Inscriptions en direct depuis un flux d'événements local (micro-lots)
+    ingestor = None
+    if EVENTS_SOURCE:
+        from events import EventIngestor, source_from_spec
+        try:
+            ingestor = EventIngestor(watcher, source_from_spec(EVENTS_SOURCE), interval=EVENTS_BATCH_SECONDS).start()
+        except Exception:
+            # Démarrage relancé au rerun suivant : pas de surveillance orpheline
+            watcher.stop()
+            raise
+    return watcher, ingestor
+
+@st.cache_resource
+def analytics_warmup():
+    """Démarrage de la pile d'analyse, une fois par processus"""
+    return BackgroundTask(start_analytics, name='analytics-warmup')
+
+analytics_warmup()
+
 # Système d'authentification
+@st.cache_resource
+def load_credentials():
+    """Identifiants depuis secrets.toml à la racine (lu une fois par processus) ou valeurs par défaut"""
+    try:
+        import toml
+        secrets = toml.load("secrets.toml")
+        return (
+            secrets.get("auth", {}).get("username", "admin"),
+            secrets.get("auth", {}).get("password", "AdminMOE13")
+        )
+    except (FileNotFoundError, ImportError):
+        # Valeurs par défaut si le fichier secrets.toml n'existe pas
+        return "admin", "AdminMOE13"
+
 def check_login():
     """Vérifie si l'utilisateur est connecté"""
     return st.session_state.get('authenticated', False)
@@ -37,16 +128,7 @@ def login_page():
                 submit_button = st.form_submit_button("Se connecter", use_container_width=True)
                 
                 if submit_button:
-                    # Récupération des identifiants depuis secrets.toml à la racine ou valeurs par défaut
-                    try:
-                        import toml
-                        secrets = toml.load("secrets.toml")
-                        admin_user = secrets.get("auth", {}).get("username", "admin")
-                        admin_pass = secrets.get("auth", {}).get("password", "AdminMOE13")
-                    except (FileNotFoundError, ImportError):
-                        # Valeurs par défaut si le fichier secrets.toml n'existe pas
-                        admin_user = "admin"
-                        admin_pass = "AdminMOE13"
+                    admin_user, admin_pass = load_credentials()
                     
                     if username == admin_user and password == admin_pass:
                         st.session_state['authenticated'] = True
@@ -68,13 +150,35 @@ if not check_login():
     login_page()
     st.stop()
 
+# Pile d'analyse (déjà importée par analytics_warmup dans la plupart des cas)
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import pytz
+from charts import MODEBAR, FigureCache, line_trace
+from checkin import CheckinTail
+from data import INSTA_NUMERIC_COLUMNS, REG_CSV
+from dedup import duplicate_groups, unique_runner_stats
+from events import split_version
+from export import CHUNK_ROWS as EXPORT_CHUNK_ROWS, PARQUET_AVAILABLE, BundleCache
+from forecast import ForecastCache
+from geo import LEVELS as GEO_LEVELS, load_departements_geojson, region_counts
+from pricing import NO_PROMO, FunnelRollup
+from query import AGGREGATIONS, QueryEngine, result_column
+from scoring import GROUPS as SCORE_GROUPS, RATIOS as SCORE_RATIOS, ScoreBoard, score_posts
+from timeslots import (
+    HEURES, JOURS, NO_COUNTDOWN, TIME_DIMENSIONS, best_slots, day_code, period_counts, time_labels,
+    weekday_hour_grid
+)
+from impact import (
+    ATTRIBUTION_KERNELS, IMPACT_WINDOWS, AttributionCache, ImpactPrecompute, attribution_table, compute_impact,
+    registration_subset
+)
+
 # Configuration locale
 TIMEZONE = pytz.timezone('Europe/Paris')
 
-# Chemins des fichiers (à la racine du projet)
-INSTAGRAM_CSV = "insta_data.csv"
-REG_CSV = "data_registration_moe.csv"
-
 # Fonctions utilitaires
 def format_number(n):
     """Formate les nombres avec séparateur de milliers"""
@@ -84,6 +188,13 @@ def format_percent(n):
     """Formate les pourcentages"""
     return f"{n:.1f}%"
 
+def format_duration(minutes):
+    """Formate une durée en minutes (« 1 h 05 min »), tiret si inconnue"""
+    if not np.isfinite(minutes):
+        return "—"
+    hours, mins = divmod(int(round(minutes)), 60)
+    return f"{hours} h {mins:02d} min" if hours else f"{mins} min"
+
 def mask_email(email):
     """Masque les emails pour la protection des données"""
     if pd.isna(email):
@@ -104,51 +215,473 @@ def mask_phone(phone):
         return phone
     return phone[:2] + '•' * (len(phone) - 4) + phone[-2:]
 
-# Chargement des données
-@st.cache_data
-def load_data():
+def mask_name(name):
+    """Masque les noms et prénoms (initiale seule)"""
+    if pd.isna(name):
+        return name
+    return name[:1] + '•' * (len(str(name)) - 1)
+
+# Colonnes de l'extrait des inscriptions (Explorer et export), après masquage
+EXPLORER_COLUMNS = [
+    'parcours', 'tarif', 'is_paid', 'has_licence', 'is_handisport',
+    'DATE INSCRIPTION', 'CIVILITE', 'nom_masked', 'prenom_masked', 'email_masked',
+    'telephone_masked', 'VILLE', 'departement_nom', 'CLUB', 'PAIEMENT', 'CODE PROMO'
+]
+
+# Colonnes de l'extrait des posts (Explorer et export)
+POST_COLUMNS = ['date', 'Type', 'Titre', 'Contenue', 'Periode', 'Vues', 'Likes', 'Commentaires', 'Partage', 'hashtags']
+
+def masked_registrations(df):
+    """Copie des inscriptions avec les colonnes de données personnelles masquées"""
+    df_display = df.copy()
+    for column, masked, mask in [
+        ('NOM', 'nom_masked', mask_name),
+        ('PRENOM', 'prenom_masked', mask_name),
+        ('EMAIL', 'email_masked', mask_email),
+        ('TELEPHONE', 'telephone_masked', mask_phone),
+    ]:
+        if column in df.columns:
+            df_display[masked] = df[column].map(mask)
+    return df_display
+
+def masked_extract_chunks(df, chunk_rows):
+    """Extrait masqué des inscriptions, par blocs (seules les lignes du bloc sont copiées)"""
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = masked_registrations(df.iloc[start:start + chunk_rows])
+        yield chunk[[c for c in EXPLORER_COLUMNS if c in chunk.columns]]
+
+# Cache des figures sérialisées, partagé entre toutes les sessions du processus
+FIGURE_CACHE_MAX_MB = 64
+
+@st.cache_resource
+def figure_cache():
+    """Instance unique du cache LRU de figures"""
+    return FigureCache(max_bytes=FIGURE_CACHE_MAX_MB * 1024 * 1024)
+
+def cached_figure(key, build):
+    """Figure sérialisée pour (version des données, clé) ; `build()` n'est appelé qu'en cas d'absence"""
+    return figure_cache().get_or_build((DATA_VERSION,) + key, build)
+
+# Projections des inscriptions, partagées entre toutes les sessions
+PROJECTION_COLORS = ['#00CC96', '#AB63FA', '#FFA15A', '#19D3F3']
+
+@st.cache_resource
+def forecast_cache():
+    """Modèles de projection ajustés et projections calculées"""
+    return ForecastCache()
+
+# Requêtes groupées de l'onglet Charts, partagées entre toutes les sessions
+@st.cache_resource
+def query_engine():
+    """Moteur de requêtes mémorisées"""
+    return QueryEngine()
+
+# Construction des graphiques
+def overview_figure(selected_metric, agg_type, daily_reg, daily_insta, projection=None):
+    """Graphique double axe inscriptions × métrique Instagram
+
+    `projection` (Forecast) ajoute sur un troisième axe le cumul des
+    inscriptions par parcours et sa projection jusqu'au jour de la course.
+    """
+    fig = go.Figure()
+
+    # Courbe des inscriptions
+    fig.add_trace(
+        line_trace(
+            daily_reg['date'],
+            daily_reg['inscriptions'],
+            name="Inscriptions",
+            line=dict(color='#FF4B4B', width=3),
+            yaxis='y',
+            hovertemplate="<b>%{x|%d/%m/%Y}</b><br>Inscriptions: %{y:.0f}<extra></extra>"
+        )
+    )
+
+    # Courbe de la métrique Instagram
+    fig.add_trace(
+        line_trace(
+            daily_insta['date'],
+            daily_insta[selected_metric],
+            name=selected_metric,
+            line=dict(color='#636EFA', width=3),
+            yaxis='y2',
+            hovertemplate=f"<b>%{{x|%d/%m/%Y}}</b><br>{selected_metric}: %{{y:.0f}}<extra></extra>"
+        )
+    )
+
+    # Cumul observé et projeté par parcours
+    if projection is not None:
+        for i, parcours in enumerate(projection.parcours):
+            color = PROJECTION_COLORS[i % len(PROJECTION_COLORS)]
+            label = f"{int(parcours)}K"
+            fig.add_trace(line_trace(
+                projection.observed.index,
+                projection.observed[parcours],
+                name=f"Cumul {label}",
+                line=dict(color=color, width=1.5),
+                yaxis='y3',
+                hovertemplate=f"<b>%{{x|%d/%m/%Y}}</b><br>Cumul {label}: %{{y:.0f}}<extra></extra>"
+            ))
+            fig.add_trace(go.Scatter(
+                x=np.concatenate([projection.dates, projection.dates[::-1]]),
+                y=np.concatenate([projection.high[:, i], projection.low[::-1, i]]),
+                fill='toself',
+                fillcolor=color,
+                opacity=0.15,
+                line=dict(width=0),
+                yaxis='y3',
+                hoverinfo='skip',
+                showlegend=False
+            ))
+            fig.add_trace(go.Scatter(
+                x=projection.dates,
+                y=projection.median[:, i],
+                name=f"Projection {label}",
+                line=dict(color=color, width=2, dash='dash'),
+                yaxis='y3',
+                customdata=np.stack([projection.low[:, i], projection.high[:, i]], axis=-1),
+                hovertemplate=(
+                    f"<b>%{{x|%d/%m/%Y}}</b><br>Projection {label}: %{{y:.0f}}"
+                    "<br>Intervalle 90 % : %{customdata[0]:.0f} – %{customdata[1]:.0f}<extra></extra>"
+                )
+            ))
+
+    # Mise en page
+    fig.update_layout(
+        title=dict(
+            text=f"Évolution des inscriptions et {selected_metric.lower()} ({agg_type.lower()})",
+            font=dict(size=20)
+        ),
+        xaxis=dict(
+            title="Date",
+            tickformat='%d/%m/%Y',
+            showgrid=True,
+            gridcolor='rgba(128, 128, 128, 0.2)'
+        ),
+        yaxis=dict(
+            title=dict(text="Nombre d'inscriptions", font=dict(color='#FF4B4B')),
+            tickfont=dict(color='#FF4B4B'),
+            showgrid=True,
+            gridcolor='rgba(255, 75, 75, 0.1)'
+        ),
+        yaxis2=dict(
+            title=dict(text=selected_metric, font=dict(color='#636EFA')),
+            tickfont=dict(color='#636EFA'),
+            overlaying='y',
+            side='right',
+            showgrid=False
+        ),
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        ),
+        template="plotly_white",
+        height=500,
+        hovermode='x unified',
+        # Ajout des boutons de téléchargement
+        modebar=MODEBAR
+    )
+    if projection is not None:
+        fig.update_layout(
+            yaxis3=dict(
+                title=dict(text="Cumul des inscriptions"),
+                overlaying='y',
+                side='left',
+                anchor='free',
+                autoshift=True,
+                showgrid=False,
+                rangemode='tozero'
+            )
+        )
+    return fig
+
+def evolution_figure(time_granularity, evolution_data):
+    """Évolution des inscriptions par parcours, une trace par parcours"""
+    fig = go.Figure()
+    for parcours, group in evolution_data.groupby('parcours', sort=True):
+        fig.add_trace(line_trace(group['periode'], group['inscriptions'], name=parcours))
+
+    fig.update_layout(
+        title=f"Évolution des inscriptions par {time_granularity.lower()}",
+        legend_title_text='parcours',
+        template="plotly_dark",
+        xaxis_title=time_granularity,
+        yaxis_title="Nombre d'inscriptions",
+        height=400,
+        modebar=MODEBAR
+    )
+    if time_granularity == "Jours avant course":
+        # Compte à rebours : le jour de la course à droite
+        fig.update_xaxes(autorange='reversed', title="Jours avant la course")
+    return fig
+
+def sell_through_figure(data, column, title, yaxis_title):
+    """Courbes de vente par tarif, une trace par tarif"""
+    fig = go.Figure()
+    for tarif, group in data.groupby('tarif', sort=True):
+        fig.add_trace(line_trace(group['date'], group[column], name=tarif))
+
+    fig.update_layout(
+        title=title,
+        legend_title_text='tarif',
+        template="plotly_dark",
+        xaxis_title="Date",
+        yaxis_title=yaxis_title,
+        height=400,
+        modebar=MODEBAR
+    )
+    return fig
+
+def pie_figure(data, values, names, title, hole=0.4):
+    """Camembert (template clair)"""
+    fig = px.pie(
+        data,
+        values=values,
+        names=names,
+        title=title,
+        hole=hole,
+        template="plotly_white"
+    )
+    fig.update_layout(modebar=MODEBAR)
+    return fig
+
+def custom_figure(chart_type, data, metric, dimension, metric_label, dimension_label,
+                  color=None, color_label=None):
+    """Graphique personnalisable de l'onglet Charts (barres, lignes, camembert ou carte de chaleur)
+
+    `color` : deuxième dimension éventuelle (une couleur par valeur).
+    """
+    if color is not None and not isinstance(data[color].dtype, pd.CategoricalDtype):
+        data = data.astype({color: str})
+    if chart_type == 'bar':
+        fig = px.bar(
+            data,
+            x=dimension,
+            y=metric,
+            color=color,
+            barmode='group',
+            labels={color: color_label} if color else None,
+            title=f"{metric_label} par {dimension_label.lower()}" + (f" et {color_label.lower()}" if color else ""),
+            template="plotly_white"
+        )
+    elif chart_type == 'line':
+        fig = px.line(
+            data,
+            x=dimension,
+            y=metric,
+            color=color,
+            labels={color: color_label} if color else None,
+            title=f"Évolution {metric_label.lower()}",
+            template="plotly_white"
+        )
+    elif chart_type == 'heatmap':
+        grid = data.pivot(index=color, columns=dimension, values=metric)
+        fig = px.imshow(
+            grid,
+            color_continuous_scale='Reds',
+            aspect='auto',
+            labels=dict(x=dimension_label, y=color_label, color=metric_label),
+            title=f"{metric_label} par {dimension_label.lower()} et {color_label.lower()}",
+            template="plotly_white"
+        )
+        fig.update_layout(height=500, modebar=MODEBAR)
+        return fig
+    else:  # pie
+        fig = px.pie(
+            data,
+            values=metric,
+            names=dimension,
+            title=f"Répartition {metric_label.lower()}",
+            template="plotly_white"
+        )
+
+    # Mise en page
+    fig.update_layout(
+        xaxis_title=dimension_label,
+        yaxis_title=metric_label,
+        height=500,
+        modebar=MODEBAR
+    )
+    return fig
+
+def slot_heatmap_figure(grid, title, label, value_format=".0f"):
+    """Carte de chaleur jour de la semaine × heure"""
+    fig = px.imshow(
+        grid,
+        x=HEURES,
+        y=JOURS,
+        color_continuous_scale='Reds',
+        aspect='auto',
+        labels=dict(x="Heure", y="Jour", color=label),
+        title=title
+    )
+    fig.update_traces(hovertemplate=f"%{{y}} %{{x}}<br>{label} : %{{z:{value_format}}}<extra></extra>")
+    fig.update_layout(height=400, template="plotly_white", modebar=MODEBAR)
+    return fig
+
+def bar_figure(data, x, y, title, xaxis_title, yaxis_title, text=None, template="plotly_white", height=400):
+    """Diagramme en barres"""
+    fig = px.bar(
+        data,
+        x=x,
+        y=y,
+        title=title,
+        text=text,
+        template=template
+    )
+    fig.update_layout(
+        xaxis_title=xaxis_title,
+        yaxis_title=yaxis_title,
+        height=height,
+        modebar=MODEBAR
+    )
+    return fig
+
+@st.cache_resource
+def departements_geojson():
+    """Contours des départements, lus une fois par processus (None sans MOE_GEOJSON_URL)"""
+    return load_departements_geojson(GEOJSON_URL) if GEOJSON_URL else None
+
+def geo_figure(level, data, geojson=None):
+    """Carte choroplèthe des inscriptions (barres si les contours sont indisponibles)"""
+    if level == 'departement' and geojson is not None:
+        fig = px.choropleth(
+            data,
+            geojson=geojson,
+            locations='code',
+            featureidkey='properties.code',
+            color='inscriptions',
+            hover_name='nom',
+            color_continuous_scale='Blues',
+            title="Inscriptions par département"
+        )
+        fig.update_geos(fitbounds='locations', visible=False)
+    elif level == 'pays':
+        fig = px.choropleth(
+            data.dropna(subset=['code']),
+            locations='code',
+            color='inscriptions',
+            hover_name='nom',
+            color_continuous_scale='Blues',
+            projection='natural earth',
+            title="Inscriptions par pays"
+        )
+    else:
+        top = data.head(20)
+        fig = px.bar(top, x='nom', y='inscriptions', title="Inscriptions par département (top 20)")
+        fig.update_layout(xaxis_title="Département", yaxis_title="Inscriptions")
+    fig.update_layout(height=500, margin=dict(l=0, r=0, t=50, b=0), modebar=MODEBAR)
+    return fig
+
+# Chargement des données : un thread par processus surveille les fichiers
+# CSV et publie chaque nouvelle version une fois entièrement construite
+def analytics_stack():
+    """(watcher, ingestor) du processus ; un démarrage en échec est oublié
+    afin d'être relancé au rerun suivant"""
     try:
-        # Lecture des données Instagram
-        df_insta = pd.read_csv(INSTAGRAM_CSV, sep=';')
-        
-        # Conversion des dates Instagram
-        df_insta['date'] = pd.to_datetime(df_insta['Date']).dt.date
-        df_insta['timestamp'] = pd.to_datetime(df_insta['Date'] + ' ' + df_insta['Heure'].fillna('12:00'))
-        
-        # Lecture des données d'inscription
-        df_reg = pd.read_csv(REG_CSV, sep=';')
-        
-        # Conversion des dates d'inscription
-        df_reg['date'] = pd.to_datetime(df_reg['DATE INSCRIPTION']).dt.date
-        df_reg['timestamp'] = pd.to_datetime(df_reg['DATE INSCRIPTION'])
-        
-        # Extraction du parcours (5, 12 ou 21)
-        df_reg['parcours'] = df_reg['PARCOURS'].str.extract(r'(\d+)').astype(float)
-        
-        # Flags
-        df_reg['is_paid'] = df_reg['PAIEMENT'].str.upper().isin(['PAYE', 'OK', 'VALIDÉ', 'OUI', '1', 'TRUE'])
-        df_reg['has_licence'] = df_reg['FEDERATION'].notna() | df_reg['Numéro de licence'].notna()
-        df_reg['is_handisport'] = df_reg['HANDISPORT'].str.upper().isin(['OUI', '1', 'TRUE'])
-        
-        return df_insta, df_reg
-        
-    except Exception as e:
-        st.error(f"Erreur lors du chargement des données : {str(e)}")
-        return None, None
+        return analytics_warmup().result()
+    except Exception:
+        analytics_warmup.clear()
+        raise
 
-# Chargement des données
-df_insta, df_reg = load_data()
+watcher, ingestor = analytics_stack()
+snapshot = watcher.current()
 
-if df_insta is None or df_reg is None:
+if snapshot is None:
+    st.error(f"Erreur lors du chargement des données : {str(watcher.last_error)}")
     st.error("Impossible de charger les données. Vérifiez que les fichiers CSV sont présents à la racine du projet.")
     st.stop()
 
+DATA_VERSION = snapshot.version
+loaded = snapshot.data
+df_insta, df_reg = loaded.insta, loaded.reg
+
+# Version de l'export et inscriptions reçues depuis par le flux en direct
+# (ajoutées à la fin de la table) : les calculs sur l'historique sont indexés
+# par la version de l'export et complétés des seules lignes ajoutées
+BASE_VERSION, LIVE_ROWS = split_version(DATA_VERSION)
+df_live = loaded.reg.iloc[len(loaded.reg) - LIVE_ROWS:]
+race_day = loaded.race_day
+
+# Tables agrégées (affichage, téléchargements et export complet)
+def parcours_table(df_reg):
+    """Inscriptions par parcours"""
+    parcours_data = df_reg['parcours'].value_counts().reset_index()
+    parcours_data.columns = ['parcours', 'count']
+    parcours_data['parcours'] = parcours_data['parcours'].astype(str) + 'K'
+    return parcours_data
+
+def payment_table(df_reg):
+    """Inscriptions par statut de paiement"""
+    payment_data = df_reg.groupby('is_paid').size().reset_index()
+    payment_data.columns = ['status', 'count']
+    payment_data['status'] = payment_data['status'].map({True: 'Payé', False: 'Non payé'})
+    return payment_data
+
+def evolution_table(df_reg, period_column):
+    """Inscriptions par période × parcours en un bincount, périodes vides comprises"""
+    parcours_codes, parcours_values = pd.factorize(df_reg['parcours'], sort=True)
+    periods, period_matrix = period_counts(
+        df_reg[period_column],
+        parcours_codes,
+        len(parcours_values),
+        missing=NO_COUNTDOWN if period_column == 'jours_avant_course' else -1
+    )
+    period_labels = periods if period_column == 'jours_avant_course' else time_labels(period_column, periods)
+    return pd.DataFrame({
+        'periode': np.repeat(np.asarray(period_labels), len(parcours_values)),
+        'parcours': np.tile([f"{p}K" for p in parcours_values], len(periods)),
+        'inscriptions': period_matrix.ravel().astype(int)
+    })
+
+def payment_by_parcours_table(df_reg):
+    """Inscriptions, inscriptions payées et taux de paiement par parcours"""
+    payment_by_course = df_reg.groupby('parcours').agg({
+        'is_paid': ['count', 'sum']
+    }).reset_index()
+    payment_by_course.columns = ['parcours', 'total', 'payes']
+    payment_by_course['taux_paiement'] = (payment_by_course['payes'] / payment_by_course['total'] * 100)
+    payment_by_course['parcours'] = payment_by_course['parcours'].astype(str) + 'K'
+    return payment_by_course
+
+# Précalcul de l'impact pour toutes les fenêtres, parcours et statuts de paiement
+@st.cache_resource
+def impact_precompute():
+    """Pool de calcul de la grille d'impact, partagé entre toutes les sessions"""
+    return ImpactPrecompute(
+        workers=IMPACT_WARMUP_WORKERS,
+        windows={**IMPACT_WINDOWS, **IMPACT_CUSTOM_WINDOWS}
+    )
+
+impact_precompute().warm(BASE_VERSION, df_insta, loaded.reg.iloc[:len(loaded.reg) - LIVE_ROWS])
+
 # Filtres globaux (sidebar)
 with st.sidebar:
     # Bouton de déconnexion
     st.markdown("---")
     if st.button("🚪 Déconnexion", use_container_width=True):
         logout()
+    loaded_at = datetime.fromtimestamp(snapshot.loaded_at, TIMEZONE)
+    st.caption(f"Données à jour au {loaded_at:%d/%m/%Y %H:%M:%S}")
+    if watcher.last_error is not None:
+        st.caption(f"⚠️ Dernier rechargement en échec : {watcher.last_error}")
+    if ingestor is not None:
+        st.caption(f"🔴 Flux en direct : {format_number(ingestor.n_events)} événements reçus")
+        if ingestor.last_error is not None:
+            st.caption(f"⚠️ Dernier lot en échec : {ingestor.last_error}")
+        live_refresh = st.toggle(f"Actualisation automatique ({EVENTS_BATCH_SECONDS:g} s)", value=True)
+
+        @st.fragment(run_every=EVENTS_BATCH_SECONDS if live_refresh else None)
+        def refresh_on_new_version():
+            # Relance la page dès qu'un micro-lot a publié une nouvelle version
+            if watcher.current().version != DATA_VERSION:
+                st.rerun()
+
+        refresh_on_new_version()
     st.markdown("---")
     
     st.header("Filtres")
@@ -165,10 +698,7 @@ with st.sidebar:
     )
     if len(date_range) == 2:
         start_date, end_date = date_range
-        df_reg = df_reg[
-            (df_reg['date'] >= start_date) &
-            (df_reg['date'] <= end_date)
-        ]
+        df_reg = df_reg[df_reg['jour'].between(day_code(start_date), day_code(end_date))]
     
     # Parcours
     st.subheader("Course")
@@ -230,10 +760,7 @@ with st.sidebar:
     )
     if len(date_range_post) == 2:
         start_date_post, end_date_post = date_range_post
-        df_insta = df_insta[
-            (df_insta['date'] >= start_date_post) &
-            (df_insta['date'] <= end_date_post)
-        ]
+        df_insta = df_insta[df_insta['jour'].between(day_code(start_date_post), day_code(end_date_post))]
     
     # Type de post
     type_options = ['Tous'] + sorted(df_insta['Type'].unique().tolist())
@@ -241,17 +768,165 @@ with st.sidebar:
     if type_selected != 'Tous':
         df_insta = df_insta[df_insta['Type'] == type_selected]
 
+# État des filtres globaux (clé des caches de graphiques)
+filter_state = (
+    tuple(date_range),
+    parcours_selected,
+    paiement_status,
+    licence_status,
+    handisport_status,
+    tuple(date_range_post),
+    type_selected
+)
+
+def impact_for_window(start_hours, end_hours):
+    """Impact de chaque post filtré sur la fenêtre donnée
+
+    Lecture de la grille précalculée lorsque seuls les filtres parcours et
+    paiement sont actifs côté inscriptions, calcul direct sinon.
+    """
+    if (
+        tuple(date_range) == (min_date, max_date)
+        and licence_status == "Tous"
+        and handisport_status == "Tous"
+    ):
+        parcours_key = None if parcours_selected == 'Tous' else float(parcours_selected.replace('K', ''))
+        df_impact = impact_precompute().get(
+            BASE_VERSION,
+            parcours_key,
+            paiement_status,
+            (start_hours, end_hours),
+            added=registration_subset(df_live, parcours_key, paiement_status)
+        )
+        if df_impact is not None:
+            return df_impact.loc[df_insta.index]
+    return compute_impact(df_insta, df_reg['timestamp'], start_hours, end_hours)
+
+@st.cache_resource
+def score_board():
+    """Classements des posts par version des données, partagés entre toutes les sessions"""
+    return ScoreBoard()
+
+def post_scores(start_hours, end_hours):
+    """Ratios et rangs centiles de tous les posts, inscriptions comptées sur la fenêtre donnée"""
+    def build():
+        df_impact = impact_precompute().get(BASE_VERSION, None, "Tous", (start_hours, end_hours), added=df_live['timestamp'])
+        if df_impact is None:
+            df_impact = compute_impact(loaded.insta, loaded.reg['timestamp'], start_hours, end_hours)
+        return score_posts(loaded.insta, df_impact['inscriptions_window'].to_numpy())
+    return score_board().get((DATA_VERSION, start_hours, end_hours), build)
+
+@st.cache_resource
+def attribution_cache():
+    """Tables d'attribution par version des données, partagées entre toutes les sessions"""
+    return AttributionCache()
+
+def post_attribution(kernel, half_life, horizon):
+    """Inscriptions filtrées attribuées à tous les posts et nombre d'inscriptions non attribuées"""
+    return attribution_cache().get(
+        (DATA_VERSION, filter_state[:5], kernel, half_life, horizon),
+        lambda: attribution_table(loaded.insta, df_reg['timestamp'], kernel=kernel, half_life=half_life, horizon=horizon)
+    )
+
+def rollup_filters():
+    """Filtres de la barre latérale lisibles dans les agrégats précalculés,
+    None si un filtre absent des agrégats (licence, handisport) est actif"""
+    if licence_status != "Tous" or handisport_status != "Tous":
+        return None
+    return dict(
+        start_date=date_range[0] if len(date_range) == 2 else None,
+        end_date=date_range[1] if len(date_range) == 2 else None,
+        parcours=None if parcours_selected == 'Tous' else float(parcours_selected.replace('K', '')),
+        paid={"Tous": None, "Payé": True, "Non payé": False}[paiement_status]
+    )
+
+def geo_for_level(level):
+    """Inscriptions par région : agrégats précalculés, comptage des lignes
+    filtrées sinon"""
+    filters = rollup_filters()
+    if filters is not None:
+        return loaded.geo.query(level, **filters)
+    return region_counts(df_reg, loaded.geo.labels, level)
+
+def funnel_for_filters():
+    """(agrégats tarifaires, filtres à leur appliquer) : agrégats précalculés,
+    reconstruits sur les lignes filtrées sinon"""
+    filters = rollup_filters()
+    if filters is not None:
+        return loaded.funnel, filters
+    return FunnelRollup.from_frame(df_reg, loaded.funnel.labels), {}
+
+def funnel_table(kind, **options):
+    """Table tarifaire sous les filtres courants (sell_through, promo_uptake, payment_types)"""
+    funnel, filters = funnel_for_filters()
+    return getattr(funnel, kind)(**options, **filters)
+
+# Export complet : archive construite au clic, conservée par état des filtres
+@st.cache_resource
+def export_cache():
+    """Archives d'export sur disque, partagées entre toutes les sessions"""
+    return BundleCache()
+
+def export_tables():
+    """Tables de l'export complet sous les filtres courants (sources paresseuses)"""
+    period_columns = ['jour', 'semaine_iso', 'mois'] + (['jours_avant_course'] if race_day is not None else [])
+    tables = {
+        'repartition_parcours': lambda: parcours_table(df_reg),
+        'statut_paiement': lambda: payment_table(df_reg),
+        **{
+            f"evolution_{column}": (lambda column=column: evolution_table(df_reg, column))
+            for column in period_columns
+        },
+        'paiement_par_parcours': lambda: payment_by_parcours_table(df_reg),
+        **{
+            f"impact_{name.replace('-', '_')}": (lambda window=window: impact_for_window(*window))
+            for name, window in {**IMPACT_WINDOWS, **IMPACT_CUSTOM_WINDOWS}.items()
+        },
+        **{
+            f"repartition_{level}": (lambda level=level: geo_for_level(level))
+            for level in GEO_LEVELS
+        },
+        **{
+            f"classement_posts_{name.replace('-', '_')}": (
+                lambda window=window: post_scores(*window).loc[df_insta.index]
+            )
+            for name, window in IMPACT_WINDOWS.items()
+        },
+        'ventes_par_tarif': lambda: funnel_table('sell_through'),
+        'codes_promo': lambda: funnel_table('promo_uptake'),
+        'types_paiement': lambda: funnel_table('payment_types'),
+        'inscriptions': lambda: masked_extract_chunks(df_reg, EXPORT_CHUNK_ROWS),
+        'posts_instagram': lambda: df_insta[[c for c in POST_COLUMNS if c in df_insta.columns]],
+    }
+    return tables
+
+def export_bundle():
+    """Contenu de l'archive (appelé au clic, hors du script de la page)"""
+    return Path(export_cache().get_or_build((DATA_VERSION, filter_state), export_tables)).read_bytes()
+
+with st.sidebar:
+    st.markdown("---")
+    st.download_button(
+        "📦 Export complet",
+        export_bundle,
+        f"moe_export_{datetime.now(TIMEZONE):%Y%m%d_%H%M}.zip",
+        "application/zip",
+        help="Toutes les analyses sous les filtres courants, en CSV" + (" et Parquet" if PARQUET_AVAILABLE else ""),
+        use_container_width=True
+    )
+
 # Interface utilisateur
 st.title("MOE - Inscriptions × Instagram")
 st.caption("Panel d'analyse des inscriptions et de l'impact de la communication Instagram")
 
 # Création des onglets
-tab_overview, tab_inscriptions, tab_impact, tab_charts, tab_explorer = st.tabs([
+tab_overview, tab_inscriptions, tab_impact, tab_charts, tab_explorer, tab_checkin = st.tabs([
     "Overview",
     "Inscriptions",
     "Impact Com × Inscriptions",
     "Charts",
-    "Explorer"
+    "Explorer",
+    "Jour J"
 ])
 
 # Onglet Overview
@@ -259,7 +934,7 @@ with tab_overview:
     st.header("Vue d'ensemble")
     
     # KPIs
-    col1, col2, col3, col4, col5 = st.columns(5)
+    col1, col2, col3, col4, col5, col6 = st.columns(6)
     
     with col1:
         total_inscr = len(df_reg)
@@ -302,6 +977,16 @@ with tab_overview:
             format_percent(licencies / total_inscr * 100) if total_inscr > 0 else "0%"
         )
     
+    with col6:
+        # Coureurs distincts : inscriptions multiples d'une même personne regroupées
+        unique_runners, unique_paid, duplicates = unique_runner_stats(df_reg['runner_id'], df_reg['is_paid'])
+        st.metric(
+            "Coureurs uniques",
+            format_number(unique_runners),
+            format_percent(unique_paid / unique_runners * 100) if unique_runners > 0 else "0%",
+            help=f"{format_number(duplicates)} inscription(s) en double ; variation : part des coureurs ayant payé"
+        )
+    
     # Évolution temporelle
     st.subheader("Évolution temporelle")
     
@@ -318,7 +1003,7 @@ with tab_overview:
             'Clics sur le lien': 'Clics liens',
             'Enregistrements': 'Enregistrements'
         }
-        available_metrics = [m for m in insta_metrics.keys() if m in df_insta.columns]
+        available_metrics = [m for m in insta_metrics.keys() if m in df_insta.columns and m in INSTA_NUMERIC_COLUMNS]
         if not available_metrics:
             st.error("Aucune métrique Instagram disponible dans les données")
             st.stop()
@@ -335,40 +1020,36 @@ with tab_overview:
             options=["Somme", "Moyenne mobile 7j"],
             horizontal=True
         )
+        show_projection = st.checkbox(
+            f"Projection jusqu'au jour J ({race_day:%d/%m/%Y})" if race_day is not None else "Projection jusqu'au jour J",
+            disabled=race_day is None,
+            help="Cumul des inscriptions par parcours projeté jusqu'au jour de la course (intervalle à 90 %)"
+        )
+    
+    # Projection : modèle réutilisé tant que seuls de nouveaux jours s'ajoutent
+    projection = None
+    if show_projection:
+        projection = forecast_cache().projection(
+            DATA_VERSION,
+            (date_range[0], parcours_selected, paiement_status, licence_status, handisport_status),
+            filter_state[:5],
+            df_reg,
+            race_day
+        )
+        if projection is None:
+            st.info("Projection indisponible : la période sélectionnée se termine le jour de la course ou après.")
     
     # Préparation des données
-    daily_reg = df_reg.groupby('date').size().reset_index(name='inscriptions')
+    reg_days, reg_counts = period_counts(df_reg['jour'])
+    daily_reg = pd.DataFrame({'date': time_labels('jour', reg_days), 'inscriptions': reg_counts[:, 0]})
     
-    # Conversion des valeurs Instagram en nombres (gestion des virgules)
-    try:
-        # Vérifier que les colonnes existent
-        if selected_metric not in df_insta.columns:
-            st.error(f"La colonne '{selected_metric}' n'existe pas dans les données Instagram")
-            st.write("Colonnes disponibles:", list(df_insta.columns))
-            st.stop()
-        
-        # Nettoyer et convertir les données
-        df_insta_clean = df_insta.copy()
-        
-        # Debug: afficher quelques valeurs pour diagnostiquer (commenté pour interface propre)
-        # st.write(f"Échantillon de données pour {selected_metric}:")
-        # st.write(df_insta_clean[selected_metric].head())
-        
-        df_insta_clean[selected_metric] = pd.to_numeric(
-            df_insta_clean[selected_metric].astype(str).str.replace(',', '.').str.replace(' ', ''),
-            errors='coerce'
-        ).fillna(0)
-        
-        daily_insta = df_insta_clean.groupby('date')[selected_metric].sum().reset_index()
-        
-        # Vérifier que nous avons des données après traitement
-        if daily_insta.empty or daily_insta[selected_metric].sum() == 0:
-            st.warning(f"Aucune donnée valide trouvée pour {selected_metric}")
-            st.stop()
-            
-    except Exception as e:
-        st.error(f"Erreur lors du traitement des données Instagram : {str(e)}")
-        st.write("Colonnes dans df_insta:", list(df_insta.columns))
+    # Métriques Instagram converties en nombres au chargement (INSTA_NUMERIC_COLUMNS)
+    insta_days, insta_sums = period_counts(df_insta['jour'], weights=df_insta[selected_metric].fillna(0))
+    daily_insta = pd.DataFrame({'date': time_labels('jour', insta_days), selected_metric: insta_sums[:, 0]})
+
+    # Vérifier que nous avons des données
+    if daily_insta.empty or daily_insta[selected_metric].sum() == 0:
+        st.warning(f"Aucune donnée valide trouvée pour {selected_metric}")
         st.stop()
     
     # Tri par date
@@ -382,81 +1063,14 @@ with tab_overview:
     
     # Création du graphique
     try:
-        fig = go.Figure()
-        
         # Vérifier que les données ne sont pas vides
         if daily_reg.empty or daily_insta.empty:
             st.warning("Pas de données disponibles pour créer le graphique")
             st.stop()
         
-        # Courbe des inscriptions
-        fig.add_trace(
-            go.Scatter(
-                x=daily_reg['date'],
-                y=daily_reg['inscriptions'],
-                name="Inscriptions",
-                line=dict(color='#FF4B4B', width=3),
-                mode='lines',
-                yaxis='y',
-                hovertemplate="<b>%{x|%d/%m/%Y}</b><br>Inscriptions: %{y:.0f}<extra></extra>"
-            )
-        )
-        
-        # Courbe de la métrique Instagram
-        fig.add_trace(
-            go.Scatter(
-                x=daily_insta['date'],
-                y=daily_insta[selected_metric],
-                name=selected_metric,
-                line=dict(color='#636EFA', width=3),
-                mode='lines',
-                yaxis='y2',
-                hovertemplate=f"<b>%{{x|%d/%m/%Y}}</b><br>{selected_metric}: %{{y:.0f}}<extra></extra>"
-            )
-        )
-        # Mise en page
-        fig.update_layout(
-            title=dict(
-                text=f"Évolution des inscriptions et {selected_metric.lower()} ({agg_type.lower()})",
-                font=dict(size=20)
-            ),
-            xaxis=dict(
-                title="Date",
-                tickformat='%d/%m/%Y',
-                showgrid=True,
-                gridcolor='rgba(128, 128, 128, 0.2)'
-            ),
-        yaxis=dict(
-            title=dict(text="Nombre d'inscriptions", font=dict(color='#FF4B4B')),
-            tickfont=dict(color='#FF4B4B'),
-            showgrid=True,
-            gridcolor='rgba(255, 75, 75, 0.1)'
-        ),
-        yaxis2=dict(
-            title=dict(text=selected_metric, font=dict(color='#636EFA')),
-            tickfont=dict(color='#636EFA'),
-            overlaying='y',
-            side='right',
-            showgrid=False
-        ),
-            showlegend=True,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            ),
-            template="plotly_white",
-            height=500,
-            hovermode='x unified',
-            # Ajout des boutons de téléchargement
-            modebar=dict(
-                bgcolor='rgba(0,0,0,0)',
-                color='#636EFA',
-                activecolor='#FF4B4B',
-                add=['downloadImage']
-            )
+        fig = cached_figure(
+            ('overview', filter_state, selected_metric, agg_type, projection is not None),
+            lambda: overview_figure(selected_metric, agg_type, daily_reg, daily_insta, projection)
         )
         
         # Affichage du graphique
@@ -478,27 +1092,11 @@ with tab_inscriptions:
     
     with col1:
         # Répartition par parcours
-        parcours_data = df_reg['parcours'].value_counts().reset_index()
-        parcours_data.columns = ['parcours', 'count']
-        parcours_data['parcours'] = parcours_data['parcours'].astype(str) + 'K'
+        parcours_data = parcours_table(df_reg)
         
-        fig_parcours = px.pie(
-            parcours_data,
-            values='count',
-            names='parcours',
-            title="Répartition par parcours",
-            hole=0.4,
-            template="plotly_white"
-        )
-        
-        # Configuration de la barre d'outils
-        fig_parcours.update_layout(
-            modebar=dict(
-                bgcolor='rgba(0,0,0,0)',
-                color='#636EFA',
-                activecolor='#FF4B4B',
-                add=['downloadImage']
-            )
+        fig_parcours = cached_figure(
+            ('parcours', filter_state),
+            lambda: pie_figure(parcours_data, 'count', 'parcours', "Répartition par parcours")
         )
         
         st.plotly_chart(fig_parcours, use_container_width=True)
@@ -513,17 +1111,11 @@ with tab_inscriptions:
     
     with col2:
         # Répartition par statut de paiement
-        payment_data = df_reg.groupby('is_paid').size().reset_index()
-        payment_data.columns = ['status', 'count']
-        payment_data['status'] = payment_data['status'].map({True: 'Payé', False: 'Non payé'})
+        payment_data = payment_table(df_reg)
         
-        fig_payment = px.pie(
-            payment_data,
-            values='count',
-            names='status',
-            title="Statut des paiements",
-            hole=0.4,
-            template="plotly_white"
+        fig_payment = cached_figure(
+            ('paiement', filter_state),
+            lambda: pie_figure(payment_data, 'count', 'status', "Statut des paiements")
         )
         st.plotly_chart(fig_payment, use_container_width=True)
         
@@ -538,46 +1130,24 @@ with tab_inscriptions:
     # Évolution temporelle par parcours
     st.subheader("Évolution des inscriptions")
     
-    # Sélecteur de granularité
+    # Sélecteur de granularité (codes de période précalculés au chargement)
+    period_columns = {"Jour": 'jour', "Semaine": 'semaine_iso', "Mois": 'mois'}
+    if race_day is not None:
+        period_columns["Jours avant course"] = 'jours_avant_course'
     time_granularity = st.radio(
         "Granularité temporelle",
-        ["Jour", "Semaine", "Mois"],
+        list(period_columns),
         horizontal=True
     )
+    period_column = period_columns[time_granularity]
     
-    # Préparation des données selon la granularité
-    if time_granularity == "Jour":
-        time_group = df_reg['date']
-    elif time_granularity == "Semaine":
-        time_group = df_reg['timestamp'].dt.isocalendar().week
-    else:  # Mois
-        time_group = df_reg['timestamp'].dt.month
-    
-    evolution_data = df_reg.groupby([time_group, 'parcours']).size().reset_index()
-    evolution_data.columns = ['periode', 'parcours', 'inscriptions']
-    evolution_data['parcours'] = evolution_data['parcours'].astype(str) + 'K'
-    
-    fig_evolution = px.line(
-        evolution_data,
-        x='periode',
-        y='inscriptions',
-        color='parcours',
-        title=f"Évolution des inscriptions par {time_granularity.lower()}",
-        template="plotly_dark"
-    )
+    evolution_data = evolution_table(df_reg, period_column)
     
-    fig_evolution.update_layout(
-        xaxis_title=time_granularity,
-        yaxis_title="Nombre d'inscriptions",
-        height=400,
-        modebar=dict(
-            bgcolor='rgba(0,0,0,0)',
-            color='#636EFA',
-            activecolor='#FF4B4B',
-            add=['downloadImage']
-        )
+    fig_evolution = cached_figure(
+        ('evolution', filter_state, time_granularity),
+        lambda: evolution_figure(time_granularity, evolution_data)
     )
-    
+
     st.plotly_chart(fig_evolution, use_container_width=True)
     
     # Export données
@@ -591,32 +1161,19 @@ with tab_inscriptions:
     # Analyse des paiements par parcours
     st.subheader("Analyse des paiements")
     
-    payment_by_course = df_reg.groupby('parcours').agg({
-        'is_paid': ['count', 'sum']
-    }).reset_index()
-    
-    payment_by_course.columns = ['parcours', 'total', 'payes']
-    payment_by_course['taux_paiement'] = (payment_by_course['payes'] / payment_by_course['total'] * 100)
-    payment_by_course['parcours'] = payment_by_course['parcours'].astype(str) + 'K'
-    
-    fig_payment_course = px.bar(
-        payment_by_course,
-        x='parcours',
-        y='taux_paiement',
-        title="Taux de paiement par parcours",
-        text=payment_by_course['taux_paiement'].apply(lambda x: f"{x:.1f}%"),
-        template="plotly_dark"
-    )
-    
-    fig_payment_course.update_layout(
-        xaxis_title="Parcours",
-        yaxis_title="Taux de paiement (%)",
-        height=400,
-        modebar=dict(
-            bgcolor='rgba(0,0,0,0)',
-            color='#636EFA',
-            activecolor='#FF4B4B',
-            add=['downloadImage']
+    payment_by_course = payment_by_parcours_table(df_reg)
+    
+    fig_payment_course = cached_figure(
+        ('paiement_parcours', filter_state),
+        lambda: bar_figure(
+            payment_by_course,
+            x='parcours',
+            y='taux_paiement',
+            title="Taux de paiement par parcours",
+            xaxis_title="Parcours",
+            yaxis_title="Taux de paiement (%)",
+            text=payment_by_course['taux_paiement'].apply(lambda x: f"{x:.1f}%"),
+            template="plotly_dark"
         )
     )
     
@@ -630,69 +1187,197 @@ with tab_inscriptions:
         "text/csv"
     )
 
+    # Inscriptions en double (même coureur inscrit plusieurs fois)
+    df_duplicates = duplicate_groups(df_reg)
+    with st.expander(f"👥 Inscriptions en double ({format_number(df_duplicates['runner_id'].nunique())} coureurs)"):
+        if df_duplicates.empty:
+            st.write("Aucun doublon pour ces filtres.")
+        else:
+            st.dataframe(
+                pd.DataFrame({
+                    'coureur': pd.factorize(df_duplicates['runner_id'])[0] + 1,
+                    'nom': df_duplicates['NOM'].map(mask_name),
+                    'prenom': df_duplicates['PRENOM'],
+                    'email': df_duplicates['EMAIL'].map(mask_email),
+                    'parcours': df_duplicates['PARCOURS'],
+                    'paiement': df_duplicates['PAIEMENT'],
+                    'date': df_duplicates['timestamp'],
+                }),
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    'date': st.column_config.DatetimeColumn("Date d'inscription", format="DD/MM/YYYY HH:mm")
+                }
+            )
+
+    # Tarifs et codes promo : lecture des agrégats tarifaires précalculés
+    st.subheader("Tarifs et codes promo")
+
+    promo_data = funnel_table('promo_uptake')
+    if promo_data.empty:
+        st.info("Aucune inscription pour ces filtres.")
+    else:
+        with_code = promo_data[promo_data['code_promo'] != NO_PROMO]
+        total_reg = promo_data['inscriptions'].sum()
+        insured = (promo_data['taux_assurance'] * promo_data['inscriptions']).sum() / 100
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Inscriptions avec code", format_number(with_code['inscriptions'].sum()))
+        with col2:
+            st.metric("Part avec code", format_percent(with_code['inscriptions'].sum() / total_reg * 100))
+        with col3:
+            st.metric("Codes utilisés", format_number(len(with_code)))
+        with col4:
+            st.metric("Assurance annulation", format_percent(insured / total_reg * 100))
+
+        # Courbes de vente par tarif, pour toutes les inscriptions ou un code promo
+        col1, col2 = st.columns(2)
+        with col1:
+            promo_selected = st.selectbox(
+                "Code promo",
+                ["Tous"] + with_code['code_promo'].tolist() + [NO_PROMO]
+            )
+        with col2:
+            sell_through_views = {
+                "Inscriptions cumulées": ('cumul', "Inscriptions cumulées"),
+                "Part des ventes du tarif": ('part', "Part des ventes du tarif (%)"),
+            }
+            sell_through_view = st.radio("Courbe de vente", list(sell_through_views), horizontal=True)
+        sell_through_data = funnel_table('sell_through', promo=None if promo_selected == "Tous" else promo_selected)
+        sell_through_column, sell_through_label = sell_through_views[sell_through_view]
+
+        fig_sell_through = cached_figure(
+            ('tarifs', filter_state, promo_selected, sell_through_view),
+            lambda: sell_through_figure(
+                sell_through_data,
+                sell_through_column,
+                "Ventes par tarif" + ("" if promo_selected == "Tous" else f" ({promo_selected})"),
+                sell_through_label
+            )
+        )
+        st.plotly_chart(fig_sell_through, use_container_width=True)
+
+        if not with_code.empty:
+            top_codes = with_code.head(15)
+            fig_promo = cached_figure(
+                ('codes_promo', filter_state),
+                lambda: bar_figure(
+                    top_codes,
+                    x='code_promo',
+                    y='inscriptions',
+                    title="Codes promo les plus utilisés",
+                    xaxis_title="Code promo",
+                    yaxis_title="Nombre d'inscriptions",
+                    text=top_codes['part'].apply(lambda x: f"{x:.1f}%"),
+                    template="plotly_dark"
+                )
+            )
+            st.plotly_chart(fig_promo, use_container_width=True)
+
+        payment_types_data = funnel_table('payment_types')
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            st.dataframe(
+                promo_data,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    'code_promo': "Code promo",
+                    'inscriptions': "Inscriptions",
+                    'part': st.column_config.NumberColumn("Part (%)", format="%.1f"),
+                    'taux_assurance': st.column_config.NumberColumn("Assurance (%)", format="%.1f"),
+                    'valeur_codes': st.column_config.NumberColumn("Valeur des codes", format="%.2f"),
+                }
+            )
+        with col2:
+            st.dataframe(
+                payment_types_data,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    'type_paiement': "Type de paiement",
+                    'inscriptions': "Inscriptions",
+                    'taux_assurance': st.column_config.NumberColumn("Assurance (%)", format="%.1f"),
+                }
+            )
+
+        st.download_button(
+            "💾 Télécharger données codes promo",
+            promo_data.to_csv(index=False).encode('utf-8'),
+            "codes_promo.csv",
+            "text/csv"
+        )
+
+    # Répartition géographique : lecture des agrégats précalculés, sauf si un
+    # filtre absent des agrégats (licence, handisport) est actif
+    st.subheader("Répartition géographique")
+
+    geo_level = st.radio(
+        "Niveau",
+        list(GEO_LEVELS),
+        format_func=GEO_LEVELS.get,
+        horizontal=True,
+        key="geo_level"
+    )
+    geo_data = geo_for_level(geo_level)
+
+    if geo_data.empty:
+        st.info("Aucune inscription localisée pour ces filtres.")
+    else:
+        geojson = departements_geojson() if geo_level == 'departement' else None
+        fig_geo = cached_figure(
+            ('geo', filter_state, geo_level, geojson is not None),
+            lambda: geo_figure(geo_level, geo_data, geojson)
+        )
+        st.plotly_chart(fig_geo, use_container_width=True)
+
+        geo_col1, geo_col2 = st.columns([2, 1])
+        with geo_col1:
+            st.dataframe(
+                geo_data.rename(columns={'code': 'Code', 'nom': GEO_LEVELS[geo_level], 'inscriptions': 'Inscriptions'}),
+                hide_index=True,
+                use_container_width=True
+            )
+        with geo_col2:
+            located = geo_data['inscriptions'].sum()
+            st.metric(f"{GEO_LEVELS[geo_level]}s représentés", format_number(len(geo_data)))
+            st.metric("Part du premier", format_percent(geo_data['inscriptions'].iloc[0] / located * 100))
+
+        st.download_button(
+            "💾 Télécharger répartition géographique",
+            geo_data.to_csv(index=False).encode('utf-8'),
+            f"repartition_{geo_level}.csv",
+            "text/csv"
+        )
+
 # Onglet Impact Com × Inscriptions
 with tab_impact:
     st.header("Impact de la communication Instagram")
     
     # Sélection de la fenêtre d'analyse
     st.subheader("Fenêtre d'analyse")
+    impact_windows = {**IMPACT_WINDOWS, **IMPACT_CUSTOM_WINDOWS}
     window_hours = st.selectbox(
         "Période d'analyse après chaque post",
-        ["0-24h", "24-48h", "48-72h"],
+        list(impact_windows) + ["Personnalisée"],
         index=0
     )
     
     # Conversion de la sélection en heures
-    if window_hours == "0-24h":
-        start_hours, end_hours = 0, 24
-    elif window_hours == "24-48h":
-        start_hours, end_hours = 24, 48
+    if window_hours == "Personnalisée":
+        start_hours, end_hours = st.slider(
+            "Heures après le post",
+            min_value=0,
+            max_value=168,
+            value=(0, 24)
+        )
+        window_hours = f"{start_hours}-{end_hours}h"
     else:
-        start_hours, end_hours = 48, 72
+        start_hours, end_hours = impact_windows[window_hours]
     
     # Analyse de l'impact pour chaque post
-    impact_data = []
-    for _, post in df_insta.iterrows():
-        post_time = post['timestamp']
-        window_start = post_time + pd.Timedelta(hours=start_hours)
-        window_end = post_time + pd.Timedelta(hours=end_hours)
-        
-        # Inscriptions dans la fenêtre
-        inscr_window = df_reg[
-            (df_reg['timestamp'] >= window_start) &
-            (df_reg['timestamp'] < window_end)
-        ]
-        
-        # Baseline : même jour de la semaine sur ±4 semaines (hors fenêtre d'impact)
-        day_of_week = post_time.day_name()
-        baseline_period_start = post_time - pd.Timedelta(weeks=4)
-        baseline_period_end = post_time + pd.Timedelta(weeks=4)
-        
-        baseline_inscr = df_reg[
-            (df_reg['timestamp'] >= baseline_period_start) &
-            (df_reg['timestamp'] <= baseline_period_end) &
-            (df_reg['timestamp'].dt.day_name() == day_of_week) &
-            ~(
-                (df_reg['timestamp'] >= (post_time - pd.Timedelta(hours=72))) &
-                (df_reg['timestamp'] <= (post_time + pd.Timedelta(hours=72)))
-            )
-        ]
-        
-        baseline_daily_avg = len(baseline_inscr) / 8  # 8 semaines de référence
-        
-        impact_data.append({
-            'date_post': post_time.date(),
-            'type': post['Type'],
-            'titre': post['Titre'],
-            'vues': post['Vues'],
-            'likes': post['Likes'],
-            'inscriptions_window': len(inscr_window),
-            'baseline': baseline_daily_avg,
-            'delta': len(inscr_window) - baseline_daily_avg,
-            'delta_pct': ((len(inscr_window) - baseline_daily_avg) / baseline_daily_avg * 100) if baseline_daily_avg > 0 else 0
-        })
-    
-    df_impact = pd.DataFrame(impact_data)
+    df_impact = impact_for_window(start_hours, end_hours)
     
     # Affichage des top posts par impact
     st.subheader(f"Top posts par impact ({window_hours})")
@@ -706,25 +1391,17 @@ with tab_impact:
             ['date_post', 'type', 'titre', 'vues', 'inscriptions_window', 'baseline', 'delta', 'delta_pct']
         ]
         
-        fig_top = px.bar(
-            top_posts,
-            x='date_post',
-            y='delta',
-            text=top_posts['delta'].apply(lambda x: f"+{x:.0f}"),
-            title="Top 5 posts à impact positif",
-            template="plotly_white"
-        )
-        
-        fig_top.update_layout(
-                    xaxis_title="Date du post",
-        yaxis_title="Delta inscriptions",
-        height=400,
-        modebar=dict(
-            bgcolor='rgba(0,0,0,0)',
-            color='#636EFA',
-            activecolor='#FF4B4B',
-            add=['downloadImage']
-        )
+        fig_top = cached_figure(
+            ('impact_top', filter_state, window_hours),
+            lambda: bar_figure(
+                top_posts,
+                x='date_post',
+                y='delta',
+                title="Top 5 posts à impact positif",
+                xaxis_title="Date du post",
+                yaxis_title="Delta inscriptions",
+                text=top_posts['delta'].apply(lambda x: f"+{x:.0f}")
+            )
         )
         
         st.plotly_chart(fig_top, use_container_width=True)
@@ -746,28 +1423,156 @@ with tab_impact:
             'delta_pct': 'mean'
         }).reset_index()
         
-        fig_type = px.bar(
-            impact_by_type,
-            x='type',
-            y='delta',
-            text=impact_by_type['delta'].apply(lambda x: f"{x:+.1f}"),
-            title="Impact moyen par type de post",
-            template="plotly_white"
+        fig_type = cached_figure(
+            ('impact_type', filter_state, window_hours),
+            lambda: bar_figure(
+                impact_by_type,
+                x='type',
+                y='delta',
+                title="Impact moyen par type de post",
+                xaxis_title="Type de post",
+                yaxis_title="Delta moyen inscriptions",
+                text=impact_by_type['delta'].apply(lambda x: f"{x:+.1f}")
+            )
         )
         
-        fig_type.update_layout(
-                    xaxis_title="Type de post",
-        yaxis_title="Delta moyen inscriptions",
-        height=400,
-        modebar=dict(
-            bgcolor='rgba(0,0,0,0)',
-            color='#636EFA',
-            activecolor='#FF4B4B',
-            add=['downloadImage']
+        st.plotly_chart(fig_type, use_container_width=True)
+    
+    # Attribution des inscriptions entre posts successifs
+    st.subheader("Attribution des inscriptions")
+    st.caption(
+        "Chaque inscription est répartie entre les posts qui la précèdent selon un noyau de décroissance : "
+        "contrairement aux deltas par fenêtre, une inscription n'est jamais comptée deux fois."
+    )
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        kernel_label = st.radio(
+            "Noyau d'attribution",
+            list(ATTRIBUTION_KERNELS),
+            horizontal=True
         )
+        kernel = ATTRIBUTION_KERNELS[kernel_label]
+    
+    with col2:
+        attribution_horizon = st.slider("Horizon d'attribution (heures)", 6, 168, 72, step=6)
+        half_life = st.slider("Demi-vie (heures)", 1, 72, 24) if kernel == 'exp' else None
+    
+    # Tous les posts participent au partage, seuls les posts filtrés sont
+    # affichés ; calcul mémorisé par version des données, filtres et noyau
+    df_attribution, unattributed = post_attribution(kernel, half_life, attribution_horizon)
+    df_attribution = df_attribution.loc[df_insta.index]
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Inscriptions attribuées (posts filtrés)", format_number(df_attribution['inscriptions_attribuees'].sum()))
+    with col2:
+        st.metric("Inscriptions non attribuées", format_number(unattributed))
+    with col3:
+        st.metric(
+            "Part attribuée",
+            format_percent((len(df_reg) - unattributed) / len(df_reg) * 100) if len(df_reg) > 0 else "0%"
+        )
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        attribution_by_type = df_attribution.groupby('type')['inscriptions_attribuees'].sum().reset_index()
+        fig_attribution = cached_figure(
+            ('attribution_type', filter_state, kernel, half_life, attribution_horizon),
+            lambda: bar_figure(
+                attribution_by_type,
+                x='type',
+                y='inscriptions_attribuees',
+                title="Inscriptions attribuées par type de post",
+                xaxis_title="Type de post",
+                yaxis_title="Inscriptions attribuées",
+                text=attribution_by_type['inscriptions_attribuees'].apply(lambda x: f"{x:.1f}")
+            )
+        )
+        st.plotly_chart(fig_attribution, use_container_width=True)
+    
+    with col2:
+        st.write("Posts les plus contributeurs")
+        st.dataframe(
+            df_attribution.nlargest(10, 'inscriptions_attribuees'),
+            hide_index=True,
+            column_config={
+                'inscriptions_attribuees': st.column_config.NumberColumn("Inscriptions attribuées", format="%.1f")
+            }
+        )
+    
+    # Classement des posts : ratios et rangs centiles calculés une fois par
+    # version des données sur toute l'archive, seuls les posts filtrés sont affichés
+    st.subheader(f"Classement des posts ({window_hours})")
+    score_group = st.selectbox(
+        "Comparer au sein de",
+        list(SCORE_GROUPS),
+        format_func=SCORE_GROUPS.get
+    )
+    df_scores = post_scores(start_hours, end_hours).loc[df_insta.index]
+    st.dataframe(
+        df_scores[
+            ['date_post', 'Type', 'format', 'Titre', 'categorie_titre', 'Periode', 'Vues', f"score_{score_group}", *SCORE_RATIOS]
+        ].sort_values(f"score_{score_group}", ascending=False),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'date_post': st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+            'format': "Format",
+            'categorie_titre': "Catégorie",
+            'Periode': "Période",
+            'Vues': st.column_config.NumberColumn("Vues", format="%d"),
+            f"score_{score_group}": st.column_config.ProgressColumn(
+                "Rang centile moyen", min_value=0, max_value=100, format="%.0f"
+            ),
+            **{
+                name: st.column_config.NumberColumn(label, format="%.2f")
+                for name, (label, *_) in SCORE_RATIOS.items()
+            }
+        }
+    )
+
+    # Créneaux de publication : grilles 7 × 24 en un bincount chacune
+    st.subheader("Créneaux de publication")
+    
+    slot_grids = {
+        "Inscriptions": (weekday_hour_grid(df_reg['jour_semaine'], df_reg['heure']), ".0f"),
+        "Posts publiés": (weekday_hour_grid(df_insta['jour_semaine'], df_insta['heure']), ".0f"),
+    }
+    if 'Nb Interaction' in df_insta.columns:
+        interaction_grid = weekday_hour_grid(df_insta['jour_semaine'], df_insta['heure'], df_insta['Nb Interaction'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slot_grids["Interactions par post"] = (
+                np.where(slot_grids["Posts publiés"][0] > 0, interaction_grid / slot_grids["Posts publiés"][0], np.nan),
+                ".1f"
+            )
+    
+    slot_view = st.radio("Carte", list(slot_grids), horizontal=True, key="slot_view")
+    slot_grid, slot_format = slot_grids[slot_view]
+    fig_slots = cached_figure(
+        ('slots', filter_state, slot_view),
+        lambda: slot_heatmap_figure(slot_grid, f"{slot_view} par jour et heure", slot_view, slot_format)
+    )
+    st.plotly_chart(fig_slots, use_container_width=True)
+    
+    if 'Nb Interaction' in df_insta.columns:
+        st.write("Meilleurs créneaux (interactions moyennes par post)")
+        df_slots = best_slots(slot_grids["Inscriptions"][0], slot_grids["Posts publiés"][0], interaction_grid)
+        st.dataframe(
+            df_slots,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'jour': "Jour",
+                'heure': "Heure",
+                'posts': "Posts",
+                'interactions_par_post': st.column_config.NumberColumn("Interactions / post", format="%.1f"),
+                'inscriptions': "Inscriptions",
+                'part_inscriptions': st.column_config.NumberColumn("Part des inscriptions", format="%.1f%%")
+            }
         )
-        
-        st.plotly_chart(fig_type, use_container_width=True)
     
     # Export des données
     st.subheader("Export des données")
@@ -779,6 +1584,13 @@ with tab_impact:
         "text/csv"
     )
     
+    st.download_button(
+        "💾 Télécharger attribution par post",
+        df_attribution.to_csv(index=False).encode('utf-8'),
+        "attribution_posts.csv",
+        "text/csv"
+    )
+    
     # Avertissement
     st.caption("Note : Cette analyse est purement descriptive et ne permet pas d'établir de liens de causalité.")
 
@@ -794,31 +1606,32 @@ with tab_charts:
     )
     
     if dataset == "Inscriptions":
-        # Ajout d'une colonne pour le comptage
-        df = df_reg.copy()
-        df['nombre'] = 1
-        
-        # Configuration des métriques disponibles
+        # Configuration des métriques disponibles (None : nombre de lignes)
         metrics = {
-            'nombre': 'Nombre d\'inscriptions',
-            'is_paid': 'Taux de paiement',
-            'has_licence': 'Taux de licence',
-            'is_handisport': 'Taux handisport'
+            None: 'Nombre d\'inscriptions',
+            'is_paid': 'Paiement',
+            'has_licence': 'Licence',
+            'is_handisport': 'Handisport'
         }
         
         # Configuration des dimensions disponibles
         dimensions = {
             'parcours': 'Parcours',
             'date': 'Date',
-            'jour_semaine': 'Jour de la semaine',
+            **TIME_DIMENSIONS,
             'is_paid': 'Statut paiement',
             'has_licence': 'Statut licence',
             'is_handisport': 'Statut handisport'
         }
         
+        df, df_full = df_reg, loaded.reg
+        # Codes de l'export réutilisés, seules les inscriptions en direct sont codées
+        base_rows = len(df_full) - LIVE_ROWS
+        
     else:  # Instagram
         # Configuration des métriques disponibles
         metrics = {
+            None: 'Nombre de posts',
             'Vues': 'Vues',
             'Likes': 'Likes',
             'Commentaires': 'Commentaires',
@@ -829,10 +1642,15 @@ with tab_charts:
         dimensions = {
             'Type': 'Type de post',
             'date': 'Date',
-            'jour_semaine': 'Jour de la semaine'
+            **TIME_DIMENSIONS
         }
         
-        df = df_insta
+        df, df_full = df_insta, loaded.insta
+        base_rows = len(df_full)
+    
+    # Agrégations proposées selon la métrique : taux pour les indicateurs
+    # oui/non, statistiques de distribution pour les métriques numériques
+    boolean_metrics = ['is_paid', 'has_licence', 'is_handisport']
     
     # Configuration du graphique
     st.subheader("Configuration")
@@ -848,92 +1666,84 @@ with tab_charts:
         )
         
         # Type d'agrégation
-        agg_func = st.radio(
+        if selected_metric is None:
+            agg_options = ['count']
+        elif selected_metric in boolean_metrics:
+            agg_options = ['rate', 'sum']
+        else:
+            agg_options = ['sum', 'mean', 'median', 'p25', 'p75', 'p90']
+        agg_func = st.selectbox(
             "Type d'agrégation",
-            ['sum', 'mean'],
-            format_func=lambda x: 'Somme' if x == 'sum' else 'Moyenne',
-            horizontal=True
+            agg_options,
+            format_func=AGGREGATIONS.get,
+            disabled=len(agg_options) == 1
         )
     
     with col2:
-        # Sélection de la dimension
+        # Sélection des dimensions
         selected_dimension = st.selectbox(
             "Dimension",
             list(dimensions.keys()),
             format_func=lambda x: dimensions[x]
         )
+        second_dimension = st.selectbox(
+            "Deuxième dimension",
+            [None] + [d for d in dimensions if d != selected_dimension],
+            format_func=lambda x: "Aucune" if x is None else dimensions[x]
+        )
     
     with col3:
-        # Type de graphique
+        # Type de graphique (carte de chaleur à deux dimensions, camembert à une)
+        chart_options = ['bar', 'line', 'heatmap' if second_dimension else 'pie']
         chart_type = st.radio(
             "Type de graphique",
-            ['bar', 'line', 'pie'],
+            chart_options,
             format_func=lambda x: {
                 'bar': 'Barres',
                 'line': 'Lignes',
-                'pie': 'Camembert'
+                'pie': 'Camembert',
+                'heatmap': 'Carte de chaleur'
             }[x],
             horizontal=True
         )
     
-    # Préparation des données
-    if dataset == "Inscriptions" and selected_metric in ['is_paid', 'has_licence', 'is_handisport']:
-        # Pour les métriques booléennes, calculer le pourcentage
-        if selected_dimension == 'date':
-            agg_data = df.groupby('date').agg({
-                selected_metric: ['count', 'sum']
-            }).reset_index()
-            agg_data['taux'] = (agg_data[(selected_metric, 'sum')] / agg_data[(selected_metric, 'count')] * 100)
-            agg_data = agg_data[['date', 'taux']].rename(columns={'taux': selected_metric})
-        else:
-            agg_data = df.groupby(selected_dimension).agg({
-                selected_metric: ['count', 'sum']
-            }).reset_index()
-            agg_data['taux'] = (agg_data[(selected_metric, 'sum')] / agg_data[(selected_metric, 'count')] * 100)
-            agg_data = agg_data[[selected_dimension, 'taux']].rename(columns={'taux': selected_metric})
-    else:
-        # Pour les autres métriques, agrégation simple
-        if selected_dimension == 'date':
-            agg_data = df.groupby('date')[selected_metric].agg(agg_func).reset_index()
-        else:
-            agg_data = df.groupby(selected_dimension)[selected_metric].agg(agg_func).reset_index()
+    # Préparation des données : requête groupée mémorisée (codes précalculés)
+    query_dimensions = (selected_dimension,) + ((second_dimension,) if second_dimension else ())
+    agg_data = query_engine().run(
+        DATA_VERSION,
+        dataset,
+        df_full,
+        df,
+        selected_metric,
+        agg_func,
+        query_dimensions,
+        filter_state,
+        base=(BASE_VERSION, base_rows)
+    )
+    value_column = result_column(selected_metric, agg_func, query_dimensions)
+    metric_label = f"{metrics[selected_metric]} ({AGGREGATIONS[agg_func].lower()})" if selected_metric else metrics[None]
+    
+    # Dimensions temporelles : codes inconnus (-1) exclus, libellés lisibles
+    agg_data = agg_data.copy()
+    for dim in query_dimensions:
+        if dim in TIME_DIMENSIONS:
+            agg_data = agg_data[agg_data[dim] >= 0]
+            ordered = time_labels(dim, np.sort(agg_data[dim].unique()))
+            agg_data[dim] = pd.Categorical(time_labels(dim, agg_data[dim]).to_numpy(), categories=ordered)
+    agg_data = agg_data.reset_index(drop=True)
     
     # Création du graphique
-    if chart_type == 'bar':
-        fig = px.bar(
-            agg_data,
-            x=selected_dimension,
-            y=selected_metric,
-            title=f"{metrics[selected_metric]} par {dimensions[selected_dimension].lower()}",
-            template="plotly_white"
-        )
-    elif chart_type == 'line':
-        fig = px.line(
-            agg_data,
-            x=selected_dimension,
-            y=selected_metric,
-            title=f"Évolution {metrics[selected_metric].lower()}",
-            template="plotly_white"
-        )
-    else:  # pie
-        fig = px.pie(
+    fig = cached_figure(
+        ('charts', filter_state, dataset, selected_metric, agg_func, query_dimensions, chart_type),
+        lambda: custom_figure(
+            chart_type,
             agg_data,
-            values=selected_metric,
-            names=selected_dimension,
-            title=f"Répartition {metrics[selected_metric].lower()}",
-            template="plotly_white"
-        )
-    
-    # Mise en page
-    fig.update_layout(
-        xaxis_title=dimensions[selected_dimension],
-        yaxis_title=metrics[selected_metric],
-        height=500,
-        modebar=dict(
-            bgcolor='rgba(0,0,0,0)',
-            color='#636EFA',
-            activecolor='#FF4B4B',
-            add=['downloadImage']
+            value_column,
+            selected_dimension,
+            metric_label,
+            dimensions[selected_dimension],
+            second_dimension,
+            dimensions.get(second_dimension)
         )
     )
     
@@ -946,7 +1756,7 @@ with tab_charts:
     st.download_button(
         "💾 Télécharger les données",
         agg_data.to_csv(index=False).encode('utf-8'),
-        f"analyse_{dataset.lower()}_{selected_metric}_{selected_dimension}.csv",
+        f"analyse_{dataset.lower()}_{value_column}_{'_'.join(query_dimensions)}.csv",
         "text/csv"
     )
 
@@ -962,39 +1772,8 @@ with tab_explorer:
         st.subheader("Données d'inscription")
         
         # Préparation des données avec masquage PII
-        df_display = df_reg.copy()
-        
-        # Masquage des données personnelles
-        if 'NOM' in df_reg.columns:
-            df_display['nom_masked'] = df_reg['NOM'].apply(lambda x: x[:1] + '•' * (len(str(x)) - 1) if pd.notna(x) else x)
-        if 'PRENOM' in df_reg.columns:
-            df_display['prenom_masked'] = df_reg['PRENOM'].apply(lambda x: x[:1] + '•' * (len(str(x)) - 1) if pd.notna(x) else x)
-        if 'EMAIL' in df_reg.columns:
-            df_display['email_masked'] = df_reg['EMAIL'].apply(mask_email)
-        if 'TELEPHONE' in df_reg.columns:
-            df_display['telephone_masked'] = df_reg['TELEPHONE'].apply(mask_phone)
-        
-        # Colonnes de base toujours présentes
-        base_columns = ['parcours', 'is_paid', 'has_licence', 'is_handisport']
-        
-        # Colonnes optionnelles avec mapping
-        optional_columns = {
-            'DATE INSCRIPTION': 'DATE INSCRIPTION',
-            'CIVILITE': 'CIVILITE',
-            'nom_masked': 'nom_masked',
-            'prenom_masked': 'prenom_masked',
-            'email_masked': 'email_masked',
-            'telephone_masked': 'telephone_masked',
-            'VILLE': 'VILLE',
-            'departement_nom': 'departement_nom',
-            'CLUB': 'CLUB',
-            'PAIEMENT': 'PAIEMENT',
-            'CODE PROMO': 'CODE PROMO'
-        }
-        
-        # Construction de la liste finale des colonnes
-        display_columns = base_columns + [col for col, orig in optional_columns.items() 
-                                        if orig in df_display.columns]
+        df_display = masked_registrations(df_reg)
+        display_columns = [col for col in EXPLORER_COLUMNS if col in df_display.columns]
         
         # Filtres de recherche
         st.write("Filtres de recherche")
@@ -1014,9 +1793,12 @@ with tab_explorer:
             )
         
         with col3:
+            # Départements présents dans les agrégats, du plus représenté au moins représenté
+            dept_labels = loaded.geo.labels['departement']
             dept_filter = st.multiselect(
                 "Département",
-                options=sorted(df_reg['departement_nom'].unique()) if 'departement_nom' in df_reg.columns else []
+                options=loaded.geo.query('departement').index.tolist(),
+                format_func=lambda i: f"{dept_labels.at[i, 'code']} - {dept_labels.at[i, 'nom']}"
             )
         
         # Application des filtres
@@ -1025,8 +1807,8 @@ with tab_explorer:
             df_filtered = df_filtered[df_filtered['parcours'].isin(parcours_filter)]
         if civilite_filter and 'CIVILITE' in df_reg.columns:
             df_filtered = df_filtered[df_filtered['CIVILITE'].isin(civilite_filter)]
-        if dept_filter and 'departement_nom' in df_reg.columns:
-            df_filtered = df_filtered[df_filtered['departement_nom'].isin(dept_filter)]
+        if dept_filter:
+            df_filtered = df_filtered[df_filtered['dept_idx'].isin(dept_filter)]
         
         # Configuration des colonnes pour l'affichage
         column_config = {
@@ -1065,18 +1847,7 @@ with tab_explorer:
         st.subheader("Posts Instagram")
         
         # Vérification des colonnes disponibles
-        insta_columns = [col for col in [
-            'date',
-            'Type',
-            'Titre',
-            'Contenue',
-            'Periode',
-            'Vues',
-            'Likes',
-            'Commentaires',
-            'Partage',
-            'hashtags'
-        ] if col in df_insta.columns]
+        insta_columns = [col for col in POST_COLUMNS if col in df_insta.columns]
         
         # Filtres de recherche
         st.write("Filtres de recherche")
@@ -1129,3 +1900,92 @@ with tab_explorer:
             "posts_instagram_filtres.csv",
             "text/csv"
         )
+
+# Onglet Jour J (émargements)
+@st.cache_resource
+def checkin_tail(path):
+    """Suivi incrémental de l'export d'émargement, partagé entre toutes les sessions"""
+    return CheckinTail(path)
+
+with tab_checkin:
+    st.header("Retrait des dossards")
+    st.caption(
+        "Suivi des émargements à partir de l'export mis à jour en continu : "
+        "seules les nouvelles lignes sont lues à chaque rafraîchissement."
+    )
+    
+    live = st.toggle(f"Suivi en direct (toutes les {CHECKIN_REFRESH_SECONDS} s)", value=False)
+    
+    @st.fragment(run_every=CHECKIN_REFRESH_SECONDS if live else None)
+    def checkin_panel():
+        """Indicateurs et débit d'émargement, rafraîchis sans relancer toute la page"""
+        tail = checkin_tail(CHECKIN_CSV or REG_CSV)
+        tail.refresh()
+        summary = tail.summary()
+        
+        if not summary['parcours'] or summary['emarges'].sum() == 0:
+            st.info("Aucun émargement enregistré pour le moment.")
+            return
+        
+        # Indicateurs globaux
+        total_inscrits = summary['inscrits'].sum()
+        total_emarges = summary['emarges'].sum()
+        total_debit = summary['debit_min'].sum()
+        total_restants = summary['restants'].sum()
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric(
+                "Dossards retirés",
+                format_number(total_emarges),
+                format_percent(total_emarges / total_inscrits * 100) if total_inscrits > 0 else "0%"
+            )
+        with col2:
+            st.metric("Restant à retirer", format_number(total_restants))
+        with col3:
+            st.metric("Débit (dossards/min)", f"{total_debit:.1f}")
+        with col4:
+            st.metric(
+                "Résorption estimée",
+                format_duration(total_restants / total_debit if total_debit > 0 else np.inf)
+            )
+        
+        # Détail par parcours
+        st.dataframe(
+            pd.DataFrame({
+                'Parcours': summary['parcours'],
+                'Inscrits': summary['inscrits'],
+                'Retirés': summary['emarges'],
+                '% retirés': summary['pct_emarges'],
+                'Débit (/min)': summary['debit_min'],
+                'Résorption': [format_duration(m) for m in summary['resorption_min']]
+            }).sort_values('Parcours'),
+            hide_index=True,
+            column_config={
+                '% retirés': st.column_config.NumberColumn(format="%.1f%%"),
+                'Débit (/min)': st.column_config.NumberColumn(format="%.1f")
+            }
+        )
+        
+        # Émargements par minute sur les deux dernières heures
+        times, counts = tail.per_minute(120)
+        fig = go.Figure()
+        for label, series in sorted(zip(summary['parcours'], counts)):
+            fig.add_trace(line_trace(times, series, name=label))
+        fig.update_layout(
+            title="Émargements par minute (2 dernières heures)",
+            xaxis_title="Heure",
+            yaxis_title="Émargements",
+            template="plotly_white",
+            height=400,
+            modebar=MODEBAR
+        )
+        st.plotly_chart(fig, use_container_width=True)
+        
+        last = tail.last_checkin()
+        st.caption(
+            f"{format_number(tail.rows_read)} lignes lues"
+            + (f" · dernier émargement à {last:%H:%M}" if last is not None else "")
+        )
+    
+    checkin_panel()
@@ -0,0 +1,173 @@
+"""Pipeline de rendu des graphiques : sous-échantillonnage LTTB, traces WebGL
+et cache de figures sérialisées"""
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Largeur de référence d'un graphique en pixels : au-delà d'un point par pixel,
+# les points supplémentaires ne sont plus visibles mais restent sérialisés
+CHART_WIDTH_PX = 1200
+
+# Nombre de points à partir duquel une trace passe en rendu WebGL (Scattergl)
+WEBGL_THRESHOLD = 1000
+
+# Barre d'outils commune à tous les graphiques
+MODEBAR = dict(
+    bgcolor='rgba(0,0,0,0)',
+    color='#636EFA',
+    activecolor='#FF4B4B',
+    add=['downloadImage']
+)
+
+
+# Types d'axes convertis en dates (les autres axes non numériques sont des libellés)
+_DATETIME_KINDS = ('datetime64', 'datetime', 'date')
+
+
+def _as_numeric(x):
+    """Convertit un axe en tableau float : nombres, dates et timestamps par
+    valeur, libellés (catégories, texte) par position"""
+    x = np.asarray(x)
+    if x.dtype.kind in 'iufb':
+        return x.astype(float)
+    if x.dtype.kind == 'M' or pd.api.types.infer_dtype(x, skipna=True) in _DATETIME_KINDS:
+        return pd.to_datetime(x).to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    return np.arange(len(x), dtype=float)
+
+
+def lttb(x, y, n_out):
+    """Indices des points retenus par l'algorithme Largest-Triangle-Three-Buckets
+
+    Conserve le premier et le dernier point, puis choisit dans chaque intervalle
+    le point formant le plus grand triangle avec le point précédemment retenu et
+    la moyenne de l'intervalle suivant, ce qui préserve pics et creux.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = _as_numeric(x)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def downsample(x, y, max_points=CHART_WIDTH_PX):
+    """Réduit une série à `max_points` points en préservant sa forme"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= max_points:
+        return x, y
+    idx = lttb(x, y, max_points)
+    return x[idx], y[idx]
+
+
+def line_trace(x, y, max_points=CHART_WIDTH_PX, **kwargs):
+    """Trace de courbe sous-échantillonnée, en WebGL au-delà de WEBGL_THRESHOLD points"""
+    x, y = downsample(x, y, max_points)
+    trace_cls = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace_cls(x=x, y=y, mode='lines', **kwargs)
+
+
+class SerializedFigure(go.Figure):
+    """Figure lue depuis sa spécification JSON, sans revalidation
+
+    `st.plotly_chart` reçoit une figure déjà validée : `to_dict()` relit la
+    spécification (une copie à chaque appel) au lieu de reconstruire et
+    revalider la figure trace par trace comme pour un dictionnaire. Lecture
+    seule : les modifications de l'objet ne sont pas rendues.
+    """
+
+    def __init__(self, spec_json):
+        super().__init__()
+        self._spec_json = spec_json
+
+    def to_dict(self):
+        return json.loads(self._spec_json)
+
+    def to_plotly_json(self):
+        return self.to_dict()
+
+    def to_json(self, *args, **kwargs):
+        return self._spec_json
+
+
+class FigureCache:
+    """Cache LRU de figures sérialisées, borné en mémoire et partagé entre sessions
+
+    Les clés regroupent la version des données, l'état des filtres et les
+    paramètres du graphique ; les valeurs sont les spécifications JSON
+    (chaînes immuables) des figures. Chaque succès renvoie une
+    `SerializedFigure` propre à l'appelant.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Renvoie la figure en cache (et la marque comme récente) ou None"""
+        with self._lock:
+            spec_json = self._entries.get(key)
+            if spec_json is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return SerializedFigure(spec_json)
+
+    def put(self, key, fig):
+        """Sérialise une figure et l'ajoute au cache en évinçant les plus anciennes"""
+        spec_json = fig.to_json() if hasattr(fig, 'to_json') else json.dumps(fig)
+        nbytes = len(spec_json)
+        if nbytes <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.size -= len(old)
+                self._entries[key] = spec_json
+                self.size += nbytes
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return SerializedFigure(spec_json)
+
+    def get_or_build(self, key, build):
+        """Renvoie la figure en cache ou la construit avec `build()`"""
+        fig = self.get(key)
+        if fig is None:
+            fig = self.put(key, build())
+        return fig
+
+    def clear(self):
+        """Vide le cache"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,258 @@
+"""Suivi en direct des émargements (retrait des dossards) le jour de la course
+
+Le fichier d'export est suivi comme un journal : seuls les octets ajoutés
+depuis la lecture précédente sont analysés, et les comptages par minute et
+par parcours sont tenus dans des tampons circulaires. Un rafraîchissement
+coûte donc O(nouvelles lignes). Si le fichier est remplacé, tronqué ou
+réécrit sur place (début du fichier ou octets précédant la position de
+lecture modifiés), l'état est réinitialisé et le fichier relu. Une ligne
+n'est analysée qu'une fois terminée par un retour à la ligne.
+"""
+import csv
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Taille des tampons circulaires (minutes conservées)
+RING_MINUTES = 24 * 60
+
+# Fenêtre de calcul du débit d'arrivée (minutes)
+RATE_WINDOW_MINUTES = 15
+
+# Octets comparés au début du fichier et avant la position de lecture pour
+# distinguer un ajout d'une réécriture
+FINGERPRINT_BYTES = 4096
+
+_PARCOURS_RE = re.compile(r'(\d+)\s*km', re.IGNORECASE)
+_DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M')
+
+
+def parse_parcours(label):
+    """Libellé court du parcours (« 21K ») à partir du libellé complet"""
+    match = _PARCOURS_RE.search(label or '') or re.search(r'(\d+)', label or '')
+    return f"{match.group(1)}K" if match else "?"
+
+
+def parse_datetime(value):
+    """Date d'émargement (None si vide ou invalide)"""
+    value = (value or '').strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+class MinuteRing:
+    """Comptages par minute et par série dans un tampon circulaire"""
+
+    def __init__(self, size=RING_MINUTES):
+        self.size = size
+        self.counts = np.zeros((0, size), dtype=np.int32)
+        self.last = None  # fin du tampon (minutes depuis l'epoch)
+
+    def ensure_series(self, n):
+        """Ajoute des séries vides jusqu'à en avoir `n`"""
+        if n > len(self.counts):
+            self.counts = np.vstack([self.counts, np.zeros((n - len(self.counts), self.size), dtype=np.int32)])
+
+    def add(self, series, minutes):
+        """Ajoute un événement par couple (série, minute)"""
+        series = np.asarray(series, dtype=np.int64)
+        minutes = np.asarray(minutes, dtype=np.int64)
+        if len(minutes) == 0:
+            return
+        self.advance(int(minutes.max()))
+        keep = minutes > self.last - self.size
+        np.add.at(self.counts, (series[keep], minutes[keep] % self.size), 1)
+
+    def advance(self, minute):
+        """Avance la fin du tampon jusqu'à `minute`, minutes écoulées remises à zéro"""
+        if self.last is None:
+            self.last = minute
+        elif minute > self.last:
+            skipped = min(minute - self.last, self.size)
+            self.counts[:, (self.last + 1 + np.arange(skipped)) % self.size] = 0
+            self.last = minute
+
+    def window(self, n):
+        """Comptages des `n` dernières minutes, de la plus ancienne à la plus récente"""
+        n = min(n, self.size)
+        if self.last is None:
+            return np.zeros((len(self.counts), n), dtype=np.int32)
+        return self.counts[:, (self.last - n + 1 + np.arange(n)) % self.size]
+
+
+class CheckinTail:
+    """Suivi incrémental d'un export d'inscriptions contenant EMARGEMENT / DATE EMARGEMENT"""
+
+    def __init__(self, path, encoding='utf-8', delimiter=';'):
+        self.path = Path(path)
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.rows_read = 0
+        self._inode = None
+        self._mtime = None
+        self._head = b''  # premiers octets lus
+        self._tail = b''  # derniers octets lus, jusqu'à la position de lecture
+        self._partial = b''
+        self._columns = None
+        self.parcours = []
+        self._parcours_index = {}
+        self._bibs = {}
+        self.registered = np.zeros(0, dtype=np.int64)
+        self.checked_in = np.zeros(0, dtype=np.int64)
+        self.ring = MinuteRing()
+        self.last_minute = None  # minute du dernier émargement horodaté
+
+    def _series(self, label):
+        idx = self._parcours_index.get(label)
+        if idx is None:
+            idx = self._parcours_index[label] = len(self.parcours)
+            self.parcours.append(label)
+            self.registered = np.append(self.registered, 0)
+            self.checked_in = np.append(self.checked_in, 0)
+            self.ring.ensure_series(len(self.parcours))
+        return idx
+
+    def refresh(self):
+        """Lit les lignes ajoutées depuis le dernier appel ; renvoie leur nombre"""
+        with self._lock:
+            try:
+                stat = self.path.stat()
+            except FileNotFoundError:
+                return 0
+            if stat.st_ino == self._inode and stat.st_size == self.offset and stat.st_mtime_ns == self._mtime:
+                return 0
+
+            with open(self.path, 'rb') as f:
+                if stat.st_ino != self._inode or stat.st_size < self.offset or self._rewritten(f):
+                    self._reset()
+                    self._inode = stat.st_ino
+                self._mtime = stat.st_mtime_ns
+                f.seek(self.offset)
+                chunk = f.read(stat.st_size - self.offset)
+            self.offset += len(chunk)
+            if len(self._head) < FINGERPRINT_BYTES:
+                self._head = (self._head + chunk)[:FINGERPRINT_BYTES]
+            self._tail = (self._tail + chunk)[-FINGERPRINT_BYTES:]
+
+            data = self._partial + chunk
+            end = data.rfind(b'\n')
+            if end < 0:
+                self._partial = data
+                return 0
+            self._partial = data[end + 1:]
+            return self._ingest(data[:end].decode(self.encoding, errors='replace').splitlines())
+
+    def _rewritten(self, f):
+        """Vrai si les octets déjà lus (début et fin) ont changé dans le fichier ouvert `f`"""
+        f.seek(0)
+        if f.read(len(self._head)) != self._head:
+            return True
+        f.seek(self.offset - len(self._tail))
+        return f.read(len(self._tail)) != self._tail
+
+    def _ingest(self, lines):
+        rows = csv.reader(lines, delimiter=self.delimiter)
+        if self._columns is None:
+            header = next(rows, None)
+            if header is None:
+                return 0
+            header = [h.lstrip('\ufeff') for h in header]
+            self._columns = {
+                name: header.index(name)
+                for name in ('DOSSARD', 'REF', 'PARCOURS', 'EMARGEMENT', 'DATE EMARGEMENT')
+                if name in header
+            }
+
+        cols = self._columns
+
+        def field(row, name):
+            i = cols.get(name)
+            return row[i] if i is not None and i < len(row) else ''
+
+        series, minutes = [], []
+        count = 0
+        for row in rows:
+            if not row:
+                continue
+            count += 1
+            self.rows_read += 1
+            bib = field(row, 'DOSSARD') or field(row, 'REF') or f"ligne-{self.rows_read}"
+            idx = self._series(parse_parcours(field(row, 'PARCOURS')))
+
+            # Un coureur n'est compté qu'une fois, même si sa ligne est réexportée
+            seen = self._bibs.get(bib)
+            if seen is None:
+                self.registered[idx] += 1
+                seen = self._bibs[bib] = [idx, False]
+            if seen[1] or field(row, 'EMARGEMENT').strip().upper() != 'OUI':
+                continue
+
+            seen[1] = True
+            self.checked_in[seen[0]] += 1
+            when = parse_datetime(field(row, 'DATE EMARGEMENT'))
+            if when is not None:
+                series.append(seen[0])
+                minutes.append(int(when.timestamp() // 60))
+
+        self.ring.add(series, minutes)
+        if minutes:
+            newest = max(minutes)
+            self.last_minute = newest if self.last_minute is None else max(self.last_minute, newest)
+        return count
+
+    def last_checkin(self):
+        """Minute du dernier émargement horodaté (datetime) ou None"""
+        if self.last_minute is None:
+            return None
+        return datetime.fromtimestamp(self.last_minute * 60)
+
+    def _advance(self, now):
+        """Fin du tampon avancée à la minute courante : une pause des arrivées
+        fait baisser le débit au lieu de figer celui de la dernière vague"""
+        now = datetime.now() if now is None else now
+        self.ring.advance(int(now.timestamp() // 60))
+
+    def summary(self, rate_window=RATE_WINDOW_MINUTES, now=None):
+        """Indicateurs par parcours : inscrits, émargés, %, débit/min et temps de résorption (min)
+
+        Débit et résorption sont calculés sur les `rate_window` minutes
+        précédant `now` (par défaut l'heure courante).
+        """
+        with self._lock:
+            self._advance(now)
+            recent = self.ring.window(rate_window)
+            rate = recent.sum(axis=1) / rate_window
+            remaining = self.registered - self.checked_in
+            with np.errstate(divide='ignore', invalid='ignore'):
+                pct = np.where(self.registered > 0, self.checked_in / self.registered * 100, 0.0)
+                clearance = np.where(rate > 0, remaining / rate, np.inf)
+            return {
+                'parcours': list(self.parcours),
+                'inscrits': self.registered.copy(),
+                'emarges': self.checked_in.copy(),
+                'pct_emarges': pct,
+                'debit_min': rate,
+                'restants': remaining,
+                'resorption_min': clearance,
+            }
+
+    def per_minute(self, minutes=120, now=None):
+        """Émargements par minute et par parcours sur les `minutes` minutes précédant `now`"""
+        with self._lock:
+            self._advance(now)
+            counts = self.ring.window(minutes).copy()
+            last = self.ring.last
+        times = [datetime.fromtimestamp((last - minutes + 1 + i) * 60) for i in range(minutes)]
+        return times, counts
@@ -0,0 +1,51 @@
+"""Stockage en blocs ajoutés sans recopie, partagés entre versions successives
+
+Une version prolongée reprend les blocs de la précédente (tuple) et y ajoute
+les siens : aucun bloc n'est modifié en place, la version précédente reste
+valide pour qui la lit encore. Un bloc est fusionné avec le précédent tant
+que celui-ci n'est pas plus grand : les tailles décroissent, il y a
+O(log n) blocs et chaque élément n'est recopié que O(log n) fois.
+"""
+import numpy as np
+
+
+def append_chunk(chunks, chunk, merge):
+    """Blocs `chunks` suivis de `chunk` ; `merge(a, b)` fusionne deux blocs consécutifs"""
+    chunks = list(chunks) + [chunk]
+    while len(chunks) > 1 and len(chunks[-2]) <= len(chunks[-1]):
+        chunks[-2:] = [merge(chunks[-2], chunks[-1])]
+    return tuple(chunks)
+
+
+def concat_arrays(a, b):
+    return np.concatenate([a, b])
+
+
+def join_arrays(chunks, dtype):
+    """Tableau des blocs mis bout à bout"""
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=dtype)
+
+
+class LayeredDict:
+    """Table clé → valeur en couches (la plus récente l'emporte), prolongée sans recopie"""
+
+    def __init__(self, layers=()):
+        self.layers = tuple(layers)
+
+    def get(self, key, default=None):
+        for layer in reversed(self.layers):
+            if key in layer:
+                return layer[key]
+        return default
+
+    def updated(self, items):
+        """Nouvelle table : `items` (dictionnaire) ajouté par-dessus les couches existantes"""
+        if not items:
+            return self
+        return LayeredDict(append_chunk(self.layers, items, lambda a, b: {**a, **b}))
+
+    def to_dict(self):
+        merged = {}
+        for layer in self.layers:
+            merged.update(layer)
+        return merged
@@ -0,0 +1,98 @@
+"""Chargement et préparation des données Instagram et inscriptions"""
+from collections import namedtuple
+
+import pandas as pd
+
+from dedup import RunnerIndex
+from forecast import race_date_from
+from geo import GeoRollup, add_geography_columns
+from pricing import FunnelRollup, add_pricing_columns
+from timeslots import add_race_countdown, add_time_dimensions
+
+# Chemins des fichiers (à la racine du projet)
+INSTAGRAM_CSV = "insta_data.csv"
+REG_CSV = "data_registration_moe.csv"
+
+# Métriques Instagram exportées en texte (virgule décimale, espaces de milliers)
+INSTA_NUMERIC_COLUMNS = [
+    'Vues', 'Vues Followers', 'Vues Non Followers', 'Nb Interaction', 'Likes',
+    'Commentaires', 'Partage', 'Enregistrement', 'Activté du Profil', 'Visites du profil',
+    'Followers en plus', 'Appuis sur des liens externes', 'Clics sur le lien', 'Enregistrements'
+]
+
+
+# Données chargées et index précalculés, partagés par toutes les sessions
+Dataset = namedtuple('Dataset', ['insta', 'reg', 'geo', 'race_day', 'runners', 'funnel'])
+
+
+def to_number(series):
+    """Convertit une colonne texte au format français en nombres (NaN si invalide)"""
+    if series.dtype.kind in 'iuf':
+        return series
+    return pd.to_numeric(
+        series.astype(str).str.replace(',', '.').str.replace(' ', ''),
+        errors='coerce'
+    )
+
+
+def load_data(instagram_csv=INSTAGRAM_CSV, reg_csv=REG_CSV):
+    """Lit les deux fichiers CSV et calcule les colonnes dérivées
+
+    Lève l'exception d'origine en cas d'échec : l'appelant décide s'il faut
+    l'afficher ou conserver la version précédente des données.
+    """
+    # Lecture des données Instagram
+    df_insta = pd.read_csv(instagram_csv, sep=';')
+
+    # Conversion des dates Instagram
+    df_insta['date'] = pd.to_datetime(df_insta['Date']).dt.date
+    df_insta['timestamp'] = pd.to_datetime(df_insta['Date'] + ' ' + df_insta['Heure'].fillna('12:00'))
+
+    # Métriques numériques
+    for col in INSTA_NUMERIC_COLUMNS:
+        if col in df_insta.columns:
+            df_insta[col] = to_number(df_insta[col])
+
+    # Dimensions temporelles (heure inconnue si la colonne Heure est vide)
+    add_time_dimensions(df_insta, known_hour=df_insta['Heure'].notna())
+
+    # Lecture des données d'inscription
+    df_reg = pd.read_csv(reg_csv, sep=';')
+    prepare_registrations(df_reg)
+
+    return df_insta, df_reg
+
+
+def prepare_registrations(df_reg):
+    """Ajoute les colonnes dérivées des inscriptions (dates, parcours, indicateurs)"""
+    # Conversion des dates d'inscription
+    df_reg['date'] = pd.to_datetime(df_reg['DATE INSCRIPTION']).dt.date
+    df_reg['timestamp'] = pd.to_datetime(df_reg['DATE INSCRIPTION'])
+    add_time_dimensions(df_reg)
+
+    # Extraction du parcours (5, 12 ou 21)
+    df_reg['parcours'] = df_reg['PARCOURS'].str.extract(r'(\d+)').astype(float)
+
+    # Flags
+    df_reg['is_paid'] = df_reg['PAIEMENT'].str.upper().isin(['PAYE', 'OK', 'VALIDÉ', 'OUI', '1', 'TRUE'])
+    df_reg['has_licence'] = df_reg['FEDERATION'].notna() | df_reg['Numéro de licence'].notna()
+    df_reg['is_handisport'] = df_reg['HANDISPORT'].str.upper().isin(['OUI', '1', 'TRUE'])
+
+
+def load_dataset(instagram_csv=INSTAGRAM_CSV, reg_csv=REG_CSV, race_date=None, previous=None):
+    """Charge les données puis construit les index précalculés (géographie, tarifs, jour de course, coureurs)
+
+    `race_date` fixe le jour de la course ; par défaut, il est déduit des
+    dates d'émargement. `previous` (Dataset précédent) permet de prolonger
+    l'index des coureurs au lieu de le reconstruire.
+    """
+    df_insta, df_reg = load_data(instagram_csv, reg_csv)
+    dept_labels, pays_labels = add_geography_columns(df_reg)
+    geo = GeoRollup.from_frame(df_reg, {'departement': dept_labels, 'pays': pays_labels})
+    funnel = FunnelRollup.from_frame(df_reg, add_pricing_columns(df_reg))
+    race_day = pd.Timestamp(race_date) if race_date else race_date_from(df_reg)
+    add_race_countdown(df_insta, race_day)
+    add_race_countdown(df_reg, race_day)
+    runners = RunnerIndex.build(df_reg, previous.runners if previous is not None else None)
+    df_reg['runner_id'] = runners.runner_ids()
+    return Dataset(df_insta, df_reg, geo, race_day, runners, funnel)
@@ -0,0 +1,141 @@
+"""Surveillance des fichiers de données et rechargement en arrière-plan"""
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+# Version des données servie aux sessions : identifiant, date de chargement
+# (timestamp epoch) et données chargées
+DataSnapshot = namedtuple('DataSnapshot', ['version', 'loaded_at', 'data'])
+
+
+def file_signature(paths):
+    """Date de modification et taille de chaque fichier (None si absent)"""
+    signature = []
+    for path in paths:
+        try:
+            stat = Path(path).stat()
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((str(path), None, None))
+    return tuple(signature)
+
+
+def file_digest(paths, chunk_size=1024 * 1024):
+    """Empreinte SHA-1 du contenu des fichiers, lue par blocs"""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            digest.update(b'<absent>')
+    return digest.hexdigest()
+
+
+class DataWatcher:
+    """Recharge les données dans un thread dédié lorsque les fichiers changent
+
+    Le thread compare périodiquement date de modification et taille des
+    fichiers ; un changement n'est pris en compte qu'une fois la signature
+    stable entre deux passages (export terminé) et si l'empreinte du contenu
+    diffère. Les nouvelles données sont construites hors du chemin des
+    requêtes puis substituées d'un bloc : les sessions continuent de lire la
+    version précédente jusque-là.
+    """
+
+    def __init__(self, paths, loader, interval=5.0):
+        self.paths = tuple(paths)
+        self.loader = loader
+        self.interval = interval
+        self.last_error = None
+        self._snapshot = None
+        self._signature = None
+        self._digest = None
+        self._failed_digest = None  # contenu dont le chargement a échoué
+        self._pending = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """Dernière version complète des données (None avant le premier chargement)"""
+        return self._snapshot
+
+    def start(self):
+        """Charge les données de façon synchrone puis lance la surveillance"""
+        if self._snapshot is None:
+            self.reload()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Arrête le thread de surveillance"""
+        self._stop.set()
+
+    def reload(self):
+        """Reconstruit les données et les publie ; conserve l'ancienne version en cas d'erreur"""
+        with self._reload_lock:
+            signature = file_signature(self.paths)
+            digest = file_digest(self.paths)
+            try:
+                data = self.loader()
+            except Exception as e:
+                # Fichiers marqués comme traités : pas de nouvelle tentative
+                # (ni de nouvelle erreur) avant leur prochaine modification
+                self.last_error = e
+                self._signature = signature
+                self._failed_digest = digest
+                return False
+            self._signature = signature
+            self._digest = digest
+            self._failed_digest = None
+            self._snapshot = DataSnapshot(version=digest, loaded_at=time.time(), data=data)
+            self.last_error = None
+            return True
+
+    def update(self, transform):
+        """Publie la version renvoyée par `transform(version courante)` : (identifiant, données) ou None
+
+        Exécuté sous le verrou de rechargement : une mise à jour ne peut pas
+        écraser une version rechargée entre-temps depuis les fichiers.
+        """
+        with self._reload_lock:
+            if self._snapshot is None:
+                return False
+            result = transform(self._snapshot)
+            if result is None:
+                return False
+            version, data = result
+            self._snapshot = DataSnapshot(version=version, loaded_at=time.time(), data=data)
+            return True
+
+    def poll(self):
+        """Vérifie une fois les fichiers ; renvoie True si une nouvelle version a été publiée"""
+        signature = file_signature(self.paths)
+        if signature == self._signature:
+            self._pending = None
+            return False
+
+        # Attendre que l'écriture du fichier soit terminée
+        if signature != self._pending:
+            self._pending = signature
+            return False
+        self._pending = None
+
+        # Contenu déjà chargé, ou dont le chargement a déjà échoué
+        if file_digest(self.paths) in (self._digest, self._failed_digest):
+            self._signature = signature
+            return False
+        return self.reload()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                self.last_error = e
@@ -0,0 +1,275 @@
+"""Détection des inscriptions en double (un même coureur inscrit plusieurs fois)
+
+Deux clés d'identité normalisées sont calculées pour chaque inscription :
+NOM + PRÉNOM + DATE DE NAISSANCE sans accents ni ponctuation, et EMAIL +
+PRÉNOM (une adresse est souvent partagée par une famille : l'email seul ne
+suffit pas à identifier un coureur). Les inscriptions partageant une clé,
+directement ou de proche en proche, forment un même coureur.
+
+Les clés sont indexées dans une table de hachage (clé → coureur) et les
+groupes calculés par propagation vectorisée du plus petit identifiant, sans
+comparaison deux à deux. Quand des lignes sont ajoutées à l'export, seules
+les nouvelles lignes sont normalisées et rattachées ; les coureurs réunis
+par une nouvelle ligne sont fusionnés par union-find. Le coût d'un ajout
+dépend des lignes ajoutées et non de l'historique (index en blocs partagés).
+"""
+import numpy as np
+import pandas as pd
+
+from chunks import LayeredDict, append_chunk, concat_arrays, join_arrays
+
+IDENTITY_COLUMNS = ['NOM', 'PRENOM', 'DATE DE NAISSANCE', 'EMAIL']
+
+
+def _fold_text(values):
+    s = (
+        pd.Series(values, dtype='string')
+        .str.normalize('NFKD')
+        .str.encode('ascii', errors='ignore')
+        .str.decode('ascii')
+        .str.upper()
+        .str.replace(r'[^A-Z0-9]', '', regex=True)
+    )
+    return s.mask(s == '')
+
+
+def _on_uniques(series, transform):
+    """Applique `transform` aux seules valeurs distinctes (les noms se répètent beaucoup)"""
+    codes, uniques = pd.factorize(series)
+    values = transform(pd.Series(uniques)).to_numpy()
+    return pd.Series(pd.array(values, dtype='string')[codes], index=series.index).mask(codes < 0)
+
+
+def fold(series):
+    """Texte en majuscules sans accents, espaces ni ponctuation (NaN si vide)"""
+    return _on_uniques(series, _fold_text)
+
+
+def identity_keys(df):
+    """Clés normalisées (identité, email) ; NaN si un champ nécessaire manque"""
+    empty = pd.Series(pd.NA, index=df.index, dtype='string')
+    nom = fold(df['NOM']) if 'NOM' in df.columns else empty
+    prenom = fold(df['PRENOM']) if 'PRENOM' in df.columns else empty
+    birth = _on_uniques(
+        df['DATE DE NAISSANCE'],
+        lambda u: pd.to_datetime(u, errors='coerce').dt.strftime('%Y%m%d')
+    ) if 'DATE DE NAISSANCE' in df.columns else empty
+    email = _on_uniques(
+        df['EMAIL'],
+        lambda u: u.astype('string').str.strip().str.lower().replace('', pd.NA)
+    ) if 'EMAIL' in df.columns else empty
+    return nom + '|' + prenom + '|' + birth, email + '|' + prenom
+
+
+# Lignes témoins dont l'empreinte est conservée pour vérifier que l'export n'a
+# fait que s'allonger (toutes les lignes en dessous de ce nombre), et témoins
+# tirés au hasard parmi elles à chaque rechargement (plus la première et la dernière)
+N_PROBES = 100_000
+N_VERIFY = 1_000
+
+
+def row_hashes(df):
+    """Empreinte 64 bits des champs d'identité bruts de chaque ligne"""
+    columns = [c for c in IDENTITY_COLUMNS if c in df.columns]
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+
+
+def _probe_rows(start, n):
+    """Lignes témoins de [start, n[ à la densité de N_PROBES lignes pour n, dernière ligne comprise"""
+    if start >= n:
+        return np.zeros(0, dtype=np.int64)
+    step = -(-n // N_PROBES)
+    return np.unique(np.append(np.arange(start, n, step, dtype=np.int64), n - 1))
+
+
+def _group_min(codes, labels, n_groups, initial):
+    """Plus petit identifiant de chaque groupe (`initial` : identifiant préexistant ou grand nombre)"""
+    result = initial.copy()
+    valid = codes >= 0
+    np.minimum.at(result, codes[valid], labels[valid])
+    return result
+
+
+def _root(merged, runner):
+    """Racine de `runner` dans les fusions `merged` (identifiant → identifiant plus petit)"""
+    while runner in merged:
+        runner = merged[runner]
+    return runner
+
+
+class RunnerIndex:
+    """Index incrémental clé normalisée → coureur
+
+    Tables des clés, union-find et lignes témoins sont stockés en blocs
+    partagés (voir chunks.py) : une copie ne recopie que la liste des blocs
+    et le prolongement n'ajoute que ceux des nouvelles lignes.
+    """
+
+    _NONE = np.iinfo(np.int64).max
+
+    def __init__(self):
+        self.key_runner = [LayeredDict(), LayeredDict()]  # une table par type de clé
+        # Union-find sur les identifiants de coureur (numéro d'une de ses
+        # lignes) : coureur de chaque ligne à son ajout, en blocs, puis coureurs
+        # fusionnés depuis (ancienne racine → racine plus petite)
+        self.parent = ()
+        self.merged = LayeredDict()
+        self._rows = 0
+        self._probe_rows = ()
+        self._probe_hashes = ()
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def probe_rows(self):
+        return join_arrays(self._probe_rows, np.int64)
+
+    @property
+    def probe_hashes(self):
+        return join_arrays(self._probe_hashes, np.uint64)
+
+    def add_probes(self, rows, hashes):
+        """Ajoute des lignes témoins et leurs empreintes"""
+        self._probe_rows = append_chunk(self._probe_rows, np.asarray(rows, dtype=np.int64), concat_arrays)
+        self._probe_hashes = append_chunk(self._probe_hashes, np.asarray(hashes, dtype=np.uint64), concat_arrays)
+
+    def copy(self):
+        """Copie indépendante : la prolonger laisse l'index d'origine inchangé (blocs partagés)"""
+        index = RunnerIndex()
+        index.key_runner = list(self.key_runner)
+        index.parent = self.parent
+        index.merged = self.merged
+        index._rows = self._rows
+        index._probe_rows = self._probe_rows
+        index._probe_hashes = self._probe_hashes
+        return index
+
+    def find(self, runners=None):
+        """Racine (coureur actuel) de chaque identifiant, de chaque ligne indexée si `runners` est None"""
+        if runners is None:
+            roots = join_arrays(self.parent, np.int64)
+        else:
+            runners = np.asarray(runners, dtype=np.int64)
+            starts = np.cumsum([0] + [len(chunk) for chunk in self.parent])
+            which = np.searchsorted(starts, runners, side='right') - 1
+            roots = np.empty(len(runners), dtype=np.int64)
+            for k, chunk in enumerate(self.parent):
+                in_chunk = which == k
+                roots[in_chunk] = chunk[runners[in_chunk] - starts[k]]
+        merged = self.merged.to_dict()
+        if not merged or len(roots) == 0:
+            return roots
+        keys = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+        values = np.fromiter(merged.values(), dtype=np.int64, count=len(merged))
+        order = np.argsort(keys)
+        keys, values = keys[order], values[order]
+        # Chaînes de fusions (chaque fusion pointe vers un identifiant plus petit)
+        while True:
+            position = np.minimum(np.searchsorted(keys, roots), len(keys) - 1)
+            hit = keys[position] == roots
+            if not hit.any():
+                return roots
+            roots = np.where(hit, values[position], roots)
+
+    def extend(self, df_new):
+        """Rattache les lignes `df_new` (ajoutées après les lignes déjà indexées)"""
+        n = len(df_new)
+        if n == 0:
+            return
+        labels = self._rows + np.arange(n, dtype=np.int64)
+
+        groups = []
+        for table, keys in zip(self.key_runner, identity_keys(df_new)):
+            codes, uniques = pd.factorize(keys)
+            known = np.fromiter((table.get(k, -1) for k in uniques), dtype=np.int64, count=len(uniques))
+            existing = np.full(len(uniques), -1, dtype=np.int64)
+            existing[known >= 0] = self.find(known[known >= 0])
+            groups.append((table, codes, uniques, existing))
+
+        # Propagation du plus petit identifiant jusqu'à stabilité (composantes connexes)
+        while True:
+            previous = labels
+            for _, codes, uniques, existing in groups:
+                initial = np.where(existing >= 0, existing, self._NONE)
+                group_min = _group_min(codes, labels, len(uniques), initial)
+                valid = codes >= 0
+                labels = labels.copy()
+                labels[valid] = np.minimum(labels[valid], group_min[codes[valid]])
+            if np.array_equal(labels, previous):
+                break
+
+        # Nouveaux identifiants, fusion des coureurs existants réunis par une nouvelle ligne
+        merged = {}
+        tables = []
+        for table, codes, uniques, existing in groups:
+            group_label = _group_min(codes, labels, len(uniques), np.where(existing >= 0, existing, self._NONE))
+            joined = (existing >= 0) & (group_label != existing)
+            for old, label in zip(existing[joined].tolist(), group_label[joined].tolist()):
+                old, label = _root(merged, old), _root(merged, label)
+                if old != label:
+                    merged[max(old, label)] = min(old, label)
+            tables.append(table.updated(dict(zip(uniques, group_label.tolist()))))
+        self.key_runner = tables
+        self.parent = append_chunk(self.parent, labels, concat_arrays)
+        self.merged = self.merged.updated(merged)
+        self._rows += n
+
+    def runner_ids(self):
+        """Identifiant de coureur de chaque ligne indexée"""
+        return self.find()
+
+    def matches_prefix(self, df_reg, rng=None):
+        """Vrai si les lignes indexées sont toujours en tête de `df_reg`
+
+        Seul un échantillon des lignes témoins (N_VERIFY tirées au hasard, la
+        première et la dernière) est relu et comparé aux empreintes conservées.
+        """
+        if len(df_reg) < len(self):
+            return False
+        n_probes = len(self.probe_rows)
+        if n_probes == 0:
+            return len(self) == 0
+        rng = np.random.default_rng() if rng is None else rng
+        picks = np.unique(np.concatenate([
+            [0, n_probes - 1],
+            rng.choice(n_probes, min(N_VERIFY, n_probes), replace=False)
+        ]))
+        return np.array_equal(row_hashes(df_reg.iloc[self.probe_rows[picks]]), self.probe_hashes[picks])
+
+    @classmethod
+    def build(cls, df_reg, previous=None):
+        """Index des lignes de `df_reg`, prolongé depuis `previous` si l'export n'a fait que s'allonger
+
+        Les lignes déjà indexées sont contrôlées par échantillon plutôt que
+        relues (voir `matches_prefix`) ; leurs empreintes sont reprises et
+        seules les lignes témoins des nouvelles lignes sont hachées.
+        `previous` n'est pas modifié : les sessions qui lisent encore la
+        version précédente des données gardent un index cohérent.
+        """
+        if previous is not None and previous.matches_prefix(df_reg):
+            index = previous.copy()
+        else:
+            index = cls()
+        start = len(index)
+        index.extend(df_reg.iloc[start:])
+        rows = _probe_rows(start, len(df_reg))
+        index.add_probes(rows, row_hashes(df_reg.iloc[rows]))
+        return index
+
+
+def unique_runner_stats(runner_ids, is_paid):
+    """Coureurs distincts, coureurs ayant payé au moins une inscription et inscriptions en double"""
+    runner_ids = np.asarray(runner_ids)
+    if len(runner_ids) == 0:
+        return 0, 0, 0
+    codes, uniques = pd.factorize(runner_ids)
+    paid = np.zeros(len(uniques), dtype=bool)
+    paid[codes[np.asarray(is_paid, dtype=bool)]] = True
+    return len(uniques), int(paid.sum()), len(runner_ids) - len(uniques)
+
+
+def duplicate_groups(df_reg, column='runner_id'):
+    """Lignes appartenant à un coureur inscrit plusieurs fois, groupées par coureur"""
+    counts = df_reg[column].map(df_reg[column].value_counts())
+    return df_reg[counts > 1].sort_values([column, 'timestamp'])
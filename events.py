@@ -0,0 +1,362 @@
+"""Ingestion en direct des inscriptions depuis un flux d'événements local
+
+Chaque événement est un objet JSON portant les colonnes de l'export des
+inscriptions (« DATE INSCRIPTION », « PARCOURS », « PAIEMENT », « REF »...).
+Sources : fichier JSON lines en ajout seul (suivi comme un journal, seuls
+les octets ajoutés sont lus), socket Unix (un événement par ligne) ou file
+`queue.Queue` du même processus.
+
+Les événements sont regroupés en micro-lots à cadence fixe : un lot est
+préparé comme l'export (dates, parcours, indicateurs, géographie, tarifs),
+rattaché à l'index des coureurs et aux agrégats géographiques et tarifaires
+existants, puis publié comme nouvelle version des données (version de
+l'export et nombre d'inscriptions ajoutées, voir `split_version`). La table
+des inscriptions et l'index des coureurs sont stockés en blocs partagés
+entre versions (voir `LiveRegistrations`) : un lot ne traite et n'ajoute que
+ses propres lignes, et la version publiée précédente reste inchangée pour
+les sessions qui la lisent encore.
+
+Un événement dont la « REF » figure déjà dans l'export ou dans un lot
+appliqué est ignoré (REF comparées sous forme canonique, voir `event_keys`).
+Quand l'export CSV est rechargé, les événements déjà présents dans l'export
+sont oubliés et les autres réappliqués.
+"""
+import json
+import os
+import queue
+import socket
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from chunks import append_chunk
+from data import Dataset, prepare_registrations
+from dedup import row_hashes
+from geo import add_geography_columns
+from pricing import add_pricing_columns
+from timeslots import add_race_countdown
+
+# Cadence des micro-lots (secondes)
+BATCH_SECONDS = 2.0
+
+# Événements traités au plus par lot (le reste attend le lot suivant)
+MAX_BATCH_EVENTS = 50_000
+
+# Colonne identifiant une inscription dans l'export et dans les événements
+EVENT_KEY = 'REF'
+
+
+def _parse_lines(lines):
+    events = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(event, dict):
+            events.append(event)
+    return events
+
+
+class JsonlSource:
+    """Fichier JSON lines en ajout seul, lu à partir du dernier octet traité"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._offset = 0
+
+    def poll(self):
+        """Événements ajoutés depuis l'appel précédent (MAX_BATCH_EVENTS lignes au plus)"""
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return []
+        if size < self._offset:
+            # Fichier remplacé ou tronqué : nouveau journal
+            self._offset = 0
+        if size == self._offset:
+            return []
+        lines = []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            while len(lines) < MAX_BATCH_EVENTS:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    # Fin du fichier ou dernière ligne incomplète : relue à l'appel suivant
+                    break
+                lines.append(line)
+                self._offset += len(line)
+        return _parse_lines(b''.join(lines).decode('utf-8', errors='replace').splitlines())
+
+
+class QueueSource:
+    """File d'événements du même processus (dictionnaires ou lignes JSON)"""
+
+    def __init__(self, events=None):
+        self.queue = events if events is not None else queue.Queue()
+
+    def poll(self):
+        events = []
+        while len(events) < MAX_BATCH_EVENTS:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            events.extend(_parse_lines([event]) if isinstance(event, (str, bytes)) else [event])
+        return events
+
+
+class SocketSource(QueueSource):
+    """Socket Unix : chaque connexion envoie des événements JSON, un par ligne"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = str(path)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        self._server.listen()
+        threading.Thread(target=self._accept, name='events-socket', daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._read, args=(conn,), daemon=True).start()
+
+    def _read(self, conn):
+        with conn, conn.makefile('rb') as lines:
+            for line in lines:
+                self.queue.put(line.decode('utf-8', errors='replace'))
+
+    def close(self):
+        self._server.close()
+
+
+def source_from_spec(spec):
+    """Source décrite par `spec` : « unix:/chemin/socket » ou chemin d'un fichier JSON lines"""
+    if spec.startswith('unix:'):
+        return SocketSource(spec[len('unix:'):])
+    return JsonlSource(spec)
+
+
+def events_frame(events, raw_columns):
+    """Lot d'événements au format de l'export (colonnes absentes à NaN), colonnes dérivées comprises"""
+    df = pd.DataFrame.from_records(events).reindex(columns=raw_columns)
+    df = df[pd.to_datetime(df['DATE INSCRIPTION'], errors='coerce').notna()].reset_index(drop=True)
+    for column in raw_columns:
+        if df[column].isna().all() or df[column].dtype == object:
+            df[column] = df[column].astype('str').mask(df[column].isna())
+    prepare_registrations(df)
+    return df
+
+
+def event_keys(values):
+    """Clé canonique de « REF » : entier si la valeur est numérique (900000, 900000.0 ou "900000"), texte sans espaces sinon"""
+    values = pd.Series(values)
+    numbers = pd.to_numeric(values, errors='coerce')
+    integral = numbers.notna() & (numbers % 1 == 0)
+    keys = values.astype('string').str.strip()
+    keys[integral] = numbers[integral].astype('Int64').astype('string')
+    return keys.mask(keys == '')
+
+
+def live_version(base, live_rows):
+    """Version publiée : version de l'export et nombre d'inscriptions ajoutées depuis"""
+    return f"{base}+{live_rows}"
+
+
+def split_version(version):
+    """(version de l'export, nombre d'inscriptions en direct ajoutées à la fin de la table)"""
+    base, _, live_rows = str(version).partition('+')
+    return base, int(live_rows or 0)
+
+
+class LiveRegistrations:
+    """Inscriptions de l'export suivies des lots reçus en direct, stockées en blocs
+
+    L'export est partagé par toutes les versions publiées depuis son
+    chargement et les lots sont ajoutés sans recopier l'historique (voir
+    chunks.py) ; la table complète n'est assemblée qu'à sa première lecture,
+    identifiants de coureur à jour.
+    """
+
+    def __init__(self, export, chunks=(), runners=None, next_runner=None):
+        self.export = export
+        self.chunks = chunks
+        self.runners = runners
+        # Sans index des coureurs : identifiant du prochain nouveau coureur
+        self.next_runner = next_runner
+        self._frame = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.export) + sum(len(chunk) for chunk in self.chunks)
+
+    def append(self, df_new, runners, next_runner=None):
+        """Nouvelle version prolongée de `df_new` (celle-ci reste inchangée)"""
+        chunks = append_chunk(self.chunks, df_new, lambda a, b: pd.concat([a, b], ignore_index=True))
+        return LiveRegistrations(self.export, chunks, runners, next_runner)
+
+    def frame(self):
+        """Table complète (assemblée une fois)"""
+        with self._lock:
+            if self._frame is None:
+                df_reg = pd.concat([self.export, *self.chunks], ignore_index=True)
+                if self.runners is not None:
+                    # Coureurs de l'export éventuellement fusionnés par un lot
+                    df_reg['runner_id'] = self.runners.runner_ids()
+                self._frame = df_reg
+            return self._frame
+
+
+class LiveDataset(Dataset):
+    """Dataset prolongé par le flux d'événements : `reg` assemblée à la première lecture"""
+
+    __slots__ = ()
+
+    @property
+    def registrations(self):
+        return tuple.__getitem__(self, 1)
+
+    @property
+    def reg(self):
+        return self.registrations.frame()
+
+
+def registrations(dataset):
+    """Inscriptions de `dataset` en blocs (l'export seul pour un Dataset chargé depuis les fichiers)"""
+    if isinstance(dataset, LiveDataset):
+        return dataset.registrations
+    return LiveRegistrations(dataset.reg)
+
+
+def apply_events(dataset, df_new):
+    """Dataset prolongé des inscriptions préparées `df_new`
+
+    Coût proportionnel aux lignes ajoutées : l'export et les lots précédents
+    sont partagés avec `dataset`, qui reste inchangé.
+    """
+    if df_new.empty:
+        return dataset
+    current = registrations(dataset)
+    df_new = df_new.copy()
+    geo = dataset.geo.extend(df_new, add_geography_columns(df_new))
+    funnel = dataset.funnel.extend(df_new, add_pricing_columns(df_new))
+    add_race_countdown(df_new, dataset.race_day)
+    df_new = df_new[current.export.columns.intersection(df_new.columns)]
+
+    # Index prolongé sur une copie : la version publiée reste inchangée
+    runners = dataset.runners.copy() if dataset.runners is not None else None
+    next_runner = None
+    if runners is not None and len(runners) == len(current):
+        start = len(runners)
+        runners.extend(df_new)
+        df_new['runner_id'] = runners.find(start + np.arange(len(df_new)))
+        # Ligne témoin : au rechargement, l'index n'est prolongé que si l'export
+        # contient aussi ces inscriptions, à la même place
+        runners.add_probes([len(runners) - 1], row_hashes(df_new.iloc[[-1]]))
+    else:
+        # Pas d'index (version projetée depuis un autre processus) : nouveaux coureurs
+        runners = None
+        start = current.next_runner
+        if start is None:
+            start = int(current.export['runner_id'].max()) + 1 if len(current.export) else 0
+        df_new['runner_id'] = start + np.arange(len(df_new))
+        next_runner = start + len(df_new)
+    return LiveDataset(
+        dataset.insta, current.append(df_new, runners, next_runner), geo, dataset.race_day, runners, funnel
+    )
+
+
+class EventIngestor:
+    """Applique les micro-lots d'une source aux versions publiées par un DataWatcher"""
+
+    def __init__(self, watcher, source, interval=BATCH_SECONDS):
+        self.watcher = watcher
+        self.source = source
+        self.interval = interval
+        self.n_events = 0
+        self.last_error = None
+        self._buffer = []  # lots appliqués depuis le dernier rechargement de l'export
+        self._keys = set()  # clés (voir event_keys) de l'export et des événements appliqués
+        self._base = None  # version de l'export
+        self._published = None  # dernière version publiée
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='events-ingestor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def tick(self):
+        """Traite les événements en attente ; renvoie True si une version a été publiée"""
+        events = self.source.poll()
+        self.n_events += len(events)
+        return self.watcher.update(lambda snapshot: self._apply(snapshot, events))
+
+    def _apply(self, snapshot, events):
+        """(version, données) à publier, None si rien ne change"""
+        batch = events_frame(events, raw_columns(registrations(snapshot.data).export)) if events else None
+
+        reloaded = snapshot.version != self._published
+        if reloaded:
+            # Nouvel export chargé : seuls les événements absents de l'export sont réappliqués
+            self._base = snapshot.version
+            reg = snapshot.data.reg
+            self._keys = set(event_keys(reg[EVENT_KEY]).dropna()) if EVENT_KEY in reg.columns else set()
+            pending, self._buffer = self._buffer, []
+        else:
+            pending = []
+        if batch is not None:
+            pending.append(batch)
+        added = [b for b in map(self._unseen, pending) if len(b)]
+        if not added:
+            if reloaded:
+                self._published = snapshot.version
+            return None
+        self._buffer.extend(added)
+        df_new = pd.concat(added, ignore_index=True) if len(added) > 1 else added[0]
+
+        self._published = live_version(self._base, sum(len(b) for b in self._buffer))
+        return self._published, apply_events(snapshot.data, df_new)
+
+    def _unseen(self, batch):
+        """Lignes de `batch` dont la clé n'est ni dans l'export ni déjà appliquée (sans clé : conservées)"""
+        if EVENT_KEY not in batch.columns or batch.empty:
+            return batch
+        keep = np.ones(len(batch), dtype=bool)
+        for i, key in enumerate(event_keys(batch[EVENT_KEY]).tolist()):
+            if not isinstance(key, str):
+                continue
+            if key in self._keys:
+                keep[i] = False
+            else:
+                self._keys.add(key)
+        return batch if keep.all() else batch[keep].reset_index(drop=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+
+
+def raw_columns(df_reg):
+    """Colonnes de l'export (les colonnes calculées au chargement sont en minuscules)"""
+    return [c for c in df_reg.columns if c != c.lower()]
@@ -0,0 +1,124 @@
+"""Export groupé de toutes les analyses (archive ZIP en CSV et Parquet)
+
+Chaque table est écrite par blocs de lignes directement dans l'archive : la
+mémoire utilisée reste bornée par la taille d'un bloc, quelle que soit la
+taille de l'extrait. Les archives sont construites sur disque et conservées
+par état des filtres pour les téléchargements répétés.
+
+Le format Parquet nécessite pyarrow ; sans lui, l'archive ne contient que
+les CSV.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    pa = pq = None
+
+# Lignes par bloc écrit
+CHUNK_ROWS = 50_000
+
+# Archives conservées sur disque
+MAX_BUNDLES = 8
+
+PARQUET_AVAILABLE = pq is not None
+
+
+def iter_chunks(frame, chunk_rows=CHUNK_ROWS):
+    """Découpe une table en blocs de `chunk_rows` lignes"""
+    for start in range(0, max(len(frame), 1), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def _as_chunks(source):
+    """Blocs d'une table : DataFrame, itérable de DataFrames ou fonction renvoyant l'un des deux"""
+    if callable(source):
+        source = source()
+    if isinstance(source, pd.DataFrame):
+        return iter_chunks(source)
+    return iter(source)
+
+
+def _arrow_chunk(chunk):
+    # Colonnes texte en chaînes : schéma stable d'un bloc à l'autre
+    text = [c for c in chunk.columns if chunk[c].dtype == object]
+    return pa.Table.from_pandas(chunk.astype({c: 'string' for c in text}), preserve_index=False)
+
+
+def write_table(zf, name, source, parquet=PARQUET_AVAILABLE):
+    """Écrit une table dans l'archive, bloc par bloc, en CSV (et en Parquet)
+
+    Un fichier de l'archive est écrit à la fois : la source est parcourue
+    une fois par format (une fonction génératrice est rappelée).
+    """
+    with zf.open(f"csv/{name}.csv", 'w') as out:
+        for i, chunk in enumerate(_as_chunks(source)):
+            out.write(chunk.to_csv(index=False, header=(i == 0)).encode('utf-8'))
+    if not parquet:
+        return
+    with zf.open(f"parquet/{name}.parquet", 'w') as out:
+        writer = None
+        for chunk in _as_chunks(source):
+            table = _arrow_chunk(chunk)
+            if writer is None:
+                writer = pq.ParquetWriter(out, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is not None:
+            writer.close()
+
+
+def write_bundle(path, tables, parquet=PARQUET_AVAILABLE):
+    """Écrit l'archive `path` à partir de {nom: source} (voir `_as_chunks`)"""
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, source in tables.items():
+            write_table(zf, name, source, parquet)
+
+
+class BundleCache:
+    """Archives d'export sur disque, par état des filtres (LRU)"""
+
+    def __init__(self, max_bundles=MAX_BUNDLES, directory=None):
+        self.max_bundles = max_bundles
+        self.directory = directory or tempfile.mkdtemp(prefix='moe-export-')
+        self._paths = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, tables):
+        """Chemin de l'archive pour `key`, construite avec `tables()` si absente"""
+        with self._lock:
+            path = self._paths.get(key)
+            if path is not None and os.path.exists(path):
+                self._paths.move_to_end(key)
+                return path
+
+            # Construction sous verrou : un seul export à la fois, jamais en double
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix='.zip.tmp', dir=self.directory)
+            os.close(fd)
+            try:
+                write_bundle(tmp, tables())
+            except Exception:
+                os.remove(tmp)
+                raise
+            path = tmp[:-len('.tmp')]
+            os.replace(tmp, path)
+            self._paths[key] = path
+            while len(self._paths) > self.max_bundles:
+                _, evicted = self._paths.popitem(last=False)
+                if os.path.exists(evicted):
+                    os.remove(evicted)
+            return path
+
+    def clear(self):
+        """Supprime toutes les archives"""
+        with self._lock:
+            self._paths.clear()
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,215 @@
+"""Projection des inscriptions cumulées par parcours jusqu'au jour de la course
+
+Modèle : log(1 + inscriptions du jour) = tendance linéaire + effet jour de la
+semaine, ajusté par moindres carrés à oubli exponentiel (les semaines
+récentes pèsent le plus). Les statistiques suffisantes (X'WX, X'WY) sont
+mises à jour jour par jour : quand de nouvelles inscriptions arrivent, seuls
+les nouveaux jours complets sont intégrés. Tous les parcours sont ajustés en
+une seule résolution (une colonne de Y par parcours).
+
+Les intervalles de prévision viennent d'un bootstrap vectorisé des résidus
+journaliers (perturbation des coefficients et bruit des jours futurs).
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Demi-vie de l'oubli exponentiel (jours)
+FIT_HALF_LIFE_DAYS = 14
+
+# Jours de résidus conservés pour le bootstrap
+RESIDUAL_DAYS = 42
+
+# Tirages bootstrap et percentiles de l'intervalle de prévision
+N_BOOTSTRAP = 400
+INTERVAL_PERCENTILES = (5, 95)
+
+# Régularisation (jeux de données courts ou jours de la semaine absents)
+RIDGE = 1e-3
+
+# Modèles conservés (un par combinaison de filtres)
+MAX_MODELS = 64
+
+_N_FEATURES = 8  # constante, tendance, 6 indicatrices de jour de la semaine
+
+Forecast = namedtuple('Forecast', ['parcours', 'observed', 'dates', 'median', 'low', 'high'])
+
+
+def race_date_from(df_reg):
+    """Jour de la course déduit des émargements (jour le plus fréquent), None si absent"""
+    if 'DATE EMARGEMENT' not in df_reg.columns:
+        return None
+    days = pd.to_datetime(df_reg['DATE EMARGEMENT'], errors='coerce').dt.normalize().dropna()
+    return None if days.empty else days.mode().iloc[0]
+
+
+def daily_counts(timestamps, parcours, parcours_values, first_day, n_days):
+    """Inscriptions par jour calendaire × parcours (tableau n_days × n_parcours)"""
+    day = ((pd.to_datetime(timestamps) - first_day) // pd.Timedelta(days=1)).to_numpy()
+    series = np.searchsorted(parcours_values, parcours)
+    valid = (day >= 0) & (day < n_days) & (series < len(parcours_values))
+    valid &= parcours_values[np.minimum(series, len(parcours_values) - 1)] == parcours
+    flat = day[valid] * len(parcours_values) + series[valid]
+    counts = np.bincount(flat.astype(np.int64), minlength=n_days * len(parcours_values))
+    return counts.reshape(n_days, len(parcours_values))
+
+
+def design(days, first_weekday):
+    """Matrice de régression pour des indices de jours (depuis le premier jour)"""
+    days = np.asarray(days)
+    X = np.zeros((len(days), _N_FEATURES))
+    X[:, 0] = 1.0
+    X[:, 1] = days / 100.0
+    weekday = (first_weekday + days) % 7
+    nonzero = weekday > 0
+    X[np.flatnonzero(nonzero), 1 + weekday[nonzero]] = 1.0
+    return X
+
+
+class GrowthModel:
+    """Régression log-linéaire + saisonnalité hebdomadaire, mise à jour incrémentale"""
+
+    def __init__(self, first_day, n_series, half_life=FIT_HALF_LIFE_DAYS):
+        self.first_day = first_day
+        self.first_weekday = first_day.weekday()
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.xtx = np.zeros((_N_FEATURES, _N_FEATURES))
+        self.xty = np.zeros((_N_FEATURES, n_series))
+        self.folded = np.zeros((0, n_series), dtype=np.int64)
+
+    def compatible(self, first_day, counts):
+        """Vrai si les jours déjà intégrés sont inchangés dans `counts`"""
+        n = len(self.folded)
+        return (
+            first_day == self.first_day
+            and counts.shape[1] == self.folded.shape[1]
+            and len(counts) >= n
+            and np.array_equal(counts[:n], self.folded)
+        )
+
+    def update(self, counts):
+        """Intègre les jours complets de `counts` non encore vus ; renvoie leur nombre"""
+        n_old = len(self.folded)
+        new = counts[n_old:]
+        if len(new) == 0:
+            return 0
+        X = design(np.arange(n_old, len(counts)), self.first_weekday)
+        Y = np.log1p(new)
+        # Poids : le jour le plus récent vaut 1, les précédents décroissent
+        w = self.decay ** np.arange(len(new) - 1, -1, -1)
+        scale = self.decay ** len(new)
+        self.xtx = scale * self.xtx + (X * w[:, None]).T @ X
+        self.xty = scale * self.xty + (X * w[:, None]).T @ Y
+        self.folded = counts.copy()
+        return len(new)
+
+    def coefficients(self):
+        """Coefficients (n_features × n_series)"""
+        return np.linalg.solve(self.xtx + RIDGE * np.eye(_N_FEATURES), self.xty)
+
+    def forecast(self, horizon_days, skip_days=0, n_bootstrap=N_BOOTSTRAP, seed=0):
+        """Inscriptions futures simulées : tableau n_bootstrap × horizon × n_series
+
+        La projection commence `skip_days` jours après le dernier jour intégré.
+        """
+        n = len(self.folded)
+        beta = self.coefficients()
+
+        # Résidus des derniers jours et opérateur des moindres carrés pondérés
+        recent = np.arange(max(n - RESIDUAL_DAYS, 0), n)
+        X_recent = design(recent, self.first_weekday)
+        resid = np.log1p(self.folded[recent]) - X_recent @ beta
+        w = self.decay ** (n - 1 - recent)
+        gram = (X_recent * w[:, None]).T @ X_recent + RIDGE * np.eye(_N_FEATURES)
+        operator = np.linalg.solve(gram, (X_recent * w[:, None]).T)
+
+        rng = np.random.default_rng(seed)
+        # Bootstrap par jour : les parcours d'un même jour restent liés
+        draw = rng.integers(0, len(recent), (n_bootstrap, len(recent)))
+        beta_star = beta[None] + np.einsum('kd,bdp->bkp', operator, resid[draw])
+
+        X_future = design(np.arange(n + skip_days, n + skip_days + horizon_days), self.first_weekday)
+        noise = resid[rng.integers(0, len(recent), (n_bootstrap, horizon_days))]
+        log_rate = np.einsum('fk,bkp->bfp', X_future, beta_star) + noise
+        return np.clip(np.expm1(log_rate), 0, None)
+
+
+class ForecastCache:
+    """Modèles par combinaison de filtres et projections par (version, filtres)
+
+    Les modèles sont indexés sans la date de fin : une nouvelle version des
+    données prolonge le modèle existant au lieu de le réajuster entièrement.
+    """
+
+    def __init__(self, max_models=MAX_MODELS):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def projection(self, version, model_key, result_key, df_reg, race_day):
+        """Projection cumulée par parcours (Forecast), None si impossible"""
+        key = (version, result_key, race_day)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+
+        result = self._project(model_key, df_reg, race_day)
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_models:
+                self._results.popitem(last=False)
+        return result
+
+    def _project(self, model_key, df_reg, race_day):
+        ts = df_reg['timestamp'].dropna()
+        if ts.empty or race_day is None:
+            return None
+        first_day = ts.min().normalize()
+        last_day = ts.max().normalize()
+        horizon = (pd.Timestamp(race_day).normalize() - last_day).days
+        if horizon <= 0:
+            return None
+
+        parcours_values = np.sort(df_reg['parcours'].dropna().unique())
+        n_days = (last_day - first_day).days + 1
+        counts = daily_counts(df_reg['timestamp'], df_reg['parcours'].to_numpy(), parcours_values, first_day, n_days)
+        if n_days < 2:
+            return None
+
+        # Le dernier jour peut être incomplet : il compte dans le cumul observé
+        # mais n'est pas intégré à l'ajustement
+        complete = counts[:-1]
+        with self._lock:
+            model = self._models.get(model_key)
+            if model is None or not model.compatible(first_day, complete):
+                model = GrowthModel(first_day, len(parcours_values))
+            self._models[model_key] = model
+            self._models.move_to_end(model_key)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            model.update(complete)
+            simulated = model.forecast(horizon, skip_days=1)
+
+        # Premier point : cumul observé, pour raccorder la projection à la courbe
+        observed = counts.sum(axis=0)
+        cumulative = observed[None, None, :] + np.concatenate(
+            [np.zeros((len(simulated), 1, len(parcours_values))), np.cumsum(simulated, axis=1)],
+            axis=1
+        )
+        low, high = INTERVAL_PERCENTILES
+        return Forecast(
+            parcours=parcours_values,
+            observed=pd.DataFrame(
+                np.cumsum(counts, axis=0),
+                index=pd.date_range(first_day, periods=n_days),
+                columns=parcours_values
+            ),
+            dates=pd.date_range(last_day, periods=horizon + 1),
+            median=np.median(cumulative, axis=0),
+            low=np.percentile(cumulative, low, axis=0),
+            high=np.percentile(cumulative, high, axis=0),
+        )
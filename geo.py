@@ -0,0 +1,244 @@
+"""Géographie des inscrits : normalisation et agrégats précalculés par région
+
+Les champs DEPARTEMENT (CODE), DEPARTEMENT (NOM), CODE POSTAL, VILLE et PAYS
+sont normalisés une fois au chargement et codés en entiers. Un tableau
+compact jour × parcours × statut de paiement × région est ensuite construit
+pour les départements et pour les pays : une vue géographique filtrée ne
+coûte plus que O(régions).
+"""
+import json
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+# Contours simplifiés des départements (propriétés `code` et `nom`), source
+# publique proposée pour MOE_GEOJSON_URL (jamais téléchargée par défaut)
+DEPARTEMENTS_GEOJSON_URL = (
+    "https://raw.githubusercontent.com/gregoiredavid/france-geojson/master/"
+    "departements-version-simplifiee.geojson"
+)
+
+# Pays saisis en français → code ISO 3166-1 alpha-3 (carte des pays)
+PAYS_ISO3 = {
+    'France': 'FRA', 'Belgique': 'BEL', 'Suisse': 'CHE', 'Espagne': 'ESP', 'Italie': 'ITA',
+    'Allemagne': 'DEU', 'Pays-Bas': 'NLD', 'Luxembourg': 'LUX', 'Monaco': 'MCO',
+    'Royaume-Uni': 'GBR', 'Irlande': 'IRL', 'Portugal': 'PRT', 'Autriche': 'AUT',
+    'Etats-Unis': 'USA', 'États-Unis': 'USA', 'Canada': 'CAN', 'Maroc': 'MAR',
+    'Algérie': 'DZA', 'Tunisie': 'TUN', 'Suède': 'SWE', 'Norvège': 'NOR', 'Danemark': 'DNK',
+    'Pologne': 'POL', 'Australie': 'AUS', 'Brésil': 'BRA', 'Japon': 'JPN', 'Colombie': 'COL',
+}
+
+LEVELS = {
+    'departement': "Département",
+    'pays': "Pays",
+}
+
+_DEPT_CODE_RE = r'^(?:\d{2}|2[AB]|97\d)$'
+
+
+def _clean(series):
+    """Texte sans espaces superflus, chaînes vides → NaN"""
+    s = series.astype('string').str.strip()
+    return s.mask(s == '')
+
+
+def departement_from_postal_code(postal):
+    """Code département déduit du code postal français (Corse et outre-mer compris)"""
+    postal = postal.str.zfill(5)
+    dept = postal.str[:2]
+    dept = dept.mask(postal.str[:2] == '97', postal.str[:3])
+    corse = postal.str[:2] == '20'
+    dept = dept.mask(corse & (postal.str[:3] < '202'), '2A')
+    dept = dept.mask(corse & (postal.str[:3] >= '202'), '2B')
+    return dept
+
+
+def add_geography_columns(df_reg):
+    """Ajoute les colonnes géographiques normalisées et leurs codes entiers
+
+    Colonnes ajoutées : pays, code_postal, ville, departement_code,
+    departement_nom (NaN hors de France), dept_idx et pays_idx (-1 si inconnu).
+    Renvoie les libellés de chaque code : (départements, pays).
+    """
+    pays = _clean(df_reg['PAYS']).fillna('Inconnu') if 'PAYS' in df_reg.columns else pd.Series('France', index=df_reg.index)
+    pays = pays.str.title().replace({'Etats-Unis': 'États-Unis'})
+    in_france = (pays == 'France').to_numpy()
+
+    postal = _clean(df_reg['CODE POSTAL'].astype('string').str.replace(r'\.0$', '', regex=True).str.replace(' ', '')) \
+        if 'CODE POSTAL' in df_reg.columns else pd.Series(pd.NA, index=df_reg.index, dtype='string')
+    postal_fr = postal.where(postal.str.fullmatch(r'\d{4,5}').fillna(False)).str.zfill(5)
+
+    dept = _clean(df_reg['DEPARTEMENT (CODE)'].astype('string').str.replace(r'\.0$', '', regex=True)) \
+        if 'DEPARTEMENT (CODE)' in df_reg.columns else pd.Series(pd.NA, index=df_reg.index, dtype='string')
+    dept = dept.where(~dept.str.fullmatch(r'\d').fillna(False), dept.str.zfill(2)).str.upper()
+    dept = dept.where(dept.str.fullmatch(_DEPT_CODE_RE).fillna(False))
+    dept = dept.fillna(departement_from_postal_code(postal_fr))
+    dept = dept.where(in_france)
+
+    nom = _clean(df_reg['DEPARTEMENT (NOM)']) if 'DEPARTEMENT (NOM)' in df_reg.columns else pd.Series(pd.NA, index=df_reg.index, dtype='string')
+    # Un seul libellé par code : le plus fréquent dans les données
+    names = (
+        pd.DataFrame({'code': dept, 'nom': nom})
+        .dropna()
+        .value_counts()
+        .reset_index()
+        .drop_duplicates('code')
+        .set_index('code')['nom']
+    )
+
+    df_reg['pays'] = pays.astype(str)
+    df_reg['code_postal'] = postal
+    df_reg['ville'] = _clean(df_reg['VILLE']).str.upper() if 'VILLE' in df_reg.columns else pd.NA
+    df_reg['departement_code'] = dept
+    df_reg['departement_nom'] = dept.map(names).fillna(dept)
+
+    dept_idx, dept_codes = pd.factorize(dept, sort=True)
+    pays_idx, pays_labels = pd.factorize(df_reg['pays'], sort=True)
+    df_reg['dept_idx'] = dept_idx.astype(np.int16)
+    df_reg['pays_idx'] = pays_idx.astype(np.int16)
+
+    dept_labels = pd.DataFrame({
+        'code': np.asarray(dept_codes, dtype=object),
+        'nom': [names.get(c, c) for c in dept_codes]
+    })
+    pays_labels = pd.DataFrame({
+        'code': [PAYS_ISO3.get(p) for p in pays_labels],
+        'nom': np.asarray(pays_labels, dtype=object)
+    })
+    return dept_labels, pays_labels
+
+
+class GeoRollup:
+    """Inscriptions par jour × parcours × statut de paiement × région
+
+    Un tableau int32 par niveau (départements, pays), construit en une passe
+    de bincount ; chaque requête se limite à un découpage et une somme.
+    """
+
+    def __init__(self, counts, labels, first_day, parcours_values):
+        self.counts = counts
+        self.labels = labels
+        self.first_day = first_day
+        self.parcours_values = parcours_values
+
+    @classmethod
+    def from_frame(cls, df_reg, labels):
+        """Construit les agrégats à partir des colonnes ajoutées par add_geography_columns"""
+        dates = pd.to_datetime(df_reg['date'])
+        first_day = dates.min().normalize() if len(dates) else pd.Timestamp('1970-01-01')
+        day = ((dates - first_day).dt.days).fillna(-1).to_numpy(dtype=np.int64)
+        parcours_idx, parcours_values = pd.factorize(df_reg['parcours'], sort=True)
+        paid = df_reg['is_paid'].to_numpy(dtype=np.int64)
+
+        n_days = int(day.max()) + 1 if len(day) else 0
+        n_parcours = len(parcours_values)
+        valid_base = (day >= 0) & (parcours_idx >= 0)
+
+        counts = {}
+        for level, column in (('departement', 'dept_idx'), ('pays', 'pays_idx')):
+            region = df_reg[column].to_numpy(dtype=np.int64)
+            n_regions = len(labels[level])
+            valid = valid_base & (region >= 0)
+            shape = (n_days, n_parcours, 2, n_regions)
+            flat = np.ravel_multi_index(
+                (day[valid], parcours_idx[valid], paid[valid], region[valid]),
+                shape
+            ) if n_regions and n_days else np.zeros(0, dtype=np.int64)
+            counts[level] = np.bincount(flat, minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+
+        return cls(counts, labels, first_day, np.asarray(parcours_values, dtype=float))
+
+    def extend(self, df_new, new_labels):
+        """Agrégats prolongés des lignes `df_new` (nouvel objet, l'actuel reste inchangé)
+
+        `df_new` porte les colonnes de add_geography_columns et `new_labels`
+        ses libellés locaux : les codes de `df_new` sont réécrits en place
+        vers les libellés existants, complétés des régions nouvelles. Coût
+        proportionnel aux nouvelles lignes et à la taille des agrégats, pas à
+        l'historique des inscriptions.
+        """
+        labels = {}
+        for (level, column, key), local in zip(
+            (('departement', 'dept_idx', 'code'), ('pays', 'pays_idx', 'nom')),
+            new_labels
+        ):
+            known = self.labels[level]
+            position = pd.Index(known[key]).get_indexer(local[key])
+            added = local[position < 0]
+            position[position < 0] = len(known) + np.arange(len(added))
+            labels[level] = pd.concat([known, added], ignore_index=True)
+            idx = df_new[column].to_numpy(dtype=np.int64)
+            df_new[column] = np.where(idx >= 0, position[np.maximum(idx, 0)] if len(position) else -1, -1).astype(np.int16)
+        # Libellé de département existant pour les codes déjà connus
+        df_new['departement_nom'] = df_new['departement_nom'].astype(object).where(
+            df_new['dept_idx'] < 0,
+            labels['departement']['nom'].to_numpy()[np.maximum(df_new['dept_idx'].to_numpy(), 0)]
+        )
+
+        dates = pd.to_datetime(df_new['date'])
+        first_day = min(self.first_day, dates.min().normalize()) if dates.notna().any() else self.first_day
+        parcours_values = np.union1d(self.parcours_values, df_new['parcours'].dropna().to_numpy(dtype=float))
+        day = (dates - first_day).dt.days.fillna(-1).to_numpy(dtype=np.int64)
+        n_days = max(
+            (self.first_day - first_day).days + next(iter(self.counts.values())).shape[0],
+            int(day.max()) + 1 if len(day) else 0
+        )
+        offset = (self.first_day - first_day).days
+        old_parcours = np.searchsorted(parcours_values, self.parcours_values)
+        parcours_idx = np.searchsorted(parcours_values, df_new['parcours'].to_numpy(dtype=float))
+        valid_base = (day >= 0) & df_new['parcours'].notna().to_numpy()
+        paid = df_new['is_paid'].to_numpy(dtype=np.int64)
+
+        counts = {}
+        for level, column in (('departement', 'dept_idx'), ('pays', 'pays_idx')):
+            old = self.counts[level]
+            shape = (n_days, len(parcours_values), 2, len(labels[level]))
+            grown = np.zeros(shape, dtype=np.int32)
+            grown[offset:offset + old.shape[0], old_parcours, :, :old.shape[3]] = old
+            region = df_new[column].to_numpy(dtype=np.int64)
+            valid = valid_base & (region >= 0)
+            np.add.at(grown, (day[valid], parcours_idx[valid], paid[valid], region[valid]), 1)
+            counts[level] = grown
+        return GeoRollup(counts, labels, first_day, parcours_values)
+
+    def query(self, level='departement', start_date=None, end_date=None, parcours=None, paid=None):
+        """Inscriptions par région pour une période, un parcours et un statut de paiement
+
+        `paid` : None (tous), True (payés) ou False (non payés).
+        """
+        counts = self.counts[level]
+        n_days = counts.shape[0]
+        start = 0 if start_date is None else max((pd.Timestamp(start_date) - self.first_day).days, 0)
+        end = n_days if end_date is None else min((pd.Timestamp(end_date) - self.first_day).days + 1, n_days)
+        counts = counts[start:max(end, start)]
+
+        if parcours is not None:
+            counts = counts[:, self.parcours_values == parcours]
+        if paid is not None:
+            counts = counts[:, :, [int(bool(paid))]]
+
+        table = self.labels[level].copy()
+        table['inscriptions'] = counts.sum(axis=(0, 1, 2))
+        return table[table['inscriptions'] > 0].sort_values('inscriptions', ascending=False)
+
+
+def region_counts(df_reg, labels, level='departement'):
+    """Inscriptions par région d'un sous-ensemble quelconque de lignes (bincount sur les codes)"""
+    column = 'dept_idx' if level == 'departement' else 'pays_idx'
+    idx = df_reg[column].to_numpy(dtype=np.int64)
+    table = labels[level].copy()
+    table['inscriptions'] = np.bincount(idx[idx >= 0], minlength=len(table))
+    return table[table['inscriptions'] > 0].sort_values('inscriptions', ascending=False)
+
+
+def load_departements_geojson(source, timeout=5):
+    """Contours des départements depuis une URL ou un fichier local, None si indisponibles"""
+    try:
+        if '://' not in source:
+            with open(source, encoding='utf-8') as f:
+                return json.load(f)
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            return json.load(response)
+    except Exception:
+        return None
@@ -0,0 +1,284 @@
+"""Analyse de l'impact des posts Instagram sur les inscriptions"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Fenêtres d'analyse standard après chaque post (heures de début et de fin)
+IMPACT_WINDOWS = {
+    "0-24h": (0, 24),
+    "24-48h": (24, 48),
+    "48-72h": (48, 72),
+}
+
+# Baseline : même jour de la semaine sur ±4 semaines, hors ±72h autour du post
+BASELINE_WEEKS = 4
+BASELINE_EXCLUSION_HOURS = 72
+
+# Statuts de paiement précalculés
+PAYMENT_STATUSES = ("Tous", "Payé", "Non payé")
+
+_HOUR = np.timedelta64(1, 'h').astype('timedelta64[ns]').astype(np.int64)
+_WEEK = 7 * 24 * _HOUR
+
+
+def _ns(values):
+    """Timestamps en entiers int64 (nanosecondes)"""
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+class RegistrationIndex:
+    """Timestamps d'inscription triés, globalement et par jour de la semaine
+
+    Chaque comptage sur un intervalle se ramène à deux recherches
+    dichotomiques, quel que soit le nombre d'inscriptions.
+    """
+
+    def __init__(self, timestamps):
+        ts = pd.to_datetime(pd.Series(timestamps)).dropna()
+        self.sorted_ns = np.sort(_ns(ts))
+        weekdays = ts.dt.weekday.to_numpy()
+        ns = _ns(ts)
+        self.by_weekday = [np.sort(ns[weekdays == d]) for d in range(7)]
+
+    @staticmethod
+    def _count(sorted_ns, start, end, right_closed=False):
+        side = 'right' if right_closed else 'left'
+        return np.searchsorted(sorted_ns, end, side=side) - np.searchsorted(sorted_ns, start, side='left')
+
+    def window_counts(self, post_ns, start_hours, end_hours):
+        """Inscriptions dans [post + début, post + fin[ pour chaque post"""
+        return self._count(self.sorted_ns, post_ns + start_hours * _HOUR, post_ns + end_hours * _HOUR)
+
+    def baseline_counts(self, post_ns, post_weekdays):
+        """Inscriptions du même jour de la semaine sur ±4 semaines, hors ±72h"""
+        counts = np.zeros(len(post_ns), dtype=np.int64)
+        for d in range(7):
+            mask = post_weekdays == d
+            if not mask.any():
+                continue
+            ts = self.by_weekday[d]
+            t = post_ns[mask]
+            around = self._count(ts, t - BASELINE_WEEKS * _WEEK, t + BASELINE_WEEKS * _WEEK, right_closed=True)
+            excluded = self._count(
+                ts,
+                t - BASELINE_EXCLUSION_HOURS * _HOUR,
+                t + BASELINE_EXCLUSION_HOURS * _HOUR,
+                right_closed=True
+            )
+            counts[mask] = around - excluded
+        return counts
+
+
+def compute_impact(df_insta, reg_timestamps, start_hours, end_hours, index=None):
+    """Tableau d'impact par post pour une fenêtre donnée
+
+    `reg_timestamps` : timestamps des inscriptions retenues ; un
+    `RegistrationIndex` déjà construit peut être passé via `index`.
+    """
+    if index is None:
+        index = RegistrationIndex(reg_timestamps)
+
+    post_ts = pd.to_datetime(df_insta['timestamp'])
+    post_ns = _ns(post_ts)
+    inscriptions = index.window_counts(post_ns, start_hours, end_hours)
+    baseline = index.baseline_counts(post_ns, post_ts.dt.weekday.to_numpy()) / (2 * BASELINE_WEEKS)
+
+    return pd.DataFrame({
+        'date_post': post_ts.dt.date.to_numpy(),
+        'type': df_insta['Type'].to_numpy(),
+        'titre': df_insta['Titre'].to_numpy(),
+        'vues': df_insta['Vues'].to_numpy(),
+        'likes': df_insta['Likes'].to_numpy(),
+        'inscriptions_window': inscriptions,
+        'baseline': baseline,
+        **_deltas(inscriptions, baseline)
+    }, index=df_insta.index)
+
+
+def _deltas(inscriptions, baseline):
+    delta = inscriptions - baseline
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_pct = np.where(baseline > 0, delta / baseline * 100, 0.0)
+    return {'delta': delta, 'delta_pct': delta_pct}
+
+
+def add_impact(df_impact, df_added):
+    """Tableau d'impact `df_impact` complété des comptages de `df_added`
+    (mêmes posts, inscriptions supplémentaires)"""
+    inscriptions = df_impact['inscriptions_window'].to_numpy() + df_added['inscriptions_window'].to_numpy()
+    baseline = df_impact['baseline'].to_numpy() + df_added['baseline'].to_numpy()
+    return df_impact.assign(inscriptions_window=inscriptions, baseline=baseline, **_deltas(inscriptions, baseline))
+
+
+def registration_subset(df_reg, parcours=None, paiement="Tous"):
+    """Inscriptions d'un parcours (None = tous) et d'un statut de paiement"""
+    mask = np.ones(len(df_reg), dtype=bool)
+    if parcours is not None:
+        mask &= (df_reg['parcours'] == parcours).to_numpy()
+    if paiement == "Payé":
+        mask &= df_reg['is_paid'].to_numpy()
+    elif paiement == "Non payé":
+        mask &= ~df_reg['is_paid'].to_numpy()
+    return df_reg.loc[mask, 'timestamp']
+
+
+class ImpactPrecompute:
+    """Précalcul concurrent de la grille d'impact après chaque chargement de données
+
+    Pour une version des données, calcule en tâche de fond l'impact de tous
+    les posts pour chaque fenêtre × parcours × statut de paiement. L'onglet
+    Impact lit le résultat s'il est prêt (ou l'attend s'il est en cours).
+    Les inscriptions reçues ensuite (flux en direct) ne relancent pas la
+    grille : elles sont comptées à part et ajoutées à la lecture.
+    """
+
+    def __init__(self, workers=2, windows=None):
+        self.windows = dict(windows or IMPACT_WINDOWS)
+        self.enabled = workers > 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='impact') if self.enabled else None
+        self._version = None
+        self._insta = None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def warm(self, version, df_insta, df_reg):
+        """Lance le calcul de la grille pour `version` (sans effet si déjà lancé)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            for future in self._futures.values():
+                future.cancel()
+            self._version = version
+            self._insta = df_insta
+            self._futures = {}
+
+            parcours_values = [None] + sorted(df_reg['parcours'].dropna().unique().tolist())
+            for parcours in parcours_values:
+                for paiement in PAYMENT_STATUSES:
+                    self._futures[(parcours, paiement)] = self._executor.submit(
+                        self._compute_subset, df_insta, df_reg, parcours, paiement
+                    )
+
+    def _compute_subset(self, df_insta, df_reg, parcours, paiement):
+        index = RegistrationIndex(registration_subset(df_reg, parcours, paiement))
+        return {
+            bounds: compute_impact(df_insta, None, *bounds, index=index)
+            for bounds in self.windows.values()
+        }
+
+    def get(self, version, parcours, paiement, bounds, added=None):
+        """Tableau d'impact précalculé, ou None si absent de la grille
+
+        `added` : timestamps des inscriptions du sous-ensemble ajoutées depuis
+        le calcul de la grille.
+        """
+        with self._lock:
+            if version != self._version:
+                return None
+            future = self._futures.get((parcours, paiement))
+            df_insta = self._insta
+        if future is None or future.cancelled():
+            return None
+        df_impact = future.result().get(bounds)
+        if df_impact is None or added is None or len(added) == 0:
+            return df_impact
+        return add_impact(df_impact, compute_impact(df_insta, added, *bounds))
+
+
+# Noyaux d'attribution : décroissance exponentielle ou fenêtre fixe
+ATTRIBUTION_KERNELS = {
+    "Exponentielle": 'exp',
+    "Fenêtre fixe": 'step',
+}
+
+# Tables d'attribution conservées (par version, filtres et paramètres du noyau)
+MAX_ATTRIBUTIONS = 16
+
+
+def decay_weights(lag_hours, kernel='exp', half_life=24.0, horizon=72.0):
+    """Poids d'un post selon le délai (heures) entre sa publication et l'inscription"""
+    lag_hours = np.asarray(lag_hours, dtype=float)
+    if kernel == 'exp':
+        weights = np.power(0.5, lag_hours / half_life)
+    else:
+        weights = np.ones_like(lag_hours)
+    return np.where((lag_hours >= 0) & (lag_hours < horizon), weights, 0.0)
+
+
+def attribute_registrations(post_timestamps, reg_timestamps, kernel='exp', half_life=24.0, horizon=72.0):
+    """Répartit chaque inscription entre les posts publiés dans les `horizon` heures précédentes
+
+    Chaque inscription apporte un crédit total de 1, partagé entre les posts
+    qui la précèdent proportionnellement au noyau de décroissance : la somme
+    des crédits ne compte donc jamais deux fois une inscription. Les couples
+    (post, inscription) sont construits par recherche dichotomique, ce qui
+    revient à une matrice creuse posts × inscriptions réduite par bincount.
+
+    Renvoie le crédit de chaque post (dans l'ordre de `post_timestamps`) et le
+    nombre d'inscriptions sans post dans l'horizon.
+    """
+    post_ns = _ns(post_timestamps)
+    reg_ns = _ns(pd.Series(reg_timestamps).dropna())
+    order = np.argsort(post_ns, kind='stable')
+    sorted_posts = post_ns[order]
+
+    # Posts publiés dans ]inscription - horizon, inscription]
+    hi = np.searchsorted(sorted_posts, reg_ns, side='right')
+    lo = np.searchsorted(sorted_posts, reg_ns - int(horizon * _HOUR), side='right')
+    n_pairs = hi - lo
+
+    reg_idx = np.repeat(np.arange(len(reg_ns)), n_pairs)
+    first = np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+    post_pos = np.repeat(lo, n_pairs) + np.arange(len(reg_idx)) - first
+
+    lag = (reg_ns[reg_idx] - sorted_posts[post_pos]) / _HOUR
+    weights = decay_weights(lag, kernel, half_life, horizon)
+    norm = np.bincount(reg_idx, weights=weights, minlength=len(reg_ns))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(norm[reg_idx] > 0, weights / norm[reg_idx], 0.0)
+
+    credit = np.empty(len(post_ns), dtype=float)
+    credit[order] = np.bincount(post_pos, weights=share, minlength=len(post_ns))
+    unattributed = int(len(reg_ns) - np.count_nonzero(norm))
+    return credit, unattributed
+
+
+def attribution_table(df_insta, reg_timestamps, kernel='exp', half_life=24.0, horizon=72.0):
+    """Inscriptions attribuées à chaque post et nombre d'inscriptions non attribuées"""
+    credit, unattributed = attribute_registrations(
+        df_insta['timestamp'], reg_timestamps, kernel, half_life, horizon
+    )
+    table = pd.DataFrame({
+        'date_post': pd.to_datetime(df_insta['timestamp']).dt.date.to_numpy(),
+        'type': df_insta['Type'].to_numpy(),
+        'titre': df_insta['Titre'].to_numpy(),
+        'inscriptions_attribuees': credit
+    }, index=df_insta.index)
+    return table, unattributed
+
+
+class AttributionCache:
+    """Tables d'attribution par (version, filtres, noyau...), partagées entre sessions"""
+
+    def __init__(self, max_entries=MAX_ATTRIBUTIONS):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """(table, non attribuées) pour `key`, calculé avec `build()` si absent"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        entry = build()
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
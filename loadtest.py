@@ -0,0 +1,180 @@
+"""Test de charge : sessions simultanées simulées avec le harnais AppTest de Streamlit
+
+Chaque session se connecte via le formulaire `login_form` puis enchaîne des
+interactions aléatoires (filtres de la barre latérale, fenêtre d'impact,
+filtres de l'Explorer, dimension de l'onglet Charts). Le rapport donne les
+percentiles de latence des reruns, le débit et la mémoire de chaque processus.
+
+AppTest n'étant pas thread-safe (compilation du script à chaque rerun), les
+reruns des sessions d'un même processus sont sérialisés par un verrou : les
+sessions partagent les caches du processus comme sur un serveur réel, et le
+temps de réponse inclut l'attente derrière les autres sessions. Le
+parallélisme réel s'obtient avec plusieurs processus (`--processes`).
+
+Usage :
+    python loadtest.py --sessions 8 --iterations 20 --registrations 50000 --posts 500
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent
+APP_PATH = APP_DIR / "app.py"
+
+# Un seul rerun AppTest à la fois par processus
+_RUN_LOCK = threading.Lock()
+
+
+def peak_rss_mb():
+    """Mémoire résidente maximale du processus courant (Mo), None si indisponible"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def find_widget(at, kind, label):
+    """Premier widget d'un type donné portant ce libellé"""
+    for widget in getattr(at, kind):
+        if widget.label == label:
+            return widget
+    raise LookupError(f"{kind} '{label}' introuvable")
+
+
+def timed_run(at):
+    """Rerun de la session ; renvoie (temps de service, temps de réponse) en secondes"""
+    requested = time.perf_counter()
+    with _RUN_LOCK:
+        started = time.perf_counter()
+        at.run()
+        finished = time.perf_counter()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return finished - started, finished - requested
+
+
+def login(at, username, password):
+    """Connexion par le formulaire de la page d'accueil"""
+    timings = [timed_run(at)]
+    find_widget(at, 'text_input', "Nom d'utilisateur").input(username)
+    find_widget(at, 'text_input', "Mot de passe").input(password)
+    find_widget(at, 'button', "Se connecter").click()
+    timings.append(timed_run(at))
+    if not at.session_state['authenticated']:
+        raise RuntimeError("Échec de la connexion")
+    return timings
+
+
+# Interactions simulées : (type de widget, libellé, valeurs possibles)
+ACTIONS = [
+    ('selectbox', "Parcours", ['Tous', '5K', '12K', '21K']),
+    ('radio', "Paiement", ["Tous", "Payé", "Non payé"]),
+    ('selectbox', "Période d'analyse après chaque post", ["0-24h", "24-48h", "48-72h", "0-72h"]),
+    ('multiselect', "Parcours", [[], [5.0], [12.0], [21.0], [5.0, 21.0]]),
+    ('selectbox', "Dimension", ['parcours', 'date', 'is_paid']),
+]
+
+
+def run_session(session_id, iterations, timeout, username, password, seed):
+    """Une session complète ; renvoie les (temps de service, temps de réponse) de chaque rerun"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + session_id)
+    at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+    latencies = login(at, username, password)
+
+    for _ in range(iterations):
+        kind, label, values = rng.choice(ACTIONS)
+        try:
+            widget = find_widget(at, kind, label)
+        except LookupError:
+            continue
+        value = rng.choice(values)
+        if kind == 'multiselect':
+            # Options affichées sous la forme « 12K »
+            widget.set_value([v for v in value if f"{int(v)}K" in widget.options])
+        else:
+            widget.set_value(value if value in widget.options else widget.options[0])
+
+        latencies.append(timed_run(at))
+    return latencies
+
+
+def run_process(sessions, iterations, timeout, username, password, seed, data_dir):
+    """Lance `sessions` sessions simultanées dans le processus courant"""
+    os.chdir(data_dir)
+    sys.path.insert(0, str(APP_DIR))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, i, iterations, timeout, username, password, seed)
+            for i in range(sessions)
+        ]
+        latencies = [lat for future in futures for lat in future.result()]
+    wall = time.perf_counter() - start
+    return latencies, wall, peak_rss_mb()
+
+
+def report(results):
+    """Affiche percentiles de latence, débit et mémoire par processus"""
+    latencies = np.array([lat for lats, _, _ in results for lat in lats]) * 1000
+    wall = max(w for _, w, _ in results)
+    print(f"Reruns : {len(latencies)} en {wall:.1f} s, débit {len(latencies) / wall:.1f} reruns/s")
+    print(f"{'':6}{'service':>10}{'réponse':>10}")
+    for p in (50, 95, 99):
+        service, response = np.percentile(latencies, p, axis=0)
+        print(f"  p{p:<3}{service:>8.0f} ms{response:>7.0f} ms")
+    service, response = latencies.max(axis=0)
+    print(f"  max {service:>8.0f} ms{response:>7.0f} ms")
+    for i, (_, _, rss) in enumerate(results):
+        print(f"Processus {i} : mémoire max {rss:.0f} Mo" if rss is not None else f"Processus {i} : mémoire indisponible")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=4, help="sessions simultanées par processus")
+    parser.add_argument('--processes', type=int, default=1, help="processus indépendants (un serveur chacun)")
+    parser.add_argument('--iterations', type=int, default=10, help="interactions par session")
+    parser.add_argument('--registrations', type=int, default=20000, help="taille du jeu d'inscriptions synthétique")
+    parser.add_argument('--posts', type=int, default=300, help="nombre de posts synthétiques")
+    parser.add_argument('--data-dir', help="répertoire contenant des CSV existants (sinon jeu synthétique)")
+    parser.add_argument('--timeout', type=float, default=120, help="délai maximal d'un rerun (s)")
+    parser.add_argument('--username', default="admin")
+    parser.add_argument('--password', default="AdminMOE13")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir
+        if data_dir is None:
+            from synthetic_data import write_dataset
+            write_dataset(tmp, args.registrations, args.posts, seed=args.seed)
+            data_dir = tmp
+            print(f"Jeu synthétique : {args.registrations} inscriptions, {args.posts} posts")
+        data_dir = str(Path(data_dir).resolve())
+
+        job = (args.sessions, args.iterations, args.timeout, args.username, args.password, args.seed, data_dir)
+        if args.processes == 1:
+            results = [run_process(*job)]
+        else:
+            with ProcessPoolExecutor(max_workers=args.processes) as pool:
+                results = list(pool.map(run_process, *zip(*[job] * args.processes)))
+
+    print(f"{args.processes} processus × {args.sessions} sessions × {args.iterations} interactions")
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Contrôle des régressions de performance, onglet par onglet, avec le harnais AppTest
+
+Le tableau de bord est exécuté hors ligne sur un jeu synthétique fixe. Pour
+chaque onglet, un scénario parcourt les valeurs de ses propres widgets
+(granularité, fenêtre d'impact, dimension...) : les autres onglets lisent
+leurs caches, chaque rerun mesure donc surtout le calcul de l'onglet. La
+médiane des temps de rerun et le pic de mémoire résidente au-dessus du
+niveau de départ du scénario (échantillonné pendant les reruns, tableaux
+numpy compris) sont comparés à une référence stockée ; le script échoue
+(code 1) si un onglet la dépasse de plus de la tolérance.
+
+Les onglets sont parcourus dans l'ordre, le premier absorbant le
+remplissage initial des caches : avec `--tabs` (sous-ensemble d'onglets),
+seuls les temps sont mesurés. Les mesures dépendent de l'environnement :
+le fichier de référence (perf_baseline.json, versionné, ou `--baseline`)
+contient une référence par environnement de mesure (processeur, nombre de
+cœurs, version de Python) et jeu synthétique. Sans référence pour
+l'environnement courant, ou pour un onglet contrôlé, le script échoue
+(code 2) : une référence n'est enregistrée qu'avec `--update-baseline`.
+
+Usage :
+    python perf_check.py                       # compare à la référence de cet environnement
+    python perf_check.py --update-baseline     # enregistre la référence de cet environnement
+    python perf_check.py --baseline ci.json --tolerance 0.3 --tabs Impact Charts
+"""
+import argparse
+import ctypes
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from loadtest import find_widget
+
+APP_DIR = Path(__file__).resolve().parent
+APP_PATH = APP_DIR / "app.py"
+BASELINE_PATH = APP_DIR / "perf_baseline.json"
+
+# Jeu synthétique de référence
+REGISTRATIONS = 50_000
+POSTS = 500
+SEED = 0
+
+# Dépassement toléré (fraction de la référence) et marges absolues sous
+# lesquelles un écart est considéré comme du bruit
+TOLERANCE = 0.5
+SLACK_MS = 50
+SLACK_MB = 5
+
+# Mesures contrôlées (le maximum, sensible au premier rerun, est indicatif)
+GATED = ('rerun_ms_median', 'peak_mb')
+
+# Intervalle d'échantillonnage de la mémoire résidente (secondes)
+RSS_INTERVAL = 0.01
+
+# Scénarios : widgets propres à chaque onglet (type, libellé, valeurs ; None =
+# toutes les options affichées, pour les widgets sans format_func)
+TAB_SCENARIOS = {
+    'Overview': [
+        ('selectbox', "Métrique Instagram", None),
+        ('radio', "Type d'agrégation", None),
+    ],
+    'Inscriptions': [
+        ('radio', "Granularité temporelle", None),
+        ('radio', "Niveau", ['pays', 'departement']),
+    ],
+    'Impact': [
+        ('selectbox', "Période d'analyse après chaque post", ["0-24h", "24-48h", "48-72h", "0-72h"]),
+        ('radio', "Noyau d'attribution", None),
+        ('slider', "Horizon d'attribution (heures)", [24, 48, 96, 72]),
+        ('selectbox', "Comparer au sein de", ['categorie_titre', 'Periode', 'format', 'Type']),
+    ],
+    'Charts': [
+        ('selectbox', "Dimension", ['date', 'jour_semaine', 'heure', 'semaine_iso', 'mois', 'is_paid', 'parcours']),
+        ('selectbox', "Métrique à analyser", ['is_paid', 'has_licence', 'is_handisport', None]),
+        ('selectbox', "Deuxième dimension", ['date', 'heure', 'is_paid', None]),
+    ],
+    'Explorer': [
+        ('multiselect', "Parcours", [[5.0], [12.0], [21.0], [5.0, 21.0], []]),
+        ('multiselect', "Type de post", [['Reels'], ['Photo', 'Carrousel'], []]),
+    ],
+}
+
+
+def _displayed(value):
+    # Parcours affichés sous la forme « 12K » par les multiselect
+    return f"{int(value)}K" if isinstance(value, float) else value
+
+
+def _run(at):
+    started = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return elapsed
+
+
+def _rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _release_memory():
+    # Niveau de départ comparable d'un scénario à l'autre : objets libérés et
+    # mémoire rendue au système par l'allocateur (glibc)
+    gc.collect()
+    try:
+        ctypes.CDLL(None).malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class RssPeak:
+    """Pic de mémoire résidente pendant un bloc, au-dessus du niveau d'entrée (Linux)
+
+    `peak_mb` vaut None sans /proc (la mémoire n'est alors pas contrôlée).
+    """
+
+    def __init__(self, interval=RSS_INTERVAL):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+
+    def _sample(self, base):
+        peak = base
+        while not self._stop.wait(self.interval):
+            peak = max(peak, _rss_bytes())
+        self.peak_mb = (max(peak, _rss_bytes()) - base) / (1024 * 1024)
+
+    def __enter__(self):
+        _release_memory()
+        if os.path.exists('/proc/self/statm'):
+            self._thread = threading.Thread(target=self._sample, args=(_rss_bytes(),), daemon=True)
+            self._thread.start()
+        else:
+            self._thread = None
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def run_scenario(at, steps):
+    """Temps de chaque rerun du scénario (s)"""
+    timings = []
+    for kind, label, values in steps:
+        widget = find_widget(at, kind, label)
+        initial = widget.value
+        for value in (values if values is not None else widget.options):
+            widget = find_widget(at, kind, label)
+            if kind == 'multiselect':
+                value = [v for v in value if _displayed(v) in widget.options]
+            widget.set_value(value)
+            timings.append(_run(at))
+        # Retour à la valeur initiale (état attendu par les scénarios suivants)
+        find_widget(at, kind, label).set_value(initial)
+        _run(at)
+    return timings
+
+
+def measure(tabs, registrations, posts, seed, timeout):
+    """Mesures par onglet : {onglet: {rerun_ms_median, rerun_ms_max, peak_mb}}"""
+    from streamlit.testing.v1 import AppTest
+    from synthetic_data import write_dataset
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_dataset(tmp, registrations, posts, seed=seed)
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        # Hors ligne et sans calcul concurrent : mesures reproductibles
+        os.environ["MOE_IMPACT_WORKERS"] = "0"
+        os.environ["MOE_GEOJSON_URL"] = ""
+        try:
+            at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+            at.session_state['authenticated'] = True
+            _run(at)
+            results = {}
+            for tab in tabs:
+                with RssPeak() as memory:
+                    timings = run_scenario(at, TAB_SCENARIOS[tab])
+                ms = np.array(timings) * 1000
+                results[tab] = {
+                    'rerun_ms_median': round(float(np.median(ms)), 1),
+                    'rerun_ms_max': round(float(ms.max()), 1),
+                }
+                if memory.peak_mb is not None:
+                    results[tab]['peak_mb'] = round(memory.peak_mb, 1)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Dépassements de la référence : liste de (onglet, mesure, valeur, limite)"""
+    failures = []
+    for tab, metrics in results.items():
+        reference = baseline.get(tab)
+        if reference is None:
+            continue
+        for name, value in metrics.items():
+            if name not in GATED or name not in reference:
+                continue
+            slack = SLACK_MB if name.endswith('_mb') else SLACK_MS
+            limit = reference[name] * (1 + tolerance) + slack
+            if value > limit:
+                failures.append((tab, name, value, limit))
+    return failures
+
+
+def environment():
+    """Environnement de mesure : une référence n'est comparée que sur le même"""
+    return {
+        'processor': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+
+def report(results, baseline):
+    print(f"{'Onglet':<14}{'médiane':>18}{'max':>18}{'pic mémoire':>18}")
+    for tab, m in results.items():
+        ref = baseline.get(tab, {})
+        def cell(name, unit):
+            if name not in m:
+                return "—"
+            value = f"{m[name]:.0f} {unit}"
+            return f"{value} ({ref[name]:.0f})" if name in ref else value
+        print(f"{tab:<14}{cell('rerun_ms_median', 'ms'):>18}{cell('rerun_ms_max', 'ms'):>18}{cell('peak_mb', 'Mo'):>18}")
+
+
+def load_baselines(path):
+    """Références du fichier : liste de {config, tabs}, une par environnement"""
+    if not path.exists():
+        return []
+    return json.loads(path.read_text()).get('references', [])
+
+
+def find_baseline(references, config):
+    """Mesures de référence de `config` (None si cet environnement n'en a pas)"""
+    for reference in references:
+        if reference['config'] == config:
+            return reference['tabs']
+    return None
+
+
+def save_baseline(path, references, config, results):
+    """Enregistre les mesures de `results` comme référence de `config`, onglet par onglet
+
+    Les références des autres environnements sont conservées.
+    """
+    tabs = dict(find_baseline(references, config) or {})
+    for tab, metrics in results.items():
+        tabs[tab] = {**tabs.get(tab, {}), **metrics}
+    others = [reference for reference in references if reference['config'] != config]
+    references = sorted(others + [{'config': config, 'tabs': tabs}], key=lambda r: json.dumps(r['config']))
+    path.write_text(json.dumps({'references': references}, indent=2, ensure_ascii=False) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tabs', nargs='+', choices=list(TAB_SCENARIOS), default=list(TAB_SCENARIOS))
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="dépassement toléré (0.5 = +50 %%)")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH, help="fichier de référence")
+    parser.add_argument(
+        '--update-baseline', action='store_true',
+        help="enregistre les mesures comme référence de cet environnement"
+    )
+    parser.add_argument('--timeout', type=float, default=300, help="délai maximal d'un rerun (s)")
+    args = parser.parse_args(argv)
+
+    references = load_baselines(args.baseline)
+    config = {'registrations': REGISTRATIONS, 'posts': POSTS, 'seed': SEED, 'environment': environment()}
+    baseline = find_baseline(references, config)
+    if baseline is None and not args.update_baseline:
+        # Échec immédiat : un passage sans référence ne contrôle rien
+        print(f"Aucune référence pour cet environnement dans {args.baseline} : {json.dumps(config['environment'])}")
+        print("Fournir --baseline ou enregistrer une référence avec --update-baseline")
+        return 2
+
+    sys.path.insert(0, str(APP_DIR))
+    print(f"Jeu synthétique : {REGISTRATIONS} inscriptions, {POSTS} posts")
+    results = measure(args.tabs, REGISTRATIONS, POSTS, SEED, args.timeout)
+    if set(args.tabs) != set(TAB_SCENARIOS):
+        # Mémoire non comparable hors de la séquence complète
+        for metrics in results.values():
+            metrics.pop('peak_mb', None)
+    report(results, baseline or {})
+
+    if args.update_baseline:
+        save_baseline(args.baseline, references, config, results)
+        print(f"Référence enregistrée dans {args.baseline}")
+        return 0
+
+    failures = compare(results, baseline, args.tolerance)
+    for tab, name, value, limit in failures:
+        print(f"RÉGRESSION {tab} : {name} = {value:.1f} (limite {limit:.1f})")
+    # Mesures contrôlées sans référence : signalées, jamais complétées en silence
+    missing = [
+        (tab, name) for tab, metrics in results.items()
+        for name in metrics if name in GATED and name not in baseline.get(tab, {})
+    ]
+    for tab, name in missing:
+        print(f"SANS RÉFÉRENCE {tab} : {name}")
+    if failures:
+        return 1
+    if missing:
+        return 2
+    print(f"OK : aucun onglet au-delà de la référence (+{args.tolerance:.0%})")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Tarifs, codes promo et moyens de paiement : codes précalculés et agrégats par jour
+
+Le tarif (« EARLY TICKET », « TICKET STANDARD »), jusqu'ici perdu à
+l'extraction du parcours, est lu une fois au chargement dans PARCOURS ; le
+code promo, le type de paiement, l'assurance annulation et la valeur du code
+sont normalisés et codés en entiers. Un tableau jour × parcours × statut de
+paiement × tarif × code promo × type de paiement est ensuite construit (avec
+le nombre d'assurances et la valeur des codes) : courbes de vente par tarif et
+adoption des codes promo se lisent dans ces agrégats, sans parcourir les
+inscriptions à chaque interaction.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Tarif : libellé avant « - » dans PARCOURS lorsqu'il contient TICKET
+# (« EARLY TICKET - 21km : La Grande Aventure Phocéenne »)
+_TIER = re.compile(r'^\s*(.*?TICKET.*?)\s+-\s+', re.IGNORECASE)
+
+# Libellés des valeurs absentes
+NO_TIER = "Tarif unique"
+NO_PROMO = "Sans code"
+NO_PAYMENT_TYPE = "Non renseigné"
+
+# Dimensions codées : colonne de libellés, colonne de codes
+DIMENSIONS = {
+    'tarif': ('tarif', 'tarif_idx'),
+    'promo': ('code_promo', 'promo_idx'),
+    'paiement': ('type_paiement', 'paiement_idx'),
+}
+
+
+def _clean(series):
+    """Texte sans espaces superflus, chaînes vides → NaN"""
+    s = series.astype('string').str.strip()
+    return s.mask(s == '')
+
+
+def _column(df_reg, name):
+    if name in df_reg.columns:
+        return _clean(df_reg[name])
+    return pd.Series(pd.NA, index=df_reg.index, dtype='string')
+
+
+def add_pricing_columns(df_reg):
+    """Ajoute les colonnes tarifaires normalisées et leurs codes entiers
+
+    Colonnes ajoutées : tarif, code_promo (NaN sans code), type_paiement,
+    has_assurance, code_valeur (NaN si absente), tarif_idx, promo_idx (-1 sans
+    code) et paiement_idx. Renvoie les libellés de chaque code :
+    {'tarif': [...], 'promo': [...], 'paiement': [...]}.
+    """
+    df_reg['tarif'] = _column(df_reg, 'PARCOURS').str.extract(_TIER, expand=False) \
+        .str.upper().fillna(NO_TIER).astype(str)
+    # Codes saisis sans distinction de casse
+    df_reg['code_promo'] = _column(df_reg, 'CODE PROMO').str.upper()
+    df_reg['type_paiement'] = _column(df_reg, 'TYPE PAIEMENT').fillna(NO_PAYMENT_TYPE).astype(str)
+    df_reg['has_assurance'] = _column(df_reg, 'ASSURANCE ANNULATION').str.upper() \
+        .isin(['OUI', '1', 'TRUE']).to_numpy(dtype=bool)
+    df_reg['code_valeur'] = pd.to_numeric(
+        _column(df_reg, 'CODE VALEUR').str.replace(',', '.').str.replace(r'[\s€%]', '', regex=True),
+        errors='coerce'
+    ).astype(float)
+
+    labels = {}
+    for dimension, (column, idx_column) in DIMENSIONS.items():
+        codes, values = pd.factorize(df_reg[column], sort=True)
+        df_reg[idx_column] = codes.astype(np.int16)
+        labels[dimension] = [str(v) for v in values]
+    return labels
+
+
+class FunnelRollup:
+    """Inscriptions par jour × parcours × statut de paiement × tarif × code promo × type de paiement
+
+    Trois tableaux de même forme : inscriptions, inscriptions avec assurance
+    annulation et valeur cumulée des codes. L'indice 0 de l'axe des codes
+    promo correspond aux inscriptions sans code. Construits en une passe de
+    bincount ; chaque requête se limite à un découpage et une somme.
+    """
+
+    def __init__(self, counts, assurances, valeur, labels, first_day, parcours_values):
+        self.counts = counts
+        self.assurances = assurances
+        self.valeur = valeur
+        self.labels = labels
+        self.first_day = first_day
+        self.parcours_values = parcours_values
+
+    @classmethod
+    def from_frame(cls, df_reg, labels):
+        """Construit les agrégats à partir des colonnes ajoutées par add_pricing_columns"""
+        dates = pd.to_datetime(df_reg['date'])
+        first_day = dates.min().normalize() if dates.notna().any() else pd.Timestamp('1970-01-01')
+        day = ((dates - first_day).dt.days).fillna(-1).to_numpy(dtype=np.int64)
+        parcours_idx, parcours_values = pd.factorize(df_reg['parcours'], sort=True)
+        n_days = int(day.max()) + 1 if len(day) and day.max() >= 0 else 0
+        shape = (n_days, len(parcours_values), 2, *cls._label_sizes(labels))
+
+        index, valid = cls._index(df_reg, day, parcours_idx)
+        flat = np.ravel_multi_index(index, shape) if valid.any() else np.zeros(0, dtype=np.int64)
+        size = int(np.prod(shape))
+        counts = np.bincount(flat, minlength=size).astype(np.int32).reshape(shape)
+        assurances = np.bincount(
+            flat, weights=df_reg['has_assurance'].to_numpy(dtype=float)[valid], minlength=size
+        ).astype(np.int32).reshape(shape)
+        valeur = np.bincount(
+            flat, weights=np.nan_to_num(df_reg['code_valeur'].to_numpy(dtype=float)[valid]), minlength=size
+        ).reshape(shape)
+        return cls(counts, assurances, valeur, labels, first_day, np.asarray(parcours_values, dtype=float))
+
+    @staticmethod
+    def _label_sizes(labels):
+        return len(labels['tarif']), len(labels['promo']) + 1, len(labels['paiement'])
+
+    @staticmethod
+    def _index(df_reg, day, parcours_idx):
+        """Indices multidimensionnels des lignes valides et masque de ces lignes"""
+        valid = (day >= 0) & (parcours_idx >= 0)
+        index = (
+            day[valid],
+            parcours_idx[valid],
+            df_reg['is_paid'].to_numpy(dtype=np.int64)[valid],
+            df_reg['tarif_idx'].to_numpy(dtype=np.int64)[valid],
+            df_reg['promo_idx'].to_numpy(dtype=np.int64)[valid] + 1,
+            df_reg['paiement_idx'].to_numpy(dtype=np.int64)[valid],
+        )
+        return index, valid
+
+    def extend(self, df_new, new_labels):
+        """Agrégats prolongés des lignes `df_new` (nouvel objet, l'actuel reste inchangé)
+
+        Comme GeoRollup.extend : les codes de `df_new` sont réécrits en place
+        vers les libellés existants, complétés des valeurs nouvelles.
+        """
+        labels = {}
+        for dimension, (_, idx_column) in DIMENSIONS.items():
+            known = self.labels[dimension]
+            position = pd.Index(known).get_indexer(new_labels[dimension])
+            added = [v for v, p in zip(new_labels[dimension], position) if p < 0]
+            position[position < 0] = len(known) + np.arange(len(added))
+            labels[dimension] = known + added
+            idx = df_new[idx_column].to_numpy(dtype=np.int64)
+            df_new[idx_column] = np.where(idx >= 0, position[np.maximum(idx, 0)] if len(position) else -1, -1).astype(np.int16)
+
+        dates = pd.to_datetime(df_new['date'])
+        first_day = min(self.first_day, dates.min().normalize()) if dates.notna().any() else self.first_day
+        offset = (self.first_day - first_day).days
+        day = (dates - first_day).dt.days.fillna(-1).to_numpy(dtype=np.int64)
+        n_days = max(offset + self.counts.shape[0], int(day.max()) + 1 if len(day) else 0)
+        parcours_values = np.union1d(self.parcours_values, df_new['parcours'].dropna().to_numpy(dtype=float))
+        old_parcours = np.searchsorted(parcours_values, self.parcours_values)
+        parcours = df_new['parcours'].to_numpy(dtype=float)
+        parcours_idx = np.where(np.isnan(parcours), -1, np.searchsorted(parcours_values, parcours))
+
+        shape = (n_days, len(parcours_values), 2, *self._label_sizes(labels))
+        index, valid = self._index(df_new, day, parcours_idx)
+        weights = (
+            None,
+            df_new['has_assurance'].to_numpy(dtype=np.int32)[valid],
+            np.nan_to_num(df_new['code_valeur'].to_numpy(dtype=float)[valid]),
+        )
+        grown = []
+        for old, weight in zip((self.counts, self.assurances, self.valeur), weights):
+            array = np.zeros(shape, dtype=old.dtype)
+            t, p, m = old.shape[3:]
+            array[offset:offset + old.shape[0], old_parcours, :, :t, :p, :m] = old
+            np.add.at(array, index, 1 if weight is None else weight)
+            grown.append(array)
+        return FunnelRollup(*grown, labels, first_day, parcours_values)
+
+    def _select(self, array, start_date=None, end_date=None, parcours=None, paid=None):
+        """(premier jour, tableau jour × tarif × code promo × type de paiement) pour les filtres donnés"""
+        n_days = array.shape[0]
+        start = 0 if start_date is None else max((pd.Timestamp(start_date) - self.first_day).days, 0)
+        end = n_days if end_date is None else min((pd.Timestamp(end_date) - self.first_day).days + 1, n_days)
+        array = array[start:max(end, start)]
+        if parcours is not None:
+            array = array[:, self.parcours_values == parcours]
+        if paid is not None:
+            array = array[:, :, [int(bool(paid))]]
+        return self.first_day + pd.Timedelta(days=start), array.sum(axis=(1, 2))
+
+    def promo_labels(self):
+        return [NO_PROMO] + self.labels['promo']
+
+    def sell_through(self, promo=None, **filters):
+        """Ventes quotidiennes et cumulées par tarif (courbes de vente)
+
+        `promo` : restreint aux inscriptions avec ce code (NO_PROMO : sans
+        code). Colonne `part` : part des ventes du tarif déjà réalisée à
+        chaque date (%).
+        """
+        first, counts = self._select(self.counts, **filters)
+        if promo is not None:
+            counts = counts[:, :, [self.promo_labels().index(promo)]]
+        daily = counts.sum(axis=(2, 3))
+        cumul = daily.cumsum(axis=0)
+        total = cumul[-1] if len(cumul) else np.zeros(daily.shape[1], dtype=np.int64)
+        n_days, n_tiers = daily.shape
+        table = pd.DataFrame({
+            'date': np.repeat(pd.date_range(first, periods=n_days, freq='D').date, n_tiers),
+            'tarif': np.tile(self.labels['tarif'], n_days),
+            'inscriptions': daily.ravel().astype(int),
+            'cumul': cumul.ravel().astype(int),
+            'part': (cumul / np.where(total > 0, total, 1) * 100).ravel(),
+        })
+        # Tarifs sans aucune vente sur la période retirés
+        return table[np.tile(total > 0, n_days)].reset_index(drop=True)
+
+    def promo_uptake(self, **filters):
+        """Inscriptions par code promo et par tarif, part des inscriptions, assurance et valeur des codes"""
+        _, counts = self._select(self.counts, **filters)
+        _, assurances = self._select(self.assurances, **filters)
+        _, valeur = self._select(self.valeur, **filters)
+        by_tier = counts.sum(axis=(0, 3)).T  # code promo × tarif
+        total = by_tier.sum(axis=1)
+        table = pd.DataFrame(by_tier, columns=self.labels['tarif'])
+        table.insert(0, 'code_promo', self.promo_labels())
+        table.insert(1, 'inscriptions', total)
+        table.insert(2, 'part', total / max(total.sum(), 1) * 100)
+        table['taux_assurance'] = assurances.sum(axis=(0, 1, 3)) / np.where(total > 0, total, 1) * 100
+        table['valeur_codes'] = valeur.sum(axis=(0, 1, 3))
+        table = table[total > 0]
+        return table.sort_values('inscriptions', ascending=False, kind='stable').reset_index(drop=True)
+
+    def payment_types(self, **filters):
+        """Inscriptions par type de paiement et par tarif, avec le taux d'assurance annulation"""
+        _, counts = self._select(self.counts, **filters)
+        _, assurances = self._select(self.assurances, **filters)
+        by_tier = counts.sum(axis=(0, 2)).T  # type de paiement × tarif
+        total = by_tier.sum(axis=1)
+        table = pd.DataFrame(by_tier, columns=self.labels['tarif'])
+        table.insert(0, 'type_paiement', self.labels['paiement'])
+        table.insert(1, 'inscriptions', total)
+        table['taux_assurance'] = assurances.sum(axis=(0, 1, 2)) / np.where(total > 0, total, 1) * 100
+        table = table[total > 0]
+        return table.sort_values('inscriptions', ascending=False, kind='stable').reset_index(drop=True)
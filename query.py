@@ -0,0 +1,176 @@
+"""Moteur de requêtes groupées de l'onglet Charts
+
+Une requête (jeu de données, métrique, agrégation, une ou deux dimensions,
+filtres) est exécutée sur des codes catégoriels précalculés : chaque
+dimension est codée une fois par version des données (les inscriptions
+reçues en direct sont codées seules, à la suite de l'export), puis les
+groupes sont agrégés par `bincount` (comptes, sommes, moyennes, taux) ou par
+un tri unique (médiane, percentiles). Les résultats sont mémorisés dans un cache LRU.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Agrégations disponibles : libellé et quantile éventuel
+AGGREGATIONS = {
+    'count': "Nombre",
+    'sum': "Somme",
+    'mean': "Moyenne",
+    'rate': "Taux (%)",
+    'median': "Médiane",
+    'p25': "25e percentile",
+    'p75': "75e percentile",
+    'p90': "90e percentile",
+}
+
+_QUANTILES = {'median': 0.5, 'p25': 0.25, 'p75': 0.75, 'p90': 0.9}
+
+# Résultats et colonnes codées conservés
+MAX_RESULTS = 256
+MAX_CODEBOOKS = 64
+
+
+def grouped_quantile(group, values, n_groups, q):
+    """Quantile `q` (interpolation linéaire) de `values` par groupe, NaN si groupe vide"""
+    ok = ~np.isnan(values)
+    group, values = group[ok], values[ok]
+    # Tri par valeur puis tri stable par groupe (tri par base sur des petits entiers)
+    order = np.argsort(values)
+    group_dtype = np.int16 if n_groups <= np.iinfo(np.int16).max else np.int64
+    order = order[np.argsort(group[order].astype(group_dtype), kind='stable')]
+    values = values[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    result = np.full(n_groups, np.nan)
+    filled = counts > 0
+    pos = starts[filled] + q * (counts[filled] - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    result[filled] = values[lo] + (values[hi] - values[lo]) * (pos - lo)
+    return result
+
+
+def aggregate(group, values, n_groups, agg):
+    """Agrégat par groupe et effectif de chaque groupe"""
+    counts = np.bincount(group, minlength=n_groups)
+    if agg == 'count':
+        return counts.astype(float), counts
+    if agg in _QUANTILES:
+        return grouped_quantile(group, values, n_groups, _QUANTILES[agg]), counts
+
+    ok = ~np.isnan(values)
+    sums = np.bincount(group[ok], weights=values[ok], minlength=n_groups)
+    if agg == 'sum':
+        return sums, counts
+    n_valid = np.bincount(group[ok], minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(n_valid > 0, sums / n_valid, np.nan)
+    return (mean * 100 if agg == 'rate' else mean), counts
+
+
+def result_column(metric, agg, dimensions):
+    """Nom de la colonne de résultat (préfixé par l'agrégation si la métrique est aussi une dimension)"""
+    name = metric or 'nombre'
+    return f"{agg}_{name}" if name in dimensions else name
+
+
+class QueryEngine:
+    """Requêtes groupées mémorisées, partagées entre toutes les sessions"""
+
+    def __init__(self, max_results=MAX_RESULTS, max_codebooks=MAX_CODEBOOKS):
+        self.max_results = max_results
+        self.max_codebooks = max_codebooks
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._codes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def codes(self, version, dataset, full, column, base=None):
+        """Codes entiers (-1 si manquant) et valeurs distinctes triées d'une colonne du jeu complet
+
+        `base` : (version, nombre de lignes) d'une version antérieure dont
+        `full` prolonge les lignes ; ses codes sont réutilisés et seules les
+        lignes ajoutées sont codées, tant qu'elles n'apportent pas de valeur nouvelle.
+        """
+        base_version, base_rows = base if base is not None and base[0] != version else (None, None)
+        if base_rows == len(full):
+            return self.codes(base_version, dataset, full, column)
+        key = (version, dataset, column)
+        with self._lock:
+            entry = self._codes.get(key)
+            if entry is not None:
+                self._codes.move_to_end(key)
+                return entry
+        entry = None
+        if base_version is not None:
+            base_codes, values = self.codes(base_version, dataset, full.iloc[:base_rows], column)
+            added = full[column].iloc[base_rows:]
+            added_codes = pd.Index(values).get_indexer(added)
+            if not ((added_codes < 0) & added.notna().to_numpy()).any():
+                entry = np.concatenate([base_codes, added_codes]), values
+        if entry is None:
+            entry = pd.factorize(full[column], sort=True)
+        with self._lock:
+            self._codes[key] = entry
+            while len(self._codes) > self.max_codebooks:
+                self._codes.popitem(last=False)
+        return entry
+
+    def run(self, version, dataset, full, frame, metric, agg, dimensions, filter_state=(), base=None):
+        """Tableau (dimensions..., metric) pour les lignes de `frame`, sous-ensemble de `full`
+
+        `metric` None compte les lignes ; `dimensions` contient une ou deux
+        colonnes ; `base` : voir `codes`.
+        """
+        dimensions = tuple(dimensions)
+        key = (version, dataset, filter_state, metric, agg, dimensions)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            self.misses += 1
+
+        result = self._execute(version, dataset, full, frame, metric, agg, dimensions, base)
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result
+
+    def _execute(self, version, dataset, full, frame, metric, agg, dimensions, base):
+        # Lignes du sous-ensemble filtré dans le jeu complet
+        if isinstance(full.index, pd.RangeIndex) and full.index.start == 0 and full.index.step == 1:
+            rows = frame.index.to_numpy()
+        else:
+            rows = full.index.get_indexer(frame.index)
+
+        group = np.zeros(len(rows), dtype=np.int64)
+        valid = np.ones(len(rows), dtype=bool)
+        uniques = []
+        for column in dimensions:
+            codes, values = self.codes(version, dataset, full, column, base)
+            codes = codes[rows]
+            valid &= codes >= 0
+            group = group * len(values) + codes
+            uniques.append(values)
+        n_groups = int(np.prod([len(u) for u in uniques])) if uniques else 1
+
+        if metric is None or agg == 'count':
+            values = np.ones(len(rows))
+        else:
+            values = frame[metric].to_numpy(dtype=float, na_value=np.nan)
+        result, counts = aggregate(group[valid], values[valid], n_groups, agg)
+
+        present = np.flatnonzero(counts > 0)
+        table = {}
+        remainder = present
+        for column, values in reversed(list(zip(dimensions, uniques))):
+            remainder, idx = np.divmod(remainder, len(values))
+            table[column] = np.asarray(values)[idx]
+        table = {column: table[column] for column in dimensions}
+        table[result_column(metric, agg, dimensions)] = result[present]
+        return pd.DataFrame(table)
@@ -0,0 +1,149 @@
+"""Classement des posts : ratios d'engagement et de conversion, rangs centiles
+
+Pour chaque version des données, les ratios de chaque post (interactions,
+clics, portée hors abonnés, inscriptions pour 1 000 vues...) sont calculés
+en une passe vectorisée, puis leurs rangs centiles au sein du type de post,
+du format (durée des Reels, nombre d'images des carrousels), de la catégorie
+de titre et de la période. Le tableau est conservé par
+version : trier ou filtrer le classement ne recalcule rien.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Ratios par post : libellé, numérateur, dénominateur et échelle
+# (pourcentage ou pour 1 000 vues)
+RATIOS = {
+    'taux_engagement': ("Engagement (%)", 'Nb Interaction', 'Vues', 100),
+    'taux_clics': ("Clics liens (%)", 'Appuis sur des liens externes', 'Vues', 100),
+    'part_non_followers': ("Vues hors abonnés (%)", 'Vues Non Followers', 'Vues', 100),
+    'enregistrements_1k': ("Enregistrements / 1k vues", 'Enregistrement', 'Vues', 1000),
+    'visites_profil_1k': ("Visites profil / 1k vues", 'Visites du profil', 'Vues', 1000),
+    'followers_1k': ("Nouveaux abonnés / 1k vues", 'Followers en plus', 'Vues', 1000),
+    'inscriptions_1k': ("Inscriptions / 1k vues", 'inscriptions', 'Vues', 1000),
+}
+
+# Groupes de comparaison des rangs centiles
+GROUPS = {
+    'Type': "Type de post",
+    'format': "Format (durée, nombre d'images)",
+    'categorie_titre': "Catégorie de titre",
+    'Periode': "Période",
+}
+
+# Formats : tranches de durée des Reels (secondes) et de nombre d'images des
+# carrousels, indexées par leur borne supérieure (incluse)
+REEL_BUCKETS = {15: "Reel ≤ 15 s", 30: "Reel 16-30 s", 60: "Reel 31-60 s", np.inf: "Reel > 60 s"}
+CAROUSEL_BUCKETS = {3: "Carrousel 2-3 images", 6: "Carrousel 4-6 images", np.inf: "Carrousel 7+ images"}
+
+# Classements conservés (un par version des données et fenêtre d'impact)
+MAX_BOARDS = 8
+
+# Catégories de titres : compte à rebours (« J-10 », « M-1 »), préfixe avant
+# « - » ou « X » (collaborations), dernier mot numéroté retiré (« Trailer 2 »)
+_COUNTDOWN = re.compile(r'^[JM]-\d+\b', re.IGNORECASE)
+_PREFIX = re.compile(r'^(.+?)\s+(?:-|X)\s+')
+_NUMBERED_WORD = re.compile(r'\s+\S*\d\S*$')
+
+
+def title_category(titres):
+    """Catégorie de chaque titre de post (séries de posts regroupées)"""
+    titres = titres.astype('string').str.strip()
+    category = titres.str.extract(_PREFIX, expand=False)
+    category = category.fillna(titres.str.replace(_NUMBERED_WORD, '', regex=True))
+    category = category.mask(titres.str.contains(_COUNTDOWN).fillna(False), "Compte à rebours")
+    return category.fillna("Sans titre")
+
+
+def reel_seconds(durations):
+    """Durée des Reels (« 00.20 » = minutes.secondes) en secondes"""
+    parts = durations.astype('string').str.extract(r'^(\d+)[.,:](\d+)$').astype(float)
+    return parts[0] * 60 + parts[1]
+
+
+def _bucket(values, buckets):
+    values = np.asarray(values, dtype=float)
+    labels = np.array(list(buckets.values()) + [None], dtype=object)
+    idx = np.searchsorted(np.array(list(buckets), dtype=float), values, side='left')
+    return np.where(np.isnan(values), None, labels[idx])
+
+
+def post_format(types, reel_durations, nb_images):
+    """Format de chaque post : tranche de durée (Reels), de nombre d'images
+    (carrousels), sinon type du post"""
+    types = np.asarray(types, dtype=object)
+    labels = types.copy()
+    for kind, values, buckets in (('Reels', reel_durations, REEL_BUCKETS), ('Carrousel', nb_images, CAROUSEL_BUCKETS)):
+        bucket = _bucket(np.broadcast_to(values, types.shape), buckets)
+        mask = (types == kind) & pd.notna(bucket)
+        labels[mask] = bucket[mask]
+    return labels
+
+
+def score_posts(df_insta, inscriptions):
+    """Ratios, rangs centiles par groupe et score de chaque post
+
+    `inscriptions` : inscriptions dans la fenêtre d'impact de chaque post
+    (dans l'ordre de `df_insta`). Les rangs centiles (0-100) ignorent les
+    ratios manquants ; le score d'un groupe (score_Type...) est la moyenne
+    des rangs du post dans ce groupe. Durée des Reels et nombre d'images des
+    carrousels définissent le groupe « format ».
+    """
+    reel_durations = reel_seconds(df_insta['Durée (Reels)']).to_numpy() if 'Durée (Reels)' in df_insta.columns else np.nan
+    nb_images = (
+        pd.to_numeric(df_insta['Nb Image (Carrousel)'], errors='coerce').to_numpy()
+        if 'Nb Image (Carrousel)' in df_insta.columns else np.nan
+    )
+    table = pd.DataFrame({
+        'date_post': pd.to_datetime(df_insta['timestamp']).dt.date.to_numpy(),
+        'Type': df_insta['Type'].to_numpy(),
+        'Titre': df_insta['Titre'].to_numpy(),
+        'categorie_titre': title_category(df_insta['Titre']).to_numpy(),
+        'Periode': df_insta['Periode'].to_numpy() if 'Periode' in df_insta.columns else None,
+        'duree_reels_s': reel_durations,
+        'nb_images': nb_images,
+        'format': post_format(df_insta['Type'], reel_durations, nb_images),
+        'Vues': df_insta['Vues'].to_numpy(dtype=float),
+        'inscriptions': np.asarray(inscriptions, dtype=float),
+    }, index=df_insta.index)
+
+    for name, (_, numerator, denominator, scale) in RATIOS.items():
+        num = table[numerator] if numerator in table.columns else (
+            pd.to_numeric(df_insta[numerator], errors='coerce') if numerator in df_insta.columns else np.nan
+        )
+        den = table[denominator].where(table[denominator] > 0)
+        table[name] = num / den * scale
+
+    # Rangs centiles : un classement groupé par ratio et par groupe de comparaison
+    ratios = list(RATIOS)
+    for group in GROUPS:
+        ranks = table.groupby(table[group].astype(object).fillna('—'), sort=False)[ratios].rank(pct=True) * 100
+        ranks.columns = [f"rang_{name}_{group}" for name in ratios]
+        ranks[f"score_{group}"] = ranks.mean(axis=1)
+        table = pd.concat([table, ranks], axis=1)
+    return table
+
+
+class ScoreBoard:
+    """Classements des posts par version des données, partagés entre sessions"""
+
+    def __init__(self, max_boards=MAX_BOARDS):
+        self.max_boards = max_boards
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Classement pour `key` (version, fenêtre...), calculé avec `build()` si absent"""
+        with self._lock:
+            if key in self._boards:
+                self._boards.move_to_end(key)
+                return self._boards[key]
+        board = build()
+        with self._lock:
+            self._boards[key] = board
+            while len(self._boards) > self.max_boards:
+                self._boards.popitem(last=False)
+        return board
@@ -0,0 +1,317 @@
+"""Jeu de données partagé entre processus par fichiers projetés en mémoire
+
+Quand plusieurs processus Streamlit servent le tableau de bord (derrière un
+répartiteur de charge), le premier qui charge une version des exports écrit
+chaque colonne typée dans un fichier .npy : horodatages, indicateurs,
+métriques numériques, codes entiers des colonnes à peu de valeurs distinctes
+(libellés conservés dans le manifeste) et, pour les colonnes texte à forte
+cardinalité (noms, emails, adresses...), décalages et octets UTF-8 des
+valeurs, relus comme chaînes Arrow sans copie. Tous les processus projettent
+ensuite ces fichiers en lecture seule (`np.load(mmap_mode='r')`) : les pages
+sont partagées par le cache du système, la mémoire propre à un processus ne
+dépend pas du nombre de valeurs distinctes, et un processus supplémentaire
+n'a ni fichier CSV à relire ni index à recalculer.
+
+Disposition : <racine>/<version>/manifest.json et un fichier .npy par
+colonne (trois pour une colonne texte). Une version est écrite dans un répertoire temporaire puis renommée
+d'un bloc ; un verrou de fichier évite que deux processus la construisent
+en même temps.
+"""
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data import Dataset, load_dataset
+from data_watcher import file_digest
+from geo import GeoRollup
+from pricing import FunnelRollup
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - dépendance optionnelle : tout texte en codes et libellés
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows : pas de verrou entre processus
+    fcntl = None
+
+# Versions conservées sur disque (les processus en retard lisent encore la précédente)
+KEEP_VERSIONS = 2
+
+# Disposition des fichiers, incrémentée à chaque changement : une version
+# écrite par un code antérieur n'est pas relue
+STORE_FORMAT = 3
+
+# Tableaux des agrégats tarifaires (FunnelRollup)
+_FUNNEL_ARRAYS = ('counts', 'assurances', 'valeur')
+
+# Types de colonnes écrits tels quels (booléens, entiers, flottants, dates numpy)
+_ARRAY_KINDS = 'biufmM'
+
+# Au-delà de ce nombre de valeurs distinctes, une colonne texte est écrite
+# comme chaînes (décalages + octets) plutôt que comme codes et libellés
+MAX_CATEGORY_LABELS = 1_000
+
+
+def _code_dtype(n_labels):
+    # Codes au type retenu par pandas : aucune copie à la reconstruction
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_labels < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _encode_label(value):
+    if hasattr(value, 'isoformat'):
+        return {'date': value.isoformat()}
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _decode_label(value):
+    if isinstance(value, dict):
+        return pd.Timestamp(value['date']).date()
+    return value
+
+
+def _write_strings(series, root, stem):
+    """Écrit les valeurs texte de `series` : validité (bits), décalages int64 et
+    octets UTF-8 ; renvoie les fichiers (relatifs à `root`) de chaque tampon"""
+    values = pa.array(series.to_numpy(dtype=object, na_value=None), type=pa.large_string())
+    validity, offsets, data = values.buffers()
+    n = len(values)
+    files = {}
+    for part, buffer, dtype, size in (
+        ('valid', validity, np.uint8, (n + 7) // 8),
+        ('offsets', offsets, np.int64, n + 1),
+        ('data', data, np.uint8, None),
+    ):
+        if size is None:
+            size = int(np.frombuffer(offsets, dtype=np.int64)[n])
+        if buffer is None or size == 0:
+            continue
+        array = np.frombuffer(buffer, dtype=dtype)[:size]
+        files[part] = f"{stem}.{part}.npy"
+        np.save(root / files[part], array, allow_pickle=False)
+    return files
+
+
+def _read_strings(entry, directory):
+    """Colonne texte projetée en mémoire (tampons Arrow sur les fichiers, sans copie)"""
+    buffers = {
+        part: pa.py_buffer(np.load(directory / file, mmap_mode='r', allow_pickle=False))
+        for part, file in entry['files'].items()
+    }
+    values = pa.LargeStringArray.from_buffers(
+        entry['rows'], buffers['offsets'], buffers.get('data', pa.py_buffer(b'')), buffers.get('valid')
+    )
+    # Sémantique des colonnes texte de pandas (NaN si manquant)
+    return pd.arrays.ArrowStringArray(values, dtype=pd.StringDtype('pyarrow', na_value=np.nan))
+
+
+def _write_frame(df, directory):
+    """Écrit les colonnes de `df` ; renvoie leur description pour le manifeste"""
+    directory.mkdir()
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        stem = f"{directory.name}/{i}"
+        entry = {'name': name, 'file': f"{stem}.npy"}
+        if series.dtype.kind in _ARRAY_KINDS:
+            entry['kind'] = 'array'
+            values = series.to_numpy()
+        elif (
+            pa is not None
+            and pd.api.types.infer_dtype(series, skipna=True) == 'string'
+            and series.nunique() > MAX_CATEGORY_LABELS
+        ):
+            # Texte à forte cardinalité : chaînes projetées, sans libellés
+            entry = {'name': name, 'kind': 'text', 'rows': len(series)}
+            entry['files'] = _write_strings(series, directory.parent, stem)
+            columns.append(entry)
+            continue
+        else:
+            # Colonne texte (ou objets) : codes entiers et libellés triés
+            codes, labels = pd.factorize(series, sort=True)
+            entry['kind'] = 'category'
+            entry['labels'] = [_encode_label(v) for v in labels]
+            values = codes.astype(_code_dtype(len(labels)))
+        np.save(directory.parent / entry['file'], np.ascontiguousarray(values), allow_pickle=False)
+        columns.append(entry)
+    return columns
+
+
+def _read_frame(columns, directory):
+    """Colonnes projetées en mémoire (en lecture seule, sans copie)"""
+    data = {}
+    for entry in columns:
+        if entry['kind'] == 'text':
+            data[entry['name']] = _read_strings(entry, directory)
+            continue
+        values = np.load(directory / entry['file'], mmap_mode='r', allow_pickle=False)
+        if entry['kind'] == 'category':
+            labels = [_decode_label(v) for v in entry['labels']]
+            values = pd.Categorical.from_codes(
+                values,
+                dtype=pd.CategoricalDtype(labels, ordered=True),
+                validate=False
+            )
+        data[entry['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def write_dataset(dataset, directory):
+    """Écrit un Dataset (tables, agrégats géographiques et tarifaires, jour de course) dans `directory`"""
+    directory = Path(directory)
+    directory.mkdir(parents=True)
+    geo_dir = directory / 'geo'
+    geo_dir.mkdir()
+    for level, counts in dataset.geo.counts.items():
+        np.save(geo_dir / f"{level}.npy", counts, allow_pickle=False)
+    funnel_dir = directory / 'funnel'
+    funnel_dir.mkdir()
+    for name in _FUNNEL_ARRAYS:
+        np.save(funnel_dir / f"{name}.npy", getattr(dataset.funnel, name), allow_pickle=False)
+    manifest = {
+        'frames': {
+            'insta': _write_frame(dataset.insta, directory / 'insta'),
+            'reg': _write_frame(dataset.reg, directory / 'reg'),
+        },
+        'geo': {
+            'levels': list(dataset.geo.counts),
+            'labels': {
+                level: labels.to_dict(orient='list')
+                for level, labels in dataset.geo.labels.items()
+            },
+            'first_day': dataset.geo.first_day.isoformat(),
+            'parcours_values': np.asarray(dataset.geo.parcours_values).tolist(),
+        },
+        'funnel': {
+            'labels': dataset.funnel.labels,
+            'first_day': dataset.funnel.first_day.isoformat(),
+            'parcours_values': np.asarray(dataset.funnel.parcours_values).tolist(),
+        },
+        'race_day': dataset.race_day.isoformat() if dataset.race_day is not None else None,
+    }
+    with open(directory / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def read_dataset(directory):
+    """Dataset projeté en mémoire depuis `directory` (sans index des coureurs)"""
+    directory = Path(directory)
+    with open(directory / 'manifest.json', encoding='utf-8') as f:
+        manifest = json.load(f)
+    geo = manifest['geo']
+    rollup = GeoRollup(
+        {
+            level: np.load(directory / 'geo' / f"{level}.npy", mmap_mode='r', allow_pickle=False)
+            for level in geo['levels']
+        },
+        {level: pd.DataFrame(labels) for level, labels in geo['labels'].items()},
+        pd.Timestamp(geo['first_day']),
+        np.asarray(geo['parcours_values'], dtype=float),
+    )
+    funnel = manifest['funnel']
+    funnel_rollup = FunnelRollup(
+        *(
+            np.load(directory / 'funnel' / f"{name}.npy", mmap_mode='r', allow_pickle=False)
+            for name in _FUNNEL_ARRAYS
+        ),
+        funnel['labels'],
+        pd.Timestamp(funnel['first_day']),
+        np.asarray(funnel['parcours_values'], dtype=float),
+    )
+    return Dataset(
+        insta=_read_frame(manifest['frames']['insta'], directory),
+        reg=_read_frame(manifest['frames']['reg'], directory),
+        geo=rollup,
+        race_day=pd.Timestamp(manifest['race_day']) if manifest['race_day'] else None,
+        runners=None,
+        funnel=funnel_rollup,
+    )
+
+
+class SharedStore:
+    """Versions du jeu de données partagées par tous les processus d'une machine"""
+
+    def __init__(self, root, keep=KEEP_VERSIONS):
+        self.root = Path(root)
+        self.keep = keep
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, version):
+        return self.root / version
+
+    def load(self, version, build):
+        """Dataset de `version`, construit avec `build()` par le premier processus qui la demande
+
+        Le processus qui construit conserve son index des coureurs (prolongé
+        au rechargement suivant) ; les autres le reçoivent à None.
+        """
+        path = self.path(version)
+        if (path / 'manifest.json').exists():
+            return read_dataset(path)
+
+        with self._lock():
+            # Un autre processus a pu écrire la version pendant l'attente
+            if (path / 'manifest.json').exists():
+                return read_dataset(path)
+            dataset = build()
+            tmp = Path(tempfile.mkdtemp(prefix=f".{version}-", dir=self.root))
+            try:
+                write_dataset(dataset, tmp / 'data')
+                os.replace(tmp / 'data', path)
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            self._prune(version)
+
+        # Les tables construites sont libérées au profit des fichiers projetés
+        return read_dataset(path)._replace(runners=dataset.runners)
+
+    def _prune(self, current):
+        # Les processus qui projettent encore une version supprimée gardent
+        # leurs pages jusqu'à la fin de la projection
+        versions = sorted(
+            (p for p in self.root.iterdir() if p.is_dir() and not p.name.startswith('.')),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True
+        )
+        for old in [p for p in versions if p.name != current][self.keep - 1:]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def _lock(self):
+        return _FileLock(self.root / '.lock')
+
+
+class _FileLock:
+    """Verrou exclusif entre processus (aucun effet sans fcntl)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def load_shared_dataset(store, instagram_csv, reg_csv, race_date=None, previous=None):
+    """Comme load_dataset, la version étant lue depuis `store` si un processus l'a déjà écrite"""
+    version = f"{file_digest((instagram_csv, reg_csv))}-{race_date or 'auto'}-v{STORE_FORMAT}"
+    return store.load(
+        version,
+        lambda: load_dataset(instagram_csv, reg_csv, race_date=race_date, previous=previous)
+    )
@@ -0,0 +1,30 @@
+"""Tâches de démarrage exécutées en arrière-plan (sans dépendance lourde)"""
+import threading
+
+
+class BackgroundTask:
+    """Exécute une fonction une seule fois dans un thread dédié et en conserve le résultat"""
+
+    def __init__(self, target, name=None):
+        self._target = target
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._result = self._target()
+        except BaseException as e:
+            self._error = e
+
+    def done(self):
+        """Indique si la tâche est terminée"""
+        return not self._thread.is_alive()
+
+    def result(self):
+        """Attend la fin de la tâche et renvoie son résultat (ou relève son exception)"""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
@@ -0,0 +1,171 @@
+"""Jeux de données synthétiques au format des exports (tests de charge et de performance)
+
+Les fichiers produits ont les mêmes colonnes, séparateurs et formats que
+`insta_data.csv` et `data_registration_moe.csv`, sans aucune donnée réelle.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REG_COLUMNS = [
+    'DOSSARD', 'REF', 'PRIORITAIRE', 'NOM', 'PRENOM', 'PARCOURS', 'CHOIX', 'CIVILITE',
+    'DATE DE NAISSANCE', 'PAYS', 'EMAIL', 'TELEPHONE', 'ADRESSE', 'VILLE', 'CODE POSTAL',
+    'DEPARTEMENT (NOM)', 'DEPARTEMENT (CODE)', 'CLUB', 'HANDISPORT', 'LICENCE FFH',
+    'Personne à prévenir', 'Numéro à prévenir', 'FEDERATION', 'LICENCE/CERTIFICAT',
+    'Numéro de licence', 'PassJournee', 'PAIEMENT', 'DATE INSCRIPTION', 'TYPE PAIEMENT',
+    'CODE PROMO', 'CODE VALEUR', 'ASSURANCE ANNULATION', 'ID TRANSACTION', 'COMMENTAIRE',
+    'RAISON SOC', 'EMARGEMENT', 'DATE EMARGEMENT', 'RESP LEGAL NOM', 'RESP LEGAL PRENOM', 'EQUIPE'
+]
+
+INSTA_COLUMNS = [
+    'Date', 'Heure', 'Periode', 'Lien', 'Titre', 'Type', 'Durée (Reels)', 'Nb Image (Carrousel)',
+    'Contenue', 'Collaboration', 'Vues', 'Vues Followers', 'Vues Non Followers', 'Nb Interaction',
+    'Likes', 'Commentaires', 'Partage', 'Enregistrement', 'Activté du Profil', 'Visites du profil',
+    'Followers en plus', 'Appuis sur des liens externes', 'Hashtags'
+]
+
+PARCOURS = [
+    'EARLY TICKET - 5km : Découverte',
+    'EARLY TICKET - 12km : Marseille Aventure',
+    'EARLY TICKET - 21km : La Grande Aventure Phocéenne',
+    'TICKET STANDARD - 5km : Découverte',
+    'TICKET STANDARD - 12km : Marseille Aventure',
+    'TICKET STANDARD - 21km : La Grande Aventure Phocéenne',
+]
+
+DEPARTEMENTS = [
+    ('13', 'Bouches-du-Rhône', 'Marseille', '13008'),
+    ('13', 'Bouches-du-Rhône', 'Aix-en-Provence', '13100'),
+    ('83', 'Var', 'Toulon', '83000'),
+    ('84', 'Vaucluse', 'Avignon', '84000'),
+    ('75', 'Paris', 'PARIS', '75010'),
+    ('69', 'Rhône', 'Lyon', '69003'),
+    ('06', 'Alpes-Maritimes', 'Nice', '06000'),
+    ('34', 'Hérault', 'Montpellier', '34000'),
+]
+
+NOMS = ['MARTIN', 'BERNARD', 'DUBOIS', 'THOMAS', 'ROBERT', 'RICHARD', 'PETIT', 'DURAND', 'LEROY', 'MOREAU']
+PRENOMS = ['Léa', 'Hugo', 'Chloé', 'Louis', 'Emma', 'Jules', 'Inès', 'Gabriel', 'Jade', 'Raphaël']
+PROMOS = ['RCCMARSEILLEBB', 'MOEMAISONMERE', 'MOE2024CHALLENGE', 'MOEPORT']
+
+
+def _decimal(values):
+    """Nombres au format français (virgule décimale), comme dans l'export Instagram"""
+    return pd.Series(np.round(values, 2)).map(lambda v: f"{v:.2f}".replace('.', ','))
+
+
+def make_registrations(n, start='2024-06-06', days=150, seed=0):
+    """Inscriptions synthétiques (n lignes) réparties sur `days` jours"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+
+    # Inscriptions plus nombreuses en fin de campagne et en soirée
+    day = np.floor(days * np.sqrt(rng.random(n))).astype(int)
+    seconds = (rng.normal(19, 3.5, n).clip(0, 23.99) * 3600).astype(int)
+    timestamps = np.sort(start.to_datetime64() + (day * 86400 + seconds).astype('timedelta64[s]'))
+
+    nom = rng.choice(NOMS, n)
+    prenom = rng.choice(PRENOMS, n)
+    dept = rng.integers(0, len(DEPARTEMENTS), n)
+    dept_table = np.array(DEPARTEMENTS, dtype=object)
+    licence = rng.random(n) < 0.15
+    checked_in = rng.random(n) < 0.9
+    promo = np.where(rng.random(n) < 0.2, rng.choice(PROMOS, n), None)
+    race_day = start + pd.Timedelta(days=days + 2)
+    checkin_ts = race_day + pd.to_timedelta(rng.integers(6 * 3600, 11 * 3600, n), unit='s')
+
+    df = pd.DataFrame({
+        'DOSSARD': np.arange(1, n + 1),
+        'REF': 300000 + np.arange(n),
+        'PRIORITAIRE': 'NON',
+        'NOM': nom,
+        'PRENOM': prenom,
+        'PARCOURS': rng.choice(PARCOURS, n, p=[0.15, 0.3, 0.2, 0.1, 0.15, 0.1]),
+        'CHOIX': None,
+        'CIVILITE': rng.choice(['HOMME', 'FEMME'], n, p=[0.6, 0.4]),
+        'DATE DE NAISSANCE': (
+            np.datetime64('1960-01-01') + rng.integers(0, 45 * 365, n).astype('timedelta64[D]')
+        ).astype(str),
+        'PAYS': np.where(rng.random(n) < 0.97, 'France', 'Belgique'),
+        'EMAIL': [f"{p.lower()}.{m.lower()}{i}@example.org" for i, (p, m) in enumerate(zip(prenom, nom))],
+        'TELEPHONE': ['06' + f"{x:08d}" for x in rng.integers(0, 10 ** 8, n)],
+        'ADRESSE': '1 rue de la République',
+        'VILLE': dept_table[dept, 2],
+        'CODE POSTAL': dept_table[dept, 3],
+        'DEPARTEMENT (NOM)': dept_table[dept, 1],
+        'DEPARTEMENT (CODE)': dept_table[dept, 0],
+        'CLUB': None,
+        'HANDISPORT': np.where(rng.random(n) < 0.01, 'OUI', 'NON'),
+        'LICENCE FFH': None,
+        'Personne à prévenir': 'Contact',
+        'Numéro à prévenir': '0600000000',
+        'FEDERATION': np.where(licence, 'FFA', None),
+        'LICENCE/CERTIFICAT': 'Validé',
+        'Numéro de licence': np.where(licence, 'L123456', None),
+        'PassJournee': None,
+        'PAIEMENT': np.where(rng.random(n) < 0.95, 'OUI', 'NON'),
+        'DATE INSCRIPTION': pd.DatetimeIndex(timestamps).strftime('%Y-%m-%d %H:%M:%S'),
+        'TYPE PAIEMENT': np.where(rng.random(n) < 0.99, 'Carte bancaire', 'Inscription manuelle'),
+        'CODE PROMO': promo,
+        'CODE VALEUR': None,
+        'ASSURANCE ANNULATION': np.where(rng.random(n) < 0.07, 'OUI', 'NON'),
+        'ID TRANSACTION': 100000 + np.arange(n),
+        'COMMENTAIRE': None,
+        'RAISON SOC': None,
+        'EMARGEMENT': np.where(checked_in, 'OUI', 'NON'),
+        'DATE EMARGEMENT': np.where(checked_in, checkin_ts.strftime('%Y-%m-%d %H:%M:%S'), None),
+        'RESP LEGAL NOM': None,
+        'RESP LEGAL PRENOM': None,
+        'EQUIPE': None,
+    })
+    return df[REG_COLUMNS]
+
+
+def make_posts(n, start='2024-05-24', days=170, seed=0):
+    """Posts Instagram synthétiques (n lignes)"""
+    rng = np.random.default_rng(seed + 1)
+    dates = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, days, n)), unit='D')
+    post_type = rng.choice(['Photo', 'Reels', 'Carrousel'], n, p=[0.5, 0.3, 0.2])
+    vues = rng.lognormal(7.5, 0.8, n)
+    follower_share = rng.uniform(0.1, 0.6, n)
+    interactions = vues * rng.uniform(0.02, 0.08, n)
+    heure = np.where(rng.random(n) < 0.9, [f"{h:02d}:{m:02d}" for h, m in zip(rng.integers(7, 23, n), rng.choice([0, 30], n))], None)
+
+    df = pd.DataFrame({
+        'Date': dates.strftime('%Y-%m-%d'),
+        'Heure': heure,
+        'Periode': np.where(dates < pd.Timestamp(start) + pd.Timedelta(days=days - 10), 'Avant Trail', 'Pendant Trail'),
+        'Lien': [f"https://www.instagram.com/p/synthetic{i}/" for i in range(n)],
+        'Titre': [f"Post {i}" for i in range(n)],
+        'Type': post_type,
+        'Durée (Reels)': np.where(post_type == 'Reels', '00.30', None),
+        'Nb Image (Carrousel)': np.where(post_type == 'Carrousel', rng.integers(2, 10, n), np.nan),
+        'Contenue': rng.choice(['Présentation', 'Lieux', 'Trail', 'Information', 'Partenariat'], n),
+        'Collaboration': np.where(rng.random(n) < 0.1, 'Oui', 'Non'),
+        'Vues': _decimal(vues),
+        'Vues Followers': _decimal(vues * follower_share),
+        'Vues Non Followers': _decimal(vues * (1 - follower_share)),
+        'Nb Interaction': _decimal(interactions),
+        'Likes': (interactions * 0.8).astype(int),
+        'Commentaires': (interactions * 0.05).astype(int),
+        'Partage': (interactions * 0.1).astype(int),
+        'Enregistrement': (interactions * 0.05).astype(int),
+        'Activté du Profil': (vues * 0.03).astype(int),
+        'Visites du profil': (vues * 0.025).astype(int),
+        'Followers en plus': (vues * 0.002).astype(int),
+        'Appuis sur des liens externes': (vues * 0.004).astype(int),
+        'Hashtags': rng.integers(0, 4, n),
+    })
+    return df[INSTA_COLUMNS]
+
+
+def write_dataset(directory, n_registrations=10000, n_posts=200, seed=0):
+    """Écrit `insta_data.csv` et `data_registration_moe.csv` synthétiques dans `directory`"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    insta_path = directory / 'insta_data.csv'
+    reg_path = directory / 'data_registration_moe.csv'
+    make_posts(n_posts, seed=seed).to_csv(insta_path, sep=';', index=False)
+    make_registrations(n_registrations, seed=seed).to_csv(reg_path, sep=';', index=False)
+    return insta_path, reg_path
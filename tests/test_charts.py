@@ -0,0 +1,45 @@
+"""Cache de figures : un succès renvoie la spécification sérialisée, sans reconstruire ni revalider la figure"""
+import json
+
+import plotly.graph_objects as go
+import plotly.graph_objs
+import plotly.io as pio
+import plotly.tools
+
+from charts import FigureCache
+
+
+def _figure():
+    return go.Figure(go.Bar(x=['a', 'b'], y=[1, 2]), layout=dict(title="Test"))
+
+
+def test_hit_skips_encoding(monkeypatch):
+    cache = FigureCache()
+    builds = []
+    spec = cache.get_or_build(('k',), lambda: builds.append(1) or _figure()).to_dict()
+
+    # Succès : ni construction, ni revalidation (Figure indisponible), seul
+    # l'encodage final de la spécification reste à faire
+    class Unavailable:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("figure revalidée")
+
+    monkeypatch.setattr(plotly.graph_objs, 'Figure', Unavailable)
+    fig = cache.get_or_build(('k',), lambda: builds.append(1) or _figure())
+    rendered = plotly.tools.return_figure_from_figure_or_data(fig, validate_figure=True)
+
+    assert builds == [1]
+    assert cache.hits == 1
+    assert rendered == spec
+    assert json.loads(pio.to_json(rendered, validate=False)) == spec
+
+
+def test_hits_do_not_share_state():
+    cache = FigureCache()
+    cache.put(('k',), _figure())
+
+    first = cache.get(('k',)).to_dict()
+    first['layout']['title']['text'] = "Modifié"
+
+    assert cache.get(('k',)).to_dict()['layout']['title']['text'] == "Test"
+    assert cache.get(('k',)) is not cache.get(('k',))
@@ -0,0 +1,110 @@
+"""Suivi des émargements : débit et résorption calculés jusqu'à l'heure courante"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from checkin import CheckinTail
+
+HEADER = "DOSSARD;PARCOURS;EMARGEMENT;DATE EMARGEMENT\n"
+START = datetime(2024, 11, 10, 8, 0)
+
+
+def _write(path, checked_in, pending=0):
+    """`checked_in` émargements sur le 21K, un par minute à partir de START, et `pending` coureurs à venir"""
+    lines = [HEADER]
+    for i in range(checked_in):
+        lines.append(f"{i};EARLY TICKET - 21km;OUI;{START + timedelta(minutes=i):%Y-%m-%d %H:%M:%S}\n")
+    for i in range(checked_in, checked_in + pending):
+        lines.append(f"{i};EARLY TICKET - 21km;NON;\n")
+    path.write_text("".join(lines), encoding='utf-8')
+
+
+def test_rate_during_arrivals(tmp_path):
+    path = tmp_path / "export.csv"
+    _write(path, checked_in=30, pending=60)
+    tail = CheckinTail(path)
+    tail.refresh()
+
+    summary = tail.summary(rate_window=15, now=START + timedelta(minutes=29))
+    assert summary['debit_min'][0] == 1.0
+    assert summary['resorption_min'][0] == 60.0
+
+
+def test_pause_in_arrivals_lowers_rate(tmp_path):
+    path = tmp_path / "export.csv"
+    _write(path, checked_in=30, pending=60)
+    tail = CheckinTail(path)
+    tail.refresh()
+
+    # Dix minutes sans émargement : seules 5 des 15 dernières minutes en comptent
+    summary = tail.summary(rate_window=15, now=START + timedelta(minutes=39))
+    assert summary['debit_min'][0] == 5 / 15
+    assert summary['resorption_min'][0] == 60 / (5 / 15)
+
+    # Pause plus longue que la fenêtre : plus de débit, résorption inconnue
+    summary = tail.summary(rate_window=15, now=START + timedelta(hours=2))
+    assert summary['debit_min'][0] == 0
+    assert np.isinf(summary['resorption_min'][0])
+    assert tail.last_checkin() == START + timedelta(minutes=29)
+
+
+def test_arrivals_after_pause(tmp_path):
+    path = tmp_path / "export.csv"
+    _write(path, checked_in=30, pending=60)
+    tail = CheckinTail(path)
+    tail.refresh()
+    tail.summary(now=START + timedelta(hours=2))
+
+    # Nouveaux émargements après la pause : comptés dans la fenêtre suivante
+    later = START + timedelta(hours=2, minutes=1)
+    with open(path, 'a', encoding='utf-8') as f:
+        for i in range(3):
+            f.write(f"{100 + i};EARLY TICKET - 21km;OUI;{later:%Y-%m-%d %H:%M:%S}\n")
+    tail.refresh()
+
+    summary = tail.summary(rate_window=15, now=later)
+    assert summary['emarges'][0] == 33
+    assert summary['debit_min'][0] == 3 / 15
+
+    times, counts = tail.per_minute(10, now=later)
+    assert times[-1] == later
+    assert counts[0].tolist() == [0] * 9 + [3]
+
+
+def test_rewrite_in_place_is_reread(tmp_path):
+    path = tmp_path / "export.csv"
+    _write(path, checked_in=30, pending=60)
+    tail = CheckinTail(path)
+    tail.refresh()
+
+    # Nouvel export complet écrit dans le même fichier, plus long que le précédent
+    lines = [HEADER] + [
+        f"{1000 + i};EARLY TICKET - 10km;{'OUI' if i < 5 else 'NON'};"
+        f"{START + timedelta(minutes=i):%Y-%m-%d %H:%M:%S}\n"
+        for i in range(120)
+    ]
+    with open(path, 'r+', encoding='utf-8') as f:
+        f.write("".join(lines))
+    tail.refresh()
+
+    summary = tail.summary(now=START + timedelta(minutes=10))
+    assert list(summary['parcours']) == ['10K']
+    assert summary['inscrits'][0] == 120
+    assert summary['emarges'][0] == 5
+
+
+def test_unterminated_line_waits_for_newline(tmp_path):
+    path = tmp_path / "export.csv"
+    _write(path, checked_in=2)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(f"2;EARLY TICKET - 21km;OUI;{START:%Y-%m}")
+    tail = CheckinTail(path)
+    tail.refresh()
+    tail.refresh()
+    assert tail.summary(now=START)['emarges'][0] == 2
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(f"-{START:%d} 08:05:00\n")
+    tail.refresh()
+    assert tail.summary(now=START)['emarges'][0] == 3
+    assert tail.last_checkin() == START + timedelta(minutes=5)
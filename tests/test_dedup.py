@@ -0,0 +1,95 @@
+"""Index des coureurs : prolongement incrémental sans modifier la version précédente"""
+import numpy as np
+import pandas as pd
+
+from dedup import RunnerIndex, row_hashes
+
+
+def _registrations(rows):
+    return pd.DataFrame(rows, columns=['NOM', 'PRENOM', 'DATE DE NAISSANCE', 'EMAIL'])
+
+
+FIRST = [
+    ('Dupont', 'Marie', '1990-01-02', 'marie@example.com'),
+    ('Martin', 'Paul', '1985-05-06', 'paul@example.com'),
+    ('DUPONT', 'Marie', '1990-01-02', 'autre@example.com'),
+]
+ADDED = [
+    # Même email et prénom que Paul : rattachée à son coureur
+    ('Martin-Durand', 'Paul', '1985-05-07', 'paul@example.com'),
+    ('Bernard', 'Léa', '2000-03-04', 'lea@example.com'),
+]
+
+
+def test_build_extends_previous_index():
+    previous = RunnerIndex.build(_registrations(FIRST))
+    index = RunnerIndex.build(_registrations(FIRST + ADDED), previous)
+
+    ids = index.runner_ids()
+    assert ids[0] == ids[2]
+    assert ids[1] == ids[3]
+    assert len(set(ids)) == 3
+
+
+def test_build_leaves_previous_index_unchanged():
+    previous = RunnerIndex.build(_registrations(FIRST))
+    ids = previous.runner_ids().copy()
+    tables = [table.to_dict() for table in previous.key_runner]
+    probes = previous.probe_rows.copy(), previous.probe_hashes.copy()
+
+    index = RunnerIndex.build(_registrations(FIRST + ADDED), previous)
+
+    assert index is not previous
+    assert len(previous) == len(FIRST)
+    assert np.array_equal(previous.runner_ids(), ids)
+    assert [table.to_dict() for table in previous.key_runner] == tables
+    assert np.array_equal(previous.probe_rows, probes[0])
+    assert np.array_equal(previous.probe_hashes, probes[1])
+
+
+def test_build_hashes_only_new_rows(monkeypatch):
+    import dedup
+
+    previous = RunnerIndex.build(_registrations(FIRST))
+    hashed = []
+
+    def counting_hashes(df):
+        hashed.append(len(df))
+        return row_hashes(df)
+
+    monkeypatch.setattr(dedup, 'row_hashes', counting_hashes)
+    index = RunnerIndex.build(_registrations(FIRST + ADDED), previous)
+
+    # Échantillon de vérification (3 témoins) puis témoins des 2 nouvelles lignes
+    assert hashed == [3, 2]
+    assert index.probe_rows.tolist() == [0, 1, 2, 3, 4]
+    assert np.array_equal(index.probe_hashes, row_hashes(_registrations(FIRST + ADDED)))
+
+
+def test_build_rebuilds_when_prefix_changed():
+    previous = RunnerIndex.build(_registrations(FIRST))
+    changed = [('Durand', 'Marie', '1990-01-02', 'marie@example.com')] + FIRST[1:]
+
+    assert not previous.matches_prefix(_registrations(changed + ADDED))
+    index = RunnerIndex.build(_registrations(changed + ADDED), previous)
+    assert len(set(index.runner_ids())) == 4
+
+
+def test_extend_in_batches_matches_single_build():
+    # Identités et emails tirés parmi peu de valeurs : nombreux coureurs réunis d'un lot à l'autre
+    rng = np.random.default_rng(0)
+    n = 400
+    df = _registrations({
+        'NOM': rng.choice(['Dupont', 'Martin', 'Bernard', 'Petit'], n),
+        'PRENOM': rng.choice(['Marie', 'Paul', 'Léa'], n),
+        'DATE DE NAISSANCE': rng.choice(pd.date_range('1980-01-01', periods=40).astype(str), n),
+        'EMAIL': rng.choice([f'c{i}@example.com' for i in range(60)], n),
+    })
+    index = RunnerIndex.build(df.iloc[:100])
+    for start in range(100, n, 30):
+        index = index.copy()
+        index.extend(df.iloc[start:start + 30])
+
+    expected = RunnerIndex.build(df).runner_ids()
+    assert len(index) == n
+    assert np.array_equal(pd.factorize(index.runner_ids())[0], pd.factorize(expected)[0])
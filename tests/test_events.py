@@ -0,0 +1,121 @@
+"""Micro-lots d'inscriptions : version publiée inchangée, calculs sur l'historique complétés des seules lignes ajoutées"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from data import load_dataset
+from data_watcher import DataWatcher
+from events import EventIngestor, QueueSource, apply_events, event_keys, events_frame, live_version, raw_columns, split_version
+from impact import ImpactPrecompute, compute_impact
+from query import QueryEngine
+from synthetic_data import make_registrations, write_dataset
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    insta_path, reg_path = write_dataset(tmp_path_factory.mktemp('data'), n_registrations=2000, n_posts=50)
+    return load_dataset(insta_path, reg_path)
+
+
+@pytest.fixture(scope='module')
+def batch(dataset):
+    df = make_registrations(300, seed=1)
+    df['REF'] = 900000 + np.arange(len(df))
+    return events_frame(df.to_dict('records'), raw_columns(dataset.reg))
+
+
+def test_version_roundtrip():
+    assert split_version(live_version("abc", 12)) == ("abc", 12)
+    assert split_version("abc") == ("abc", 0)
+
+
+def test_event_keys_are_canonical():
+    keys = event_keys(pd.Series([900000.0, np.nan, ' 900001 ', 'AB-12', '']))
+    assert keys.tolist()[0] == '900000'
+    assert keys.tolist()[2:4] == ['900001', 'AB-12']
+    assert keys.isna().tolist() == [False, True, False, False, True]
+
+
+def test_ingestor_skips_events_known_by_ref(tmp_path):
+    insta_path, reg_path = write_dataset(tmp_path, n_registrations=200, n_posts=20)
+    watcher = DataWatcher((insta_path, reg_path), lambda: load_dataset(insta_path, reg_path))
+    watcher.reload()
+    source = QueueSource()
+    ingestor = EventIngestor(watcher, source)
+
+    # Une REF manquante : colonne REF en flottants dans le lot
+    new = make_registrations(3, seed=3)
+    new['REF'] = [900000, np.nan, 900002]
+    for event in new.to_dict('records') + new.iloc[[0]].to_dict('records'):
+        source.queue.put(event)
+    assert ingestor.tick()
+    # Inscription reçue deux fois : appliquée une seule fois
+    assert split_version(watcher.current().version)[1] == 3
+
+    # Export suivant : contient deux des inscriptions reçues (REF entières)
+    export = pd.read_csv(reg_path, sep=';')
+    pd.concat([export, new.iloc[[0, 2]].astype({'REF': 'int64'})], ignore_index=True).to_csv(reg_path, sep=';', index=False)
+    watcher.reload()
+    assert ingestor.tick()
+
+    # Seule l'inscription sans REF est réappliquée
+    assert split_version(watcher.current().version)[1] == 1
+    assert len(watcher.current().data.reg) == len(export) + 3
+
+
+def test_apply_events_leaves_published_dataset_unchanged(dataset, batch):
+    ids = dataset.runners.runner_ids().copy()
+    rows = len(dataset.reg)
+
+    extended = apply_events(dataset, batch)
+
+    assert extended.runners is not dataset.runners
+    assert len(dataset.runners) == rows
+    assert np.array_equal(dataset.runners.runner_ids(), ids)
+    assert len(extended.reg) == rows + len(batch)
+    assert len(extended.runners) == len(extended.reg)
+    assert np.array_equal(extended.reg['runner_id'].to_numpy()[:rows], ids)
+
+
+def test_impact_grid_completed_with_added_rows(dataset, batch):
+    precompute = ImpactPrecompute(workers=1)
+    precompute.warm("export", dataset.insta, dataset.reg)
+    extended = apply_events(dataset, batch)
+    added = extended.reg['timestamp'].iloc[len(dataset.reg):]
+
+    df_impact = precompute.get("export", None, "Tous", (0, 24), added=added)
+
+    expected = compute_impact(dataset.insta, extended.reg['timestamp'], 0, 24)
+    pd.testing.assert_frame_equal(df_impact, expected, check_dtype=False)
+
+
+def test_query_codes_extend_export_codes(dataset, batch):
+    extended = apply_events(dataset, batch)
+    version = live_version("export", len(batch))
+    engine = QueryEngine()
+    engine.run("export", "Inscriptions", dataset.reg, dataset.reg, None, 'count', ('parcours', 'is_paid'))
+
+    result = engine.run(
+        version, "Inscriptions", extended.reg, extended.reg, None, 'count', ('parcours', 'is_paid'),
+        base=("export", len(dataset.reg))
+    )
+
+    expected = QueryEngine().run(version, "Inscriptions", extended.reg, extended.reg, None, 'count', ('parcours', 'is_paid'))
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_jsonl_source_caps_batches(tmp_path, monkeypatch):
+    import events
+
+    monkeypatch.setattr(events, 'MAX_BATCH_EVENTS', 2)
+    path = tmp_path / 'events.jsonl'
+    path.write_text(''.join(f'{{"REF": {i}}}\n' for i in range(3)) + '{"REF": 3')
+    source = events.JsonlSource(path)
+
+    assert [e['REF'] for e in source.poll()] == [0, 1]
+    # Reste du fichier au lot suivant, ligne incomplète en attente de sa fin
+    assert [e['REF'] for e in source.poll()] == [2]
+    assert source.poll() == []
+    with open(path, 'a') as f:
+        f.write('}\n')
+    assert [e['REF'] for e in source.poll()] == [3]
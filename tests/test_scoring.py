@@ -0,0 +1,33 @@
+"""Classement des posts : format déduit de la durée des Reels et du nombre d'images des carrousels"""
+import numpy as np
+import pandas as pd
+
+from scoring import post_format, score_posts
+
+
+def test_post_format_buckets():
+    types = ['Reels', 'Reels', 'Reels', 'Carrousel', 'Carrousel', 'Photo']
+    durations = [15, 16, np.nan, np.nan, np.nan, np.nan]
+    images = [np.nan, np.nan, np.nan, 3, 12, np.nan]
+
+    assert post_format(types, durations, images).tolist() == [
+        "Reel ≤ 15 s", "Reel 16-30 s", "Reels", "Carrousel 2-3 images", "Carrousel 7+ images", "Photo"
+    ]
+
+
+def test_scores_compare_within_format():
+    df_insta = pd.DataFrame({
+        'timestamp': pd.date_range('2024-10-01', periods=4, freq='D'),
+        'Type': ['Reels', 'Reels', 'Reels', 'Photo'],
+        'Titre': ['A', 'B', 'C', 'D'],
+        'Durée (Reels)': ['00.10', '00.12', '01.30', None],
+        'Nb Image (Carrousel)': [np.nan] * 4,
+        'Vues': [1000, 1000, 1000, 1000],
+        'Nb Interaction': [10, 20, 90, 5],
+    })
+    table = score_posts(df_insta, [1, 2, 3, 4])
+
+    assert table['format'].tolist() == ["Reel ≤ 15 s", "Reel ≤ 15 s", "Reel > 60 s", "Photo"]
+    # Seul Reel de plus d'une minute : premier de son format
+    assert table.loc[2, 'rang_taux_engagement_format'] == 100
+    assert table.loc[0, 'rang_taux_engagement_format'] == 50
@@ -0,0 +1,26 @@
+"""Données partagées : colonnes texte variées relues depuis les fichiers projetés, sans libellés par processus"""
+import json
+
+import pandas as pd
+
+from data import load_dataset
+from shared_store import MAX_CATEGORY_LABELS, read_dataset, write_dataset
+from synthetic_data import write_dataset as write_csv
+
+
+def test_text_columns_roundtrip(tmp_path):
+    insta_path, reg_path = write_csv(tmp_path / 'csv', n_registrations=MAX_CATEGORY_LABELS * 2, n_posts=20)
+    dataset = load_dataset(insta_path, reg_path)
+    write_dataset(dataset, tmp_path / 'store')
+
+    manifest = json.loads((tmp_path / 'store' / 'manifest.json').read_text(encoding='utf-8'))
+    kinds = {entry['name']: entry['kind'] for entry in manifest['frames']['reg']}
+    assert kinds['EMAIL'] == 'text'
+    assert kinds['PARCOURS'] == 'category'
+
+    shared = read_dataset(tmp_path / 'store')
+    assert shared.reg['EMAIL'].dtype == dataset.reg['EMAIL'].dtype
+    for column in ('EMAIL', 'DATE EMARGEMENT', 'PARCOURS'):
+        expected = dataset.reg[column].astype(object).where(dataset.reg[column].notna(), None)
+        actual = shared.reg[column].astype(object).where(shared.reg[column].notna(), None)
+        pd.testing.assert_series_equal(actual, expected, check_names=False)
@@ -0,0 +1,142 @@
+"""Dimensions temporelles dérivées, périodes calendaires et grilles jour × heure
+
+Les dimensions (jour de la semaine, heure, jour, semaine ISO, mois, jours
+avant la course) sont calculées une fois au chargement sous forme d'entiers.
+Les courbes d'évolution et les grilles 7 × 24 se calculent ensuite en un
+seul `bincount`, quelle que soit la taille des données.
+"""
+import numpy as np
+import pandas as pd
+
+JOURS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+HEURES = [f"{h:02d}h" for h in range(24)]
+
+TIME_DIMENSIONS = {
+    'jour_semaine': 'Jour de la semaine',
+    'heure': 'Heure',
+    'semaine_iso': 'Semaine ISO',
+    'mois': 'Mois',
+}
+
+# Compte à rebours inconnu (jour de course ou date manquants)
+NO_COUNTDOWN = np.iinfo(np.int32).min
+
+# Posts minimum dans un créneau pour figurer au classement
+MIN_POSTS_PER_SLOT = 2
+
+
+def add_time_dimensions(df, timestamp_column='timestamp', known_hour=None):
+    """Ajoute les codes de jour de la semaine, d'heure et de période
+
+    jour_semaine (0 = lundi) et heure (int8) ; jour (jours depuis le
+    1er janvier 1970), semaine_iso (semaines depuis le lundi 29/12/1969) et
+    mois (année × 12 + mois - 1) en int32 : des codes croissants et contigus,
+    qui distinguent les années. `known_hour` : masque des lignes dont l'heure
+    est connue ; les autres reçoivent l'heure -1 et sont exclues des grilles
+    horaires. Code -1 également pour les dates manquantes.
+    """
+    ts = pd.to_datetime(df[timestamp_column])
+    valid = ts.notna().to_numpy()
+    day = np.where(valid, ts.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64), -1)
+
+    def codes(values, dtype):
+        return np.where(valid, values, -1).astype(dtype)
+
+    hour = codes(ts.dt.hour.fillna(-1).to_numpy(), np.int8)
+    if known_hour is not None:
+        hour = np.where(np.asarray(known_hour), hour, -1).astype(np.int8)
+
+    month = ts.dt.year.fillna(0).to_numpy() * 12 + ts.dt.month.fillna(1).to_numpy() - 1
+    df['jour_semaine'] = codes((day + 3) % 7, np.int8)
+    df['heure'] = hour
+    df['jour'] = codes(day, np.int32)
+    df['semaine_iso'] = codes((day + 3) // 7, np.int32)
+    df['mois'] = codes(month, np.int32)
+
+
+def day_code(day):
+    """Code jour (jours depuis le 1er janvier 1970) d'une date"""
+    return int(np.datetime64(pd.Timestamp(day).date(), 'D').astype(np.int64))
+
+
+def add_race_countdown(df, race_day):
+    """Ajoute jours_avant_course (int32, négatif après la course, NO_COUNTDOWN si inconnu)"""
+    if race_day is None:
+        df['jours_avant_course'] = np.full(len(df), NO_COUNTDOWN, dtype=np.int32)
+        return
+    race = day_code(race_day)
+    day = df['jour'].to_numpy()
+    df['jours_avant_course'] = np.where(day >= 0, race - day, NO_COUNTDOWN).astype(np.int32)
+
+
+def time_labels(dimension, codes):
+    """Libellés lisibles des codes d'une dimension temporelle"""
+    codes = pd.Series(np.asarray(codes, dtype=np.int64))
+    if dimension == 'jour_semaine':
+        return codes.map(dict(enumerate(JOURS)))
+    if dimension == 'heure':
+        return codes.map(dict(enumerate(HEURES)))
+    if dimension == 'jour':
+        return pd.Series(codes.to_numpy().astype('datetime64[D]'))
+    if dimension == 'semaine_iso':
+        iso = pd.Series((codes.to_numpy() * 7 - 3).astype('datetime64[D]')).dt.isocalendar()
+        return iso['year'].astype(str) + '-S' + iso['week'].astype(str).str.zfill(2)
+    if dimension == 'mois':
+        return (codes // 12).astype(str) + '-' + (codes % 12 + 1).astype(str).str.zfill(2)
+    if dimension == 'jours_avant_course':
+        return 'J-' + codes.astype(str)
+    return codes
+
+
+def period_counts(period, series=None, n_series=1, weights=None, missing=-1):
+    """Effectifs (ou sommes de `weights`) par période × série en un seul bincount
+
+    Les périodes sont des codes contigus : toutes celles comprises entre la
+    première et la dernière sont présentes, à zéro si vides. Renvoie
+    (codes des périodes, tableau n_périodes × n_series).
+    """
+    period = np.asarray(period, dtype=np.int64)
+    series = np.zeros(len(period), dtype=np.int64) if series is None else np.asarray(series, dtype=np.int64)
+    valid = (period != missing) & (series >= 0)
+    if not valid.any():
+        return np.zeros(0, dtype=np.int64), np.zeros((0, n_series))
+    period, series = period[valid], series[valid]
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float))[valid]
+    first = period.min()
+    n_periods = int(period.max() - first) + 1
+    counts = np.bincount((period - first) * n_series + series, weights=weights, minlength=n_periods * n_series)
+    return first + np.arange(n_periods), counts.reshape(n_periods, n_series)
+
+
+def weekday_hour_grid(weekday, hour, weights=None):
+    """Grille 7 × 24 (effectifs ou somme de `weights`) en un seul bincount"""
+    weekday = np.asarray(weekday, dtype=np.int64)
+    hour = np.asarray(hour, dtype=np.int64)
+    valid = (weekday >= 0) & (hour >= 0)
+    if weights is not None:
+        weights = np.nan_to_num(np.asarray(weights, dtype=float))[valid]
+    return np.bincount(weekday[valid] * 24 + hour[valid], weights=weights, minlength=7 * 24).reshape(7, 24)
+
+
+def best_slots(reg_grid, post_grid, interaction_grid, top=10, min_posts=MIN_POSTS_PER_SLOT):
+    """Meilleurs créneaux de publication
+
+    Classement par interactions moyennes par post, pour les créneaux ayant au
+    moins `min_posts` posts ; la part des inscriptions du créneau est donnée
+    à titre de comparaison.
+    """
+    total = reg_grid.sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_interactions = np.where(post_grid > 0, interaction_grid / post_grid, np.nan)
+    weekday, hour = np.divmod(np.arange(7 * 24), 24)
+    table = pd.DataFrame({
+        'jour': np.array(JOURS)[weekday],
+        'heure': np.array(HEURES)[hour],
+        'posts': post_grid.ravel().astype(int),
+        'interactions_par_post': mean_interactions.ravel(),
+        'inscriptions': reg_grid.ravel().astype(int),
+        'part_inscriptions': reg_grid.ravel() / total * 100 if total else 0.0,
+    })
+    table = table[table['posts'] >= min_posts]
+    return table.sort_values('interactions_par_post', ascending=False).head(top)